@@ -0,0 +1,208 @@
+"""
+DiffCalculator 热点路径的基准测试, 使用本地生成的合成数据, 结果可复现.
+
+对 DiffCalculatorSP500 和 DiffCalculatorCrypto 在 Daily, Hourly, Minute, Second 四个级别的窗口长度下,
+分别计时 update_time_series, update_diff_and_equation, update_time_series_element (DataFrame 模式和流式模式)
+以及 ols_regression, 并用 tracemalloc 记录峰值内存.
+
+用法 (在仓库根目录运行):
+    python -m src.shared_lib.benchmarks.bench_diff_calculator                  # 与 baseline.json 比较, 回归时返回非0
+    python -m src.shared_lib.benchmarks.bench_diff_calculator --save-baseline  # 重新生成 baseline.json
+    python -m src.shared_lib.benchmarks.bench_diff_calculator --resolutions Daily Hourly
+    RUN_BENCHMARKS=1 python -m pytest src/shared_lib/tests/test_benchmarks.py  # 以测试的方式运行比较
+
+比较的不是绝对耗时: 每次运行先计时一个固定的校准负载 (calibrate), 基线中的耗时按两次校准耗时之比缩放后再比较,
+因此在更快或更慢的机器上运行不会被误报为回归. 峰值内存与机器无关, 直接比较.
+修改了被测代码的性能特征 (有意的取舍) 后, 在一台空闲的机器上用 --save-baseline 重新生成基线并提交 baseline.json,
+校准耗时会一起保存.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500, DiffCalculatorCrypto
+from src.shared_lib.models.enums import ResolutionLevel
+from src.shared_lib.models.time_series import TimeSeries, TimeSeriesElement
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+CALCULATORS = [DiffCalculatorSP500, DiffCalculatorCrypto]
+RESOLUTIONS = [ResolutionLevel.Daily, ResolutionLevel.Hourly, ResolutionLevel.Minute, ResolutionLevel.Second]
+STEPS = {
+    ResolutionLevel.Daily: np.timedelta64(1, 'D'),
+    ResolutionLevel.Hourly: np.timedelta64(1, 'h'),
+    ResolutionLevel.Minute: np.timedelta64(1, 'm'),
+    ResolutionLevel.Second: np.timedelta64(1, 's'),
+}
+SEED = 20240801
+EXTRA_ROWS = 2000  # 窗口之后额外的行数, 保证每个配置都有足够的行产生结果
+DATAFRAME_ELEMENT_UPDATES = 20
+STREAMING_ELEMENT_UPDATES = 2000
+CALIBRATION_KEY = "calibration/diff_calculator"
+CALIBRATION_ROWS = 1_000_000
+
+
+def make_series(resolution: ResolutionLevel, rows: int):
+    """
+    生成两条相关的随机游走, 时间间隔为 resolution 对应的步长.
+    """
+    rng = np.random.default_rng(SEED)
+    date_times = np.datetime64('2020-01-01T00:00:00', 'ns') + np.arange(rows) * STEPS[resolution]
+    series_b = 100.0 + np.cumsum(rng.normal(scale=0.1, size=rows))
+    series_a = 1.3 * series_b + 5.0 + np.cumsum(rng.normal(scale=0.05, size=rows))
+    return TimeSeries.from_numpy(date_times, series_a), TimeSeries.from_numpy(date_times, series_b)
+
+
+def measure(function, repeat: int):
+    """
+    :return: (最快一次的秒数, 峰值内存字节数)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def calibrate(repeat: int) -> float:
+    """
+    计时一个与被测代码无关的固定负载 (numpy 累计和, 排序和 Python 循环), 用于把基线换算到当前机器.
+    :return: 最快一次的秒数
+    """
+    values = np.random.default_rng(SEED).normal(size=CALIBRATION_ROWS)
+
+    def workload():
+        np.cumsum(values)
+        np.sort(values[:CALIBRATION_ROWS // 5])
+        total = 0.0
+        for value in values[:CALIBRATION_ROWS // 10].tolist():
+            total += value * value
+        return total
+
+    seconds, _ = measure(workload, max(repeat, 3))
+    return seconds
+
+
+def bench_configuration(calculator_class, resolution: ResolutionLevel, repeat: int) -> dict:
+    window = calculator_class("A", "B", resolution).FixedWindowLength
+    rows = window + EXTRA_ROWS
+    time_series1, time_series2 = make_series(resolution, rows)
+    seed_rows = rows - STREAMING_ELEMENT_UPDATES
+    results = {}
+
+    def update_time_series():
+        calculator = calculator_class("A", "B", resolution)
+        calculator.update_time_series(time_series1, time_series2)
+
+    calculator = calculator_class("A", "B", resolution)
+    calculator.update_time_series(time_series1, time_series2)
+    results['update_time_series'] = measure(update_time_series, repeat)
+    results['update_diff_and_equation'] = measure(calculator.update_diff_and_equation, repeat)
+
+    elements = [(TimeSeriesElement(elm1.date_time, elm1.value), TimeSeriesElement(elm2.date_time, elm2.value))
+                for elm1, elm2 in zip(time_series1[seed_rows:], time_series2[seed_rows:])]
+
+    def update_time_series_element():
+        calculator = calculator_class("A", "B", resolution)
+        calculator.update_time_series(time_series1[:seed_rows], time_series2[:seed_rows])
+        start = time.perf_counter()
+        for elm1, elm2 in elements[:DATAFRAME_ELEMENT_UPDATES]:
+            calculator.update_time_series_element(elm1, elm2)
+        return (time.perf_counter() - start) / DATAFRAME_ELEMENT_UPDATES
+
+    def update_time_series_element_streaming():
+        calculator = calculator_class("A", "B", resolution)
+        calculator.update_time_series(time_series1[:seed_rows], time_series2[:seed_rows])
+        calculator.enable_streaming()
+        start = time.perf_counter()
+        for elm1, elm2 in elements:
+            calculator.update_time_series_element(elm1, elm2)
+        return (time.perf_counter() - start) / len(elements)
+
+    # 单元素更新只统计更新本身的每个bar的平均耗时, 不包括准备数据
+    for name, function in (('update_time_series_element', update_time_series_element),
+                           ('update_time_series_element_streaming', update_time_series_element_streaming)):
+        per_bar = min(function() for _ in range(repeat))
+        _, peak = measure(function, 0)
+        results[name] = (per_bar, peak)
+
+    series_a = time_series1.values[-window:]
+    series_b = time_series2.values[-window:]
+    results['ols_regression'] = measure(lambda: calculator.ols_regression(series_a, series_b), repeat)
+
+    return {f"{calculator_class.__name__}/{resolution.name}/{name}": {'seconds': seconds, 'peak_bytes': peak}
+            for name, (seconds, peak) in results.items()}
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float):
+    """
+    基线的耗时先乘以 results 与 baseline 中校准耗时之比 (没有校准数据时为1), 再按 time_tolerance 比较.
+    :return: 回归的描述列表
+    """
+    scale = 1.0
+    if CALIBRATION_KEY in results and CALIBRATION_KEY in baseline:
+        scale = results[CALIBRATION_KEY]['seconds'] / baseline[CALIBRATION_KEY]['seconds']
+    regressions = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None or key == CALIBRATION_KEY:
+            continue
+        # 对很短的耗时留出绝对余量, 避免计时噪声
+        expected_seconds = expected['seconds'] * scale
+        if result['seconds'] > expected_seconds * time_tolerance + 1e-3:
+            regressions.append(f"{key}: {result['seconds']:.6f}s > baseline {expected_seconds:.6f}s "
+                               f"(scaled by {scale:.2f} for this machine)")
+        if result['peak_bytes'] > expected['peak_bytes'] * memory_tolerance + 1024 * 1024:
+            regressions.append(f"{key}: peak {result['peak_bytes']} bytes > baseline {expected['peak_bytes']} bytes")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolutions', nargs='+', default=[resolution.name for resolution in RESOLUTIONS])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--time-tolerance', type=float, default=2.0)
+    parser.add_argument('--memory-tolerance', type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    results = {CALIBRATION_KEY: {'seconds': calibrate(args.repeat), 'peak_bytes': 0}}
+    print(f"{CALIBRATION_KEY:<75} {results[CALIBRATION_KEY]['seconds']:>12.6f}s")
+    for calculator_class in CALCULATORS:
+        for name in args.resolutions:
+            resolution = ResolutionLevel[name]
+            # Second 级别的历史有数百万行, 只跑一次
+            repeat = 1 if resolution == ResolutionLevel.Second else args.repeat
+            configuration = bench_configuration(calculator_class, resolution, repeat)
+            for key, result in configuration.items():
+                print(f"{key:<75} {result['seconds']:>12.6f}s {result['peak_bytes'] / 2 ** 20:>10.1f} MiB")
+            results.update(configuration)
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline first.")
+        return 0
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.time_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+冷启动导入耗时的基准测试: 每个模块在新的解释器进程中用 -X importtime 导入, 取多次中最快的一次,
+并检查导入后没有加载较慢的可选依赖 (statsmodels, yfinance 等只应在需要它们的代码路径中导入).
+
+用法 (在仓库根目录运行):
+    python -m src.shared_lib.benchmarks.bench_import_time                  # 与 baseline.json 比较, 回归时返回非0
+    python -m src.shared_lib.benchmarks.bench_import_time --save-baseline  # 更新 baseline.json 中的导入耗时
+
+基线与机器相关, 更换机器后需要重新生成.
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+REPO_ROOT = Path(__file__).resolve().parents[3]
+MODULES = [
+    'src.shared_lib.bll.diff_calculator',
+    'src.shared_lib.models.time_series',
+    'src.shared_lib.bll.log_service',
+]
+HEAVY_MODULES = ('statsmodels', 'yfinance', 'scipy', 'matplotlib')
+
+_SCRIPT = "import sys, {module}; print(','.join(name for name in {heavy!r} if name in sys.modules))"
+
+
+def measure_import(module: str):
+    """
+    在新进程中导入 module.
+    :return: (累计导入秒数, 被加载的 HEAVY_MODULES 列表)
+    """
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                                _SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+                               cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    # 每行的格式: "import time: self [us] | cumulative | imported package", 取 module 本身那一行
+    for line in reversed(completed.stderr.splitlines()):
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            seconds = int(fields[1]) / 1e6
+            break
+    else:
+        raise ValueError(f"No importtime record for {module}.")
+    loaded = [name for name in completed.stdout.strip().split(',') if name]
+    return seconds, loaded
+
+
+def bench(modules, repeat: int) -> dict:
+    results = {}
+    for module in modules:
+        best, loaded = float('inf'), []
+        for _ in range(repeat):
+            seconds, loaded = measure_import(module)
+            best = min(best, seconds)
+        results[f"import/{module}"] = {'seconds': best, 'heavy_modules': loaded}
+    return results
+
+
+def compare(results: dict, baseline: dict, time_tolerance: float):
+    """
+    :return: 回归的描述列表
+    """
+    regressions = []
+    for key, result in results.items():
+        if result['heavy_modules']:
+            regressions.append(f"{key}: imports {', '.join(result['heavy_modules'])}")
+        expected = baseline.get(key)
+        # 对很短的耗时留出绝对余量, 避免计时噪声
+        if expected is not None and result['seconds'] > expected['seconds'] * time_tolerance + 0.05:
+            regressions.append(f"{key}: {result['seconds']:.3f}s > baseline {expected['seconds']:.3f}s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--time-tolerance', type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    results = bench(args.modules, args.repeat)
+    for key, result in results.items():
+        print(f"{key:<60} {result['seconds']:>8.3f}s {','.join(result['heavy_modules'])}")
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update({key: {'seconds': result['seconds']} for key, result in results.items()})
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = compare(results, baseline, args.time_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+from typing import Dict, Iterable, Iterator, Tuple
+import numpy as np
+from src.shared_lib.bll.regression import rolling_ols, rolling_ols_time, _as_nanoseconds, _duration_nanoseconds
+from src.shared_lib.bll.time_series_loader import DATE_COLUMN, NpyColumnWriter, iter_columns, load_npy
+
+# 超长历史的分块回填: 两个序列从磁盘按块读取并对齐, 块与块之间只携带窗口所需的尾部数据,
+# 结果按块追加写入 .npy 列目录. 内存占用为 O(chunksize + 窗口长度), 与历史总长度无关.
+
+OUTPUT_COLUMNS = ('date_time', 'value_a', 'value_b', 'slope', 'intercept', 'diff')
+
+
+def iter_aligned_chunks(path1, path2, column: str = 'Close', date_column: str = DATE_COLUMN,
+                        chunksize: int = 1_000_000) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    分块读取两个按时间排序的文件 (.csv / .parquet / .npy 列目录), 取共有的时间戳对齐 (同 AlignmentMode.Inner),
+    并去掉任一序列为 NaN 的行.
+    :return: 迭代 (date_times, series_a, series_b); date_times 为 datetime64[ns]
+    """
+    chunks1 = iter_columns(path1, [column], date_column, chunksize)
+    chunks2 = iter_columns(path2, [column], date_column, chunksize)
+    empty_times = np.empty(0, dtype='datetime64[ns]')
+    empty_values = np.empty(0, dtype=np.float64)
+    buffers = [[empty_times, empty_values], [empty_times, empty_values]]
+    exhausted = [False, False]
+    last_seen = [None, None]
+
+    while True:
+        # 两边都至少有一块未对齐的数据, 除非该文件已经读完
+        for side, chunks in enumerate((chunks1, chunks2)):
+            while not exhausted[side] and len(buffers[side][0]) == 0:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted[side] = True
+                    break
+                date_times = chunk[date_column].astype('datetime64[ns]')
+                if len(date_times) == 0:
+                    continue
+                if ((len(date_times) > 1 and np.any(date_times[1:] <= date_times[:-1]))
+                        or (last_seen[side] is not None and date_times[0] <= last_seen[side])):
+                    raise ValueError("date_times must be sorted and unique for chunked alignment.")
+                last_seen[side] = date_times[-1]
+                buffers[side] = [date_times, chunk[column]]
+        if len(buffers[0][0]) == 0 or len(buffers[1][0]) == 0:
+            return
+
+        # 两边都已读到 boundary, 之前(含)的时间戳可以对齐, 之后的留到下一轮
+        boundary = min(buffers[0][0][-1], buffers[1][0][-1])
+        ends = [int(np.searchsorted(date_times, boundary, side='right')) for date_times, _ in buffers]
+        (date_times1, values1), (date_times2, values2) = [(date_times[:end], values[:end])
+                                                          for (date_times, values), end in zip(buffers, ends)]
+        buffers = [[date_times[end:], values[end:]] for (date_times, values), end in zip(buffers, ends)]
+
+        _, index1, index2 = np.intersect1d(date_times1, date_times2, assume_unique=True, return_indices=True)
+        date_times, series_a, series_b = date_times1[index1], values1[index1], values2[index2]
+        valid = np.isfinite(series_a) & np.isfinite(series_b)
+        if valid.any():
+            yield date_times[valid], series_a[valid], series_b[valid]
+
+
+class ChunkedBackfill:
+    """
+    分块滚动OLS: 每块与上一块的尾部拼接后计算, 结果与对整个历史调用 rolling_ols / rolling_ols_time 相同.
+    固定窗口携带最后 window 行; 时间窗口携带最后一个时间戳之前 duration 内的行, 并记住整个历史的起始时间.
+    """
+
+    def __init__(self, window: int = None, duration=None, dtype=np.float64):
+        """
+        :param window: 固定窗口长度, 与 duration 二选一
+        :param duration: 时间窗口长度 (Tick 级别)
+        :param dtype: 尾部数据和输出的存储类型; np.float32 使内存和磁盘占用减半, 计算仍使用 float64
+        """
+        if (window is None) == (duration is None):
+            raise ValueError("Exactly one of window and duration must be given.")
+        if window is not None and window < 2:
+            raise ValueError("window must contain at least two data points for OLS regression.")
+        self.window = window
+        self.duration = None if duration is None else _duration_nanoseconds(duration)
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self.origin = None
+        self._tail = (np.empty(0, dtype=np.int64), np.empty(0, dtype=self.dtype), np.empty(0, dtype=self.dtype))
+
+    def process(self, date_times, series_a, series_b) -> Dict[str, np.ndarray]:
+        """
+        计算一块数据, 时间戳必须晚于之前的所有块.
+        :return: OUTPUT_COLUMNS 对应的数组, 长度与这一块相同
+        """
+        nanoseconds = _as_nanoseconds(date_times)
+        series_a = np.asarray(series_a, dtype=self.dtype)
+        series_b = np.asarray(series_b, dtype=self.dtype)
+        if len(nanoseconds) == 0:
+            return {name: np.empty(0) for name in OUTPUT_COLUMNS}
+        tail_times, tail_a, tail_b = self._tail
+        if len(tail_times) and nanoseconds[0] <= tail_times[-1]:
+            raise ValueError("Chunks must be later than the previous chunk.")
+        if self.origin is None:
+            self.origin = int(nanoseconds[0])
+
+        offset = len(tail_times)
+        all_times = np.concatenate([tail_times, nanoseconds])
+        all_a = np.concatenate([tail_a, series_a]).astype(np.float64)
+        all_b = np.concatenate([tail_b, series_b]).astype(np.float64)
+        if self.duration is not None:
+            slope, intercept = rolling_ols_time(all_a, all_b, all_times.view('datetime64[ns]'),
+                                                np.timedelta64(self.duration, 'ns'),
+                                                origin=np.datetime64(self.origin, 'ns'))
+            keep = int(np.searchsorted(all_times, all_times[-1] - self.duration, side='left'))
+        else:
+            slope, intercept = rolling_ols(all_a, all_b, self.window)
+            keep = max(0, len(all_times) - self.window)
+        slope, intercept = slope[offset:], intercept[offset:]
+        self._tail = (all_times[keep:], np.asarray(all_a[keep:], dtype=self.dtype),
+                      np.asarray(all_b[keep:], dtype=self.dtype))
+        self.rows += len(nanoseconds)
+
+        value_a, value_b = all_a[offset:], all_b[offset:]
+        return {'date_time': nanoseconds.view('datetime64[ns]'), 'value_a': value_a, 'value_b': value_b,
+                'slope': slope, 'intercept': intercept, 'diff': value_a - (slope * value_b + intercept)}
+
+    def run(self, chunks: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]], output_dir) -> Dict[str, np.ndarray]:
+        """
+        处理所有块, 每块的结果立即追加写入 output_dir (NpyColumnWriter).
+        :return: 输出的列 (内存映射), 可以用 load_columns(output_dir, ..., date_column='date_time') 再次读取
+        """
+        dtypes = {name: self.dtype for name in OUTPUT_COLUMNS}
+        dtypes['date_time'] = np.dtype('datetime64[ns]')
+        with NpyColumnWriter(output_dir, dtypes) as writer:
+            for date_times, series_a, series_b in chunks:
+                writer.append(self.process(date_times, series_a, series_b))
+        return load_npy(output_dir, list(OUTPUT_COLUMNS))
+
+
+def backfill(path1, path2, output_dir, window: int = None, duration=None, column: str = 'Close',
+             date_column: str = DATE_COLUMN, chunksize: int = 1_000_000, dtype=np.float64) -> Dict[str, np.ndarray]:
+    """
+    从磁盘分块读取两个序列, 对齐后计算滚动OLS, 结果分块写入 output_dir.
+    参数见 iter_aligned_chunks 和 ChunkedBackfill.
+    """
+    engine = ChunkedBackfill(window, duration, dtype)
+    return engine.run(iter_aligned_chunks(path1, path2, column, date_column, chunksize), output_dir)
@@ -1,11 +1,312 @@
-import yfinance as yf
+import json
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from src.shared_lib.models.enums import ResolutionLevel
+from src.shared_lib.models.time_series import TimeSeries
+from src.shared_lib.bll.time_series_loader import DATE_COLUMN, PRICE_COLUMNS, NpyColumnWriter, load_frame
 
+_YF_INTERVALS = {
+    ResolutionLevel.Minute: '1m',
+    ResolutionLevel.Hourly: '1h',
+    ResolutionLevel.Daily: '1d',
+    ResolutionLevel.Weekly: '1wk',
+    ResolutionLevel.Monthly: '1mo',
+}
 
-def get_data():
-    # 创建股票代码对象
-    apple = yf.Ticker("AAPL")
 
-    # 获取历史数据
-    data = apple.history(period="1d", interval="1m")
+def to_interval(interval: Union[ResolutionLevel, str]) -> str:
+    """
+    ResolutionLevel -> yfinance 风格的 interval 字符串 ('1m', '1h', '1d', ...); 字符串原样返回.
+    """
+    if isinstance(interval, ResolutionLevel):
+        if interval not in _YF_INTERVALS:
+            raise ValueError(f"Unsupported resolution level: {interval}")
+        return _YF_INTERVALS[interval]
+    return interval
 
-    return data
+
+def interval_offset(interval: str):
+    """
+    yfinance 风格的 interval 字符串对应的时间长度: '1m', '1h', '1d', '1wk' 为 Timedelta, '1mo' 为 DateOffset.
+    """
+    match = re.fullmatch(r'(\d+)(m|h|d|wk|mo)', interval)
+    if match is None:
+        raise ValueError(f"Unsupported interval: {interval}")
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == 'mo':
+        return pd.DateOffset(months=count)
+    units = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'wk': 'weeks'}
+    return pd.Timedelta(**{units[unit]: count})
+
+
+def _normalize_frame(df: DataFrame) -> DataFrame:
+    """
+    统一为以无时区的 DateTime 为 index, 只包含 PRICE_COLUMNS 中存在的列, 按时间排序且去重的 DataFrame.
+    """
+    df = df[[column for column in PRICE_COLUMNS if column in df.columns]]
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        # 保留交易所当地时间, 与 tests/data 中的数据一致
+        index = index.tz_localize(None)
+    df = df.set_axis(index.rename('DateTime'), axis=0).astype(np.float64)
+    df = df[~df.index.duplicated(keep='last')]
+    return df.sort_index()
+
+
+def _yfinance():
+    """
+    延迟导入 yfinance: 只有从网络获取数据时才需要, 避免拖慢不访问网络的进程的启动.
+    """
+    try:
+        import yfinance as yf
+    except ImportError as e:
+        raise ImportError("yfinance is required for YFinanceDataProvider: pip install yfinance") from e
+    return yf
+
+
+class IDataProvider(ABC):
+    @abstractmethod
+    def fetch(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> DataFrame:
+        """
+        获取 [start, end) 范围内的K线.
+        :return: 以 DateTime 为 index, 包含 Open, High, Low, Close, Volume 列的 DataFrame
+        """
+        pass
+
+
+class YFinanceDataProvider(IDataProvider):
+    def fetch(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> DataFrame:
+        data = _yfinance().Ticker(symbol).history(start=start, end=end, interval=interval)
+        return _normalize_frame(data)
+
+
+class CsvFileDataProvider(IDataProvider):
+    """
+    从本地目录读取 {symbol}.csv (格式: DateTime,Open,High,Low,Close,Volume), 用于离线运行和测试.
+    """
+
+    def __init__(self, directory: str, cache_dir: str = None):
+        """
+        :param cache_dir: 解析后的列的缓存目录, 见 time_series_loader.load_columns
+        """
+        self.directory = directory
+        self.cache_dir = cache_dir
+
+    def fetch(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> DataFrame:
+        df = _normalize_frame(load_frame(os.path.join(self.directory, f"{symbol}.csv"), cache_dir=self.cache_dir))
+        return df[(df.index >= start) & (df.index < end)]
+
+
+class RateLimiter:
+    """
+    线程安全的令牌桶限流器.
+    """
+
+    def __init__(self, max_requests_per_second: float):
+        self.interval = 1.0 / max_requests_per_second
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class MarketDataCache:
+    """
+    本地的列式缓存: 每个 (symbol, interval) 一个目录, 每列一个 .npy 文件; meta.json 记录已覆盖的连续时间范围 [start, end).
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _entry_dir(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root_dir, re.sub(r'[^A-Za-z0-9._-]', '_', f"{symbol}__{interval}"))
+
+    def coverage(self, symbol: str, interval: str):
+        """
+        :return: 已覆盖的范围 (start, end), 没有缓存时返回 None
+        """
+        path = os.path.join(self._entry_dir(symbol, interval), 'meta.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return pd.Timestamp(meta['start']), pd.Timestamp(meta['end'])
+
+    def missing_ranges(self, symbol: str, interval: str, start: pd.Timestamp, end: pd.Timestamp):
+        """
+        计算 [start, end) 中尚未缓存的部分. 为保持覆盖范围连续, 与已缓存范围之间的空档也会被包含在内.
+        """
+        coverage = self.coverage(symbol, interval)
+        if coverage is None:
+            return [(start, end)]
+        covered_start, covered_end = coverage
+        ranges = []
+        if start < covered_start:
+            ranges.append((start, covered_start))
+        if end > covered_end:
+            ranges.append((covered_end, end))
+        return ranges
+
+    def read(self, symbol: str, interval: str, start: pd.Timestamp = None, end: pd.Timestamp = None) -> DataFrame:
+        entry_dir = self._entry_dir(symbol, interval)
+        if self.coverage(symbol, interval) is None:
+            return DataFrame(columns=PRICE_COLUMNS, index=pd.DatetimeIndex([], name='DateTime'), dtype=np.float64)
+        date_times = np.load(os.path.join(entry_dir, 'DateTime.npy'), mmap_mode='r')
+        lo = 0 if start is None else int(np.searchsorted(date_times, start.to_datetime64().astype('datetime64[ns]')))
+        hi = len(date_times) if end is None else int(np.searchsorted(date_times, end.to_datetime64().astype('datetime64[ns]')))
+        columns = {}
+        for column in PRICE_COLUMNS:
+            path = os.path.join(entry_dir, f"{column}.npy")
+            if os.path.exists(path):
+                columns[column] = np.array(np.load(path, mmap_mode='r')[lo:hi])
+        return DataFrame(columns, index=pd.DatetimeIndex(np.array(date_times[lo:hi]), name='DateTime'))
+
+    def _covered_end(self, df: DataFrame, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> pd.Timestamp:
+        """
+        新获取的 [start, end) 中确实完整的部分的结束时间: 不超过最后一个返回的bar之后一个 interval,
+        也不超过当前时间之前一个 interval (未来的时间段和当前未完成的bar之后需要重新获取).
+        """
+        step = interval_offset(interval)
+        end = min(end, pd.Timestamp.now() - step)
+        if len(df):
+            end = min(end, df.index[-1] + step)
+        else:
+            end = start
+        return max(start, end)
+
+    def merge(self, symbol: str, interval: str, df: DataFrame, start: pd.Timestamp, end: pd.Timestamp):
+        """
+        把新获取的 [start, end) 范围的数据合并进缓存.
+        缓存中 start 之前的行保持不变, 只截断 start 之后的行并追加新数据 (及 end 之后原有的行),
+        在已缓存范围的末尾增量获取时, 写入的数据量只与新的范围有关.
+        """
+        df = _normalize_frame(df)
+        coverage = self.coverage(symbol, interval)
+        if coverage is None:
+            covered = (start, self._covered_end(df, start, end, interval))
+        elif end > coverage[1]:
+            covered = (min(start, coverage[0]), max(coverage[1], self._covered_end(df, start, end, interval)))
+        else:
+            covered = (min(start, coverage[0]), coverage[1])
+
+        entry_dir = self._entry_dir(symbol, interval)
+        meta_path = os.path.join(entry_dir, 'meta.json')
+        lo, tail = 0, None
+        date_times = np.load(os.path.join(entry_dir, f"{DATE_COLUMN}.npy"), mmap_mode='r') if coverage else []
+        resume = len(date_times) > 0
+        if resume:
+            columns = [column for column in PRICE_COLUMNS if os.path.exists(os.path.join(entry_dir, f"{column}.npy"))]
+            lo = int(np.searchsorted(date_times, start.to_datetime64().astype('datetime64[ns]')))
+            hi = max(lo, int(np.searchsorted(date_times, end.to_datetime64().astype('datetime64[ns]'))))
+            if hi < len(date_times):
+                tail = self.read(symbol, interval, end)
+        del date_times
+        if not resume:
+            columns = list(df.columns)
+            if os.path.isdir(entry_dir):
+                # 之前中途退出或没有数据时留下的列
+                for file_name in os.listdir(entry_dir):
+                    if file_name.endswith('.npy'):
+                        os.remove(os.path.join(entry_dir, file_name))
+        if coverage is not None:
+            # 中途退出时条目不完整, 先删除 meta.json, 下次重新获取
+            os.remove(meta_path)
+        dtypes = {DATE_COLUMN: np.dtype('datetime64[ns]')}
+        dtypes.update({column: np.dtype(np.float64) for column in columns})
+
+        with NpyColumnWriter(entry_dir, dtypes, resume=resume) as writer:
+            writer.truncate(lo)
+            for part in (df, tail):
+                if part is not None and len(part):
+                    arrays = {DATE_COLUMN: part.index.to_numpy(dtype='datetime64[ns]')}
+                    arrays.update({column: part[column].to_numpy(dtype=np.float64) if column in part.columns
+                                   else np.full(len(part), np.nan) for column in columns})
+                    writer.append(arrays)
+        # meta.json 最后写入, 作为该条目完整的标志
+        tmp_path = os.path.join(entry_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'start': covered[0].isoformat(), 'end': covered[1].isoformat()}, f)
+        os.replace(tmp_path, meta_path)
+
+
+class MarketDataService:
+    """
+    多标的行情服务: 可插拔的数据源 + 本地列式缓存 (只增量获取缺失的时间段) + 有界线程池并发获取和限流.
+    """
+
+    def __init__(self, provider: IDataProvider, cache_dir: str = None, max_workers: int = 8,
+                 max_requests_per_second: float = None):
+        """
+        :param provider: 数据源
+        :param cache_dir: 缓存目录, None 表示不缓存
+        :param max_workers: 并发获取的线程数上限
+        :param max_requests_per_second: 对数据源的请求频率上限, None 表示不限流
+        """
+        self.provider = provider
+        self.cache = MarketDataCache(cache_dir) if cache_dir else None
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(max_requests_per_second) if max_requests_per_second else None
+
+    def _fetch(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> DataFrame:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return self.provider.fetch(symbol, start, end, interval)
+
+    def _get_frame(self, symbol: str, start: pd.Timestamp, end: pd.Timestamp, interval: str) -> DataFrame:
+        if self.cache is None:
+            return _normalize_frame(self._fetch(symbol, start, end, interval))
+        for missing_start, missing_end in self.cache.missing_ranges(symbol, interval, start, end):
+            df = self._fetch(symbol, missing_start, missing_end, interval)
+            self.cache.merge(symbol, interval, df, missing_start, missing_end)
+        return self.cache.read(symbol, interval, start, end)
+
+    def get_frames(self, symbols: List[str], start, end, interval: Union[ResolutionLevel, str] = '1d') -> Dict[str, DataFrame]:
+        """
+        并发获取多个标的 [start, end) 范围内的K线.
+        :return: {symbol: DataFrame}
+        """
+        start, end, interval = pd.Timestamp(start), pd.Timestamp(end), to_interval(interval)
+        symbols = list(dict.fromkeys(symbols))
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(symbols)))) as executor:
+            frames = executor.map(lambda symbol: self._get_frame(symbol, start, end, interval), symbols)
+            return dict(zip(symbols, frames))
+
+    def get_history(self, symbols: List[str], start, end, interval: Union[ResolutionLevel, str] = '1d',
+                    column: str = 'Close') -> Dict[str, TimeSeries]:
+        """
+        并发获取多个标的的收盘价序列, 结果可以直接传给 DiffCalculator.update_time_series.
+        :return: {symbol: TimeSeries}
+        """
+        frames = self.get_frames(symbols, start, end, interval)
+        return {symbol: TimeSeries.from_dataframe(df, column) for symbol, df in frames.items()}
+
+
+def get_data(symbol: str = "AAPL", interval: Union[ResolutionLevel, str] = '1m',
+             service: MarketDataService = None) -> DataFrame:
+    """
+    通过 MarketDataService 获取 symbol 最近一个交易日的K线.
+    :param service: 使用的行情服务, None 时使用不缓存的 yfinance 数据源
+    """
+    if service is None:
+        service = MarketDataService(YFinanceDataProvider())
+    # 1分钟K线只能获取最近几天的数据, 向前取一周再保留最后一个交易日
+    end = pd.Timestamp.now().normalize() + pd.Timedelta(days=1)
+    df = service.get_frames([symbol], end - pd.Timedelta(days=7), end, interval)[symbol]
+    if len(df):
+        df = df[df.index.normalize() == df.index[-1].normalize()]
+    return df
@@ -1,71 +1,592 @@
+import atexit
+import json
+import os
+import time
+import weakref
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Dict, List, Union
 import pandas as pd
-import statsmodels.api as sm
 import numpy as np
 from pandas import DataFrame
 from src.shared_lib.models.enums import *
 from src.shared_lib.models.time_series import *
+from src.shared_lib.bll.regression import rolling_ols, rolling_ols_sweep, rolling_ols_time, RollingWindow, TimeWindow, \
+    ols_fit, batch_ols_fit
+from src.shared_lib.bll.metrics import IMetricsSink, InMemoryMetricsSink, StageTimer, NULL_STAGE
+from src.shared_lib.bll.spread_signal import SpreadSignal
+from src.shared_lib.bll.chunked_backfill import ChunkedBackfill, iter_aligned_chunks
+
+# 热点路径的阶段和计数器名称
+STAGE_INGEST = "diff_calculator.ingest"
+STAGE_WINDOW = "diff_calculator.window"
+STAGE_OLS = "diff_calculator.ols"
+STAGE_MUTATION = "diff_calculator.mutation"
+STAGE_SIGNAL = "diff_calculator.signal"
+COUNTER_ROWS = "diff_calculator.rows_processed"
+COUNTER_REFITS = "diff_calculator.refits"
+COUNTER_SIGNAL_REPLAYS = "diff_calculator.signal_replays"
+# Tick 级别流式模式默认保留的行数: 时间窗口内行数的2倍, 再加上这个迟到数据的余量
+TICK_HISTORY_MARGIN = 1024
+# 快照格式的版本, 格式或窗口状态的含义变化时加1, 旧版本的快照在恢复时被拒绝
+SNAPSHOT_VERSION = 1
 
 
 # Assuming TimeSeriesElement and ResolutionLevel are already defined
 
+def format_equation(symbol1: str, symbol2: str, slope: float, intercept: float,
+                    value_a: float = None, value_b: float = None, precision: int = 4) -> str:
+    """
+    统一的 equation 格式: diff = A - (slope * B + intercept).
+    给出 value_a / value_b 时用具体的价格代替标的名称.
+    """
+    a = symbol1 if value_a is None else f"{value_a}"
+    b = symbol2 if value_b is None else f"{value_b}"
+    return f"diff = {a} - ({slope:.{precision}f} * {b} + {intercept:.{precision}f})"
+
+
+def align_time_series(time_series1: TimeSeries, time_series2: TimeSeries,
+                      alignment: Union[AlignmentMode, str] = AlignmentMode.Strict, tolerance=None):
+    """
+    向量化地对齐两个序列.
+    :param time_series1: 第一个序列
+    :param time_series2: 第二个序列
+    :param alignment: AlignmentMode.Strict: 时间戳必须完全一致; AlignmentMode.Inner: 取共有的时间戳;
+                      AlignmentMode.AsOf: 以第一个序列为准, 取第二个序列在该时刻之前(含)的最新值
+    :param tolerance: AsOf 模式下允许的最大时间差, None 表示不限制
+    :return: (date_times, series_a, series_b); Strict 模式下不复制数据
+    """
+    alignment = AlignmentMode(alignment)
+    date_times1, values1 = time_series1.to_numpy()
+    date_times2, values2 = time_series2.to_numpy()
+
+    if alignment == AlignmentMode.Strict:
+        if len(time_series1) != len(time_series2):
+            raise ValueError("time_series1 and time_series2 must have the same number of elements.")
+        mismatch = np.flatnonzero(date_times1 != date_times2)
+        if mismatch.size:
+            raise ValueError(f"Element {mismatch[0]} of time_series1 and time_series2 have different DateTime values.")
+        return date_times1, values1, values2
+
+    date_times1 = date_times1.astype('datetime64[ns]', copy=False)
+    date_times2 = date_times2.astype('datetime64[ns]', copy=False)
+
+    # 非有序的输入先排序, 之后用二分查找对齐
+    if np.any(date_times1[1:] < date_times1[:-1]):
+        order = np.argsort(date_times1, kind='stable')
+        date_times1, values1 = date_times1[order], values1[order]
+    if np.any(date_times2[1:] < date_times2[:-1]):
+        order = np.argsort(date_times2, kind='stable')
+        date_times2, values2 = date_times2[order], values2[order]
+
+    if alignment == AlignmentMode.Inner:
+        index = np.searchsorted(date_times2, date_times1)
+        matched = index < len(date_times2)
+        matched[matched] = date_times2[index[matched]] == date_times1[matched]
+        return date_times1[matched], values1[matched], values2[index[matched]]
+
+    # AlignmentMode.AsOf
+    index = np.searchsorted(date_times2, date_times1, side='right') - 1
+    matched = index >= 0
+    if tolerance is not None:
+        tolerance = pd.Timedelta(tolerance).to_timedelta64()
+        matched[matched] = date_times1[matched] - date_times2[index[matched]] <= tolerance
+    return date_times1[matched], values1[matched], values2[index[matched]]
+
+
+class _StreamingState:
+    """
+    流式模式的状态: 按列存储的可增长数组(容量倍增, 追加均摊O(1)) + 窗口的环形缓冲区
+    (固定长度的 RollingWindow, 或 Tick 级别基于时间的 TimeWindow).
+    DataFrame 只在访问 DiffCalculator.df 时才按需生成.
+    max_history 不为 None 时只保留最后 max_history 行, 列数组的内存不随运行时间增长; 丢弃过旧的行后 truncated 为 True.
+    """
+    COLUMNS = ('value_a', 'value_b', 'slope', 'intercept', 'diff')
+
+    def __init__(self, window: int, capacity: int = 1024, duration=None, max_history: int = None):
+        self.timed = duration is not None
+        self.window = TimeWindow(duration) if self.timed else RollingWindow(window)
+        self.max_history = max_history
+        if max_history is not None:
+            capacity = max(16, 2 * max_history)
+        self.size = 0
+        self.date_time = np.empty(capacity, dtype='datetime64[ns]')
+        self.columns = {name: np.empty(capacity, dtype=np.float64) for name in self.COLUMNS}
+        self.dirty = True
+        self.truncated = False
+
+    @classmethod
+    def from_frame(cls, df: DataFrame, symbol1: str, symbol2: str, window: int, duration=None,
+                   max_history: int = None):
+        state = cls(window, capacity=max(1024, 2 * len(df)), duration=duration, max_history=max_history)
+        if len(df) == 0:
+            return state
+        series_a = df[symbol1].to_numpy(dtype=np.float64)
+        series_b = df[symbol2].to_numpy(dtype=np.float64)
+        if state.timed:
+            state.window.seed(df.index.to_numpy(), series_a, series_b)
+        else:
+            state.window.seed(series_a, series_b)
+
+        # 窗口已经用完整的历史初始化, 列数组只需要保留最后 max_history 行
+        start = 0 if max_history is None else max(0, len(df) - max_history)
+        size = len(df) - start
+        state.date_time[:size] = df.index.to_numpy(dtype='datetime64[ns]')[start:]
+        state.columns['value_a'][:size] = series_a[start:]
+        state.columns['value_b'][:size] = series_b[start:]
+        for name in ('slope', 'intercept', 'diff'):
+            state.columns[name][:size] = df[name].to_numpy(dtype=np.float64)[start:] if name in df.columns else np.nan
+        state.size = size
+        state.truncated = start > 0
+        return state
+
+    @property
+    def last_date_time(self):
+        return self.date_time[self.size - 1] if self.size else None
+
+    def _grow(self):
+        if self.max_history is not None and self.size > self.max_history:
+            # 丢弃最旧的行, 把最后 max_history 行移到数组开头 (每 max_history 次追加一次, 均摊 O(1))
+            start = self.size - self.max_history
+            self.date_time[:self.max_history] = self.date_time[start:self.size]
+            for name in self.COLUMNS:
+                self.columns[name][:self.max_history] = self.columns[name][start:self.size]
+            self.size = self.max_history
+            self.truncated = True
+            return
+        capacity = 2 * len(self.date_time)
+        self.date_time = np.resize(self.date_time, capacity)
+        for name in self.COLUMNS:
+            self.columns[name] = np.resize(self.columns[name], capacity)
+
+    def append(self, date_time, value_a, value_b, slope, intercept, diff):
+        if self.size == len(self.date_time):
+            self._grow()
+        i = self.size
+        self.date_time[i] = date_time
+        columns = self.columns
+        columns['value_a'][i] = value_a
+        columns['value_b'][i] = value_b
+        columns['slope'][i] = slope
+        columns['intercept'][i] = intercept
+        columns['diff'][i] = diff
+        self.size += 1
+        self.dirty = True
+
+    def insert(self, date_time, value_a, value_b) -> int:
+        """
+        按时间顺序插入一行 (迟到的bar), 之后的行后移一位; 新行的 slope, intercept, diff 为 NaN, 由调用方重新计算.
+        :return: 插入的位置
+        """
+        if self.size == len(self.date_time):
+            self._grow()
+        size = self.size
+        i = int(np.searchsorted(self.date_time[:size], date_time, side='left'))
+        self.date_time[i + 1:size + 1] = self.date_time[i:size]
+        self.date_time[i] = date_time
+        for name, column in self.columns.items():
+            column[i + 1:size + 1] = column[i:size]
+            column[i] = np.nan
+        self.columns['value_a'][i] = value_a
+        self.columns['value_b'][i] = value_b
+        self.size += 1
+        self.dirty = True
+        return i
+
+    def to_frame(self, symbol1: str, symbol2: str) -> DataFrame:
+        size = self.size
+        df = DataFrame({
+            symbol1: self.columns['value_a'][:size].copy(),
+            symbol2: self.columns['value_b'][:size].copy(),
+            'slope': self.columns['slope'][:size].copy(),
+            'intercept': self.columns['intercept'][:size].copy(),
+            'diff': self.columns['diff'][:size].copy(),
+        }, index=pd.DatetimeIndex(self.date_time[:size].copy(), name='date_time'))
+        self.dirty = False
+        return df
+
+
+class _Checkpoint:
+    """
+    定期保存快照: 每 every 次流式更新, 或距上次保存超过 interval 秒时保存一次.
+    每次只保存最近的 history 行 (None 表示恢复所需的最少行数), 快照大小不随运行时间增长.
+    """
+    __slots__ = ('path', 'every', 'interval', 'history', 'updates', 'last_time')
+
+    def __init__(self, path: str, every: int = None, interval: float = None, history: int = None):
+        self.path = path
+        self.every = every
+        self.interval = interval
+        self.history = history
+        self.updates = 0
+        self.last_time = time.monotonic()
+
+    def tick(self, calculator):
+        self.updates += 1
+        if ((self.every is not None and self.updates >= self.every)
+                or (self.interval is not None and time.monotonic() - self.last_time >= self.interval)):
+            self.save(calculator)
+
+    def save(self, calculator):
+        history = calculator.minimum_snapshot_history() if self.history is None else self.history
+        calculator.save_snapshot(self.path, history)
+        self.updates = 0
+        self.last_time = time.monotonic()
+
+
+def _split_state(prefix: str, state: dict, arrays: dict) -> dict:
+    """
+    把 get_state() 的结果拆分为数组 (以 prefix 为前缀存入 arrays) 和标量 (返回, 写入快照的 meta).
+    """
+    scalars = {}
+    for name, value in state.items():
+        if isinstance(value, np.ndarray):
+            arrays[f"{prefix}.{name}"] = value
+        else:
+            scalars[name] = value
+    return scalars
+
+
+def _join_state(prefix: str, scalars: dict, arrays) -> dict:
+    state = dict(scalars)
+    state.update({name[len(prefix) + 1:]: arrays[name] for name in arrays.files if name.startswith(prefix + '.')})
+    return state
+
+
+# 进程退出时需要保存检查点的计算器; 弱引用, 没有调用 disable_checkpoints 就被丢弃的计算器仍然可以被回收
+_exit_checkpoints = weakref.WeakSet()
+
+
+@atexit.register
+def _save_exit_checkpoints():
+    for calculator in list(_exit_checkpoints):
+        calculator._save_checkpoint_on_exit()
+
+
+def read_snapshot_meta(path) -> dict:
+    """
+    读取快照的元数据 (不加载数组).
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return json.loads(data['meta'].tobytes().decode('utf-8'))
+
+
 class DiffCalculator(ABC):
+    FIELDS = ('slope', 'intercept', 'diff')
+
     def __init__(self, symbol1: str, symbol2: str, resolution: ResolutionLevel = ResolutionLevel.Daily):
         self.symbol1 = symbol1
         self.symbol2 = symbol2
         self.resolution = resolution
         self.FixedWindowLength = 0
+        # Tick 级别使用基于时间的窗口, 此时 FixedWindowLength 为0
+        self.WindowDuration = None
+        self.max_history = None
+        self._stream = None
+        self.metrics: IMetricsSink = None
+        self.signal: SpreadSignal = None
+        self._timers = None
+        self._checkpoint: _Checkpoint = None
         self.df = DataFrame()
 
-    def update_time_series(self, time_series1: List[TimeSeriesElement], time_series2: List[TimeSeriesElement]):
-        if len(time_series1) != len(time_series2):
-            raise ValueError("time_series1 and time_series2 must have the same number of elements.")
+    @property
+    def df(self) -> DataFrame:
+        """
+        流式模式下, df 是按需生成的视图: 只有在访问时才根据列数组重新构建 DataFrame.
+        """
+        if self._stream is not None and self._stream.dirty:
+            self._df = self._stream.to_frame(self.symbol1, self.symbol2)
+        return self._df
 
-        for i in range(len(time_series1)):
-            if time_series1[i].date_time != time_series2[i].date_time:
-                raise ValueError(f"Element {i} of time_series1 and time_series2 have different DateTime values.")
+    @df.setter
+    def df(self, value: DataFrame):
+        self._df = value
+        if self._stream is not None:
+            # 直接赋值的 DataFrame 优先于流式状态, 直到下一次流式更新
+            self._stream.dirty = False
 
-        # update self.df using self.symbol1 , self.symbol2, and the given parameters
-        df1 = pd.DataFrame({
-            "date_time": [element.date_time for element in time_series1],
-            self.symbol1: [element.value for element in time_series1]
-        })
+    @property
+    def streaming(self) -> bool:
+        return self._stream is not None
+
+    def enable_streaming(self, max_history: int = None):
+        """
+        开启流式模式: 用当前 self.df 初始化列数组和窗口状态, 之后每次 update_time_series_element 的代价为 O(1),
+        与历史长度无关. 流式模式下对 self.df 的直接修改不会被保留.
+        :param max_history: self.df 最多保留的行数; None 表示沿用 self.max_history.
+                            Tick 级别两者都为 None 时使用 default_tick_history(), 内存不随运行时间增长
+        """
+        if max_history is not None:
+            self.max_history = max_history
+        elif self.max_history is None and self.WindowDuration is not None:
+            self.max_history = self.default_tick_history()
+        if self.signal is not None:
+            self.signal.max_history = self.max_history
+        self._stream = _StreamingState.from_frame(self._df, self.symbol1, self.symbol2, self.FixedWindowLength,
+                                                  self.WindowDuration, self.max_history)
+
+    def default_tick_history(self) -> int:
+        """
+        Tick 级别流式模式默认保留的行数: 当前数据最后 WindowDuration 内行数的2倍 (窗口内的迟到bar需要这些行),
+        加上信号的窗口和 TICK_HISTORY_MARGIN.
+        """
+        window_rows = 0
+        if len(self._df):
+            date_times = self._df.index.to_numpy(dtype='datetime64[ns]')
+            cutoff = date_times[-1] - np.timedelta64(self.WindowDuration, 'ns')
+            window_rows = len(date_times) - int(np.searchsorted(date_times, cutoff, side='left'))
+        signal_window = self.signal.window if self.signal is not None else 0
+        return 2 * window_rows + signal_window + TICK_HISTORY_MARGIN
+
+    def disable_streaming(self):
+        """
+        关闭流式模式, self.df 恢复为普通 DataFrame.
+        """
+        if self._stream is not None:
+            df = self.df
+            self._stream = None
+            self._df = df
+
+    def enable_metrics(self, sink: IMetricsSink = None) -> IMetricsSink:
+        """
+        开启热点路径的计时和计数: ingest, window, ols, mutation 四个阶段的延迟直方图, 以及处理的行数和回归次数.
+        :param sink: 指标的接收者, None 时使用新的 InMemoryMetricsSink
+        :return: 使用的 sink
+        """
+        self.metrics = sink if sink is not None else InMemoryMetricsSink()
+        # 每个阶段复用一个计时器, 避免在热点路径上创建对象
+        self._timers = {name: StageTimer(self.metrics, name)
+                        for name in (STAGE_INGEST, STAGE_WINDOW, STAGE_OLS, STAGE_MUTATION, STAGE_SIGNAL)}
+        return self.metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+        self._timers = None
+
+    def enable_signal(self, window: int = None, entry: float = 2.0, exit: float = 0.5, stop: float = None,
+                      on_event=None) -> SpreadSignal:
+        """
+        开启 diff 的 z-score 信号: update_diff_and_equation 时批量计算, update_time_series_element 时每个bar增量更新 (O(1)).
+        参数见 SpreadSignal; window 默认为 self.FixedWindowLength.
+        :return: 使用的 SpreadSignal, 事件在 signal.events 中, 最新的 z-score 为 signal.last_zscore
+        """
+        window = window or self.FixedWindowLength
+        if not window:
+            raise ValueError("window must be given for time-based (Tick) windows.")
+        self.signal = SpreadSignal(window, entry, exit, stop, on_event=on_event, max_history=self.max_history)
+        if 'diff' in self.df.columns:
+            self.signal.run(self.df.index, self.df['diff'].to_numpy(dtype=np.float64))
+        return self.signal
+
+    def disable_signal(self):
+        self.signal = None
+
+    def _snapshot_identity(self) -> dict:
+        """
+        快照必须与计算器一致的部分: 类型, 标的, 级别和窗口.
+        """
+        return {
+            'calculator': type(self).__name__,
+            'symbol1': self.symbol1,
+            'symbol2': self.symbol2,
+            'resolution': self.resolution.value,
+            'window': self.FixedWindowLength,
+            'duration': None if self.WindowDuration is None else int(np.timedelta64(self.WindowDuration, 'ns')
+                                                                       .astype(np.int64)),
+        }
 
-        # Convert time_series2 to DataFrame
-        df2 = pd.DataFrame({
-            "date_time": [element.date_time for element in time_series2],
-            self.symbol2: [element.value for element in time_series2]
+    def save_snapshot(self, path: str, history: int = None):
+        """
+        把流式状态保存为二进制快照 (.npz, 不使用 pickle): 窗口缓冲区和累计量, 最近的行, 信号的状态和元数据.
+        先写临时文件再替换, 中途退出不会留下损坏的快照.
+        :param path: 快照文件
+        :param history: 保存的最近行数, None 表示流式状态中保留的全部行; 至少为窗口长度时, 恢复后可以继续处理迟到的bar
+        """
+        if not self.streaming:
+            raise ValueError("Snapshots require streaming mode, call enable_streaming first.")
+        state = self._stream
+        start = 0 if history is None else max(0, state.size - history)
+        arrays = {'date_time': state.date_time[start:state.size]}
+        arrays.update({name: column[start:state.size] for name, column in state.columns.items()})
+
+        meta = self._snapshot_identity()
+        meta.update({
+            'version': SNAPSHOT_VERSION,
+            'max_history': self.max_history,
+            'rows': state.size - start,
+            'truncated': state.truncated or start > 0,
+            'last_date_time': None if state.last_date_time is None else str(state.last_date_time),
+            'window_state': _split_state('window', state.window.get_state(), arrays),
+            'signal': None,
         })
+        if self.signal is not None:
+            signal = self.signal
+            meta['signal'] = {
+                'entry': signal.entry, 'exit': signal.exit, 'stop': signal.stop, 'ddof': signal.stats.ddof,
+                'window': signal.window, 'position': signal.position, 'stopped': signal.stopped,
+                'last_zscore': None if np.isnan(signal.last_zscore) else signal.last_zscore,
+                'stats_state': _split_state('signal', signal.stats.get_state(), arrays),
+            }
+            # 与保存的行对齐的持仓状态, 恢复后迟到的bar可以只重放受影响的行
+            states = signal.row_states
+            arrays['signal_states'] = states[max(0, len(states) - (state.size - start)):]
+        arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def minimum_snapshot_history(self) -> int:
+        """
+        恢复后继续处理迟到的bar所需的最少行数: 回归窗口 (Tick 级别为当前时间窗口内的行数) 加上信号的窗口, 再加上最新的一行.
+        """
+        if not self.streaming:
+            raise ValueError("Snapshots require streaming mode, call enable_streaming first.")
+        window = len(self._stream.window) if self._stream.timed else self.FixedWindowLength
+        return window + (self.signal.window if self.signal is not None else 0) + 1
+
+    def load_snapshot(self, path: str, on_event=None):
+        """
+        从快照恢复流式状态, 之后可以直接处理下一个bar, 不需要重放历史.
+        版本不是 SNAPSHOT_VERSION, 或类型, 标的, 级别, 窗口与当前计算器不一致的快照被拒绝 (ValueError).
+        :param on_event: 快照中包含信号时, 恢复后的 SpreadSignal 使用的回调
+        """
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+            if meta.get('version') != SNAPSHOT_VERSION:
+                raise ValueError(f"Snapshot version {meta.get('version')} is not supported, "
+                                 f"expected {SNAPSHOT_VERSION}; rebuild the state from history.")
+            identity = self._snapshot_identity()
+            mismatch = [name for name, value in identity.items() if meta.get(name) != value]
+            if mismatch:
+                raise ValueError(f"Snapshot does not match the calculator: {', '.join(mismatch)}.")
+
+            rows = meta['rows']
+            state = _StreamingState(self.FixedWindowLength, capacity=max(1024, 2 * rows),
+                                    duration=self.WindowDuration, max_history=meta['max_history'])
+            state.date_time[:rows] = data['date_time']
+            for name, column in state.columns.items():
+                column[:rows] = data[name]
+            state.size = rows
+            state.truncated = meta['truncated']
+            state.window.set_state(_join_state('window', meta['window_state'], data))
+
+            signal = None
+            if meta['signal'] is not None:
+                config = meta['signal']
+                signal = SpreadSignal(config['window'], config['entry'], config['exit'], config['stop'],
+                                      config['ddof'], on_event=on_event, max_history=meta['max_history'])
+                signal.stats.set_state(_join_state('signal', config['stats_state'], data))
+                signal.position = config['position']
+                signal.stopped = config['stopped']
+                signal.last_zscore = np.nan if config['last_zscore'] is None else config['last_zscore']
+                if 'signal_states' in data.files:
+                    signal.restore_row_states(data['signal_states'])
 
-        # Merge the DataFrames on date_time
-        self.df = pd.merge(df1, df2, on="date_time")
+        self.max_history = meta['max_history']
+        self._stream = state
+        self._df = DataFrame()
+        self.signal = signal
+
+    @classmethod
+    def from_snapshot(cls, path: str, on_event=None) -> 'DiffCalculator':
+        """
+        由快照创建计算器: 用快照中的标的和级别构造 cls, 再恢复状态.
+        """
+        meta = read_snapshot_meta(path)
+        if meta.get('calculator') != cls.__name__:
+            raise ValueError(f"Snapshot was written by {meta.get('calculator')}, not {cls.__name__}.")
+        calculator = cls(meta['symbol1'], meta['symbol2'], ResolutionLevel(meta['resolution']))
+        calculator.load_snapshot(path, on_event)
+        return calculator
+
+    def enable_checkpoints(self, path: str, every: int = None, interval: float = None, on_exit: bool = True,
+                           history: int = None):
+        """
+        流式模式下定期保存快照.
+        :param path: 快照文件
+        :param every: 每 every 次 update_time_series_element 保存一次
+        :param interval: 距上次保存超过 interval 秒后, 在下一次更新时保存
+        :param on_exit: 进程正常退出时 (atexit) 再保存一次
+        :param history: 每个快照保存的最近行数; None 表示 minimum_snapshot_history(), 与历史长度无关
+        """
+        self.disable_checkpoints()
+        self._checkpoint = _Checkpoint(path, every, interval, history)
+        if on_exit:
+            _exit_checkpoints.add(self)
+
+    def disable_checkpoints(self):
+        _exit_checkpoints.discard(self)
+        self._checkpoint = None
+
+    def _save_checkpoint_on_exit(self):
+        if self._checkpoint is not None and self.streaming:
+            self._checkpoint.save(self)
+
+    def _stage(self, name: str):
+        """
+        阶段计时的上下文管理器; 关闭指标时返回共用的空上下文, 不产生计时调用.
+        """
+        return NULL_STAGE if self._timers is None else self._timers[name]
 
-        # Convert the date_time column to datetime from Timestamp
-        self.df["date_time"] = pd.to_datetime(self.df["date_time"], errors='coerce')
+    @staticmethod
+    def _as_time_series(time_series, column: str = None) -> TimeSeries:
+        """
+        把 TimeSeries / (date_times, values) / Series / DataFrame / TimeSeriesElement 列表统一转换为 TimeSeries.
+        DataFrame 依次尝试 column, 'Close' 和唯一的一列作为数值列; 有 'DateTime' 列时用它作为时间列, 否则用 index.
+        """
+        if isinstance(time_series, TimeSeries):
+            return time_series
+        if isinstance(time_series, tuple) and len(time_series) == 2:
+            return TimeSeries.from_numpy(*time_series)
+        if isinstance(time_series, pd.Series):
+            return TimeSeries.from_numpy(time_series.index.to_numpy(), time_series.to_numpy())
+        if isinstance(time_series, DataFrame):
+            if column in time_series.columns:
+                value_column = column
+            elif 'Close' in time_series.columns:
+                value_column = 'Close'
+            elif len(time_series.columns) == 1:
+                value_column = time_series.columns[0]
+            else:
+                raise ValueError(f"Cannot determine the value column of the DataFrame: {list(time_series.columns)}")
+            date_column = 'DateTime' if 'DateTime' in time_series.columns else None
+            return TimeSeries.from_dataframe(time_series, value_column, date_column)
+        return TimeSeries.from_elements(time_series)
 
-        # Drop rows with NaN values in any of the columns
-        self.df = self.df.dropna()
+    def update_time_series(self, time_series1, time_series2,
+                           alignment: Union[AlignmentMode, str] = AlignmentMode.Strict, tolerance=None):
+        """
+        批量导入两个序列, 对齐后重建self.df.
+        :param time_series1: symbol1 的序列, 支持 TimeSeries, (date_times, values), Series, DataFrame 或 TimeSeriesElement 列表
+        :param time_series2: symbol2 的序列, 格式同上
+        :param alignment: 对齐方式, 见 AlignmentMode
+        :param tolerance: AlignmentMode.AsOf 时允许的最大时间差, None 表示不限制
+        """
+        with self._stage(STAGE_INGEST):
+            time_series1 = self._as_time_series(time_series1, self.symbol1)
+            time_series2 = self._as_time_series(time_series2, self.symbol2)
 
-        # Convert the relevant columns to numeric values and find non-numeric rows
-        for symbol in [self.symbol1, self.symbol2]:
-            self.df[symbol] = pd.to_numeric(self.df[symbol], errors='coerce')
+            date_times, series_a, series_b = align_time_series(time_series1, time_series2, alignment, tolerance)
 
-        # Find and print rows with NaN values in self.symbol1 or self.symbol2
-        non_numeric_rows = self.df[self.df[[self.symbol1, self.symbol2]].isna().any(axis=1)]
-        if not non_numeric_rows.empty:
-            print("Rows with non-numeric values:")
-            print(non_numeric_rows)
+            # Drop rows with NaN values in any of the columns; 布尔索引只复制一次数据
+            valid = np.isfinite(series_a) & np.isfinite(series_b) & ~np.isnat(date_times)
+            self.df = DataFrame({
+                self.symbol1: series_a[valid],
+                self.symbol2: series_b[valid]
+            }, index=pd.DatetimeIndex(date_times[valid], name='date_time'), copy=False)
 
-        # Drop rows where self.symbol1 or self.symbol2 contains NaN values
-        self.df = self.df.dropna(subset=[self.symbol1, self.symbol2])
+        if self.metrics is not None:
+            self.metrics.increment(COUNTER_ROWS, len(self._df))
+        if self.signal is not None:
+            self.signal.reset()
 
-        # Set the 'date_time' column as the index
-        self.df.set_index('date_time', inplace=True)
+        if self.streaming:
+            self.enable_streaming()
 
     def update_time_series_element(self, time_series_elm1: TimeSeriesElement, time_series_elm2: TimeSeriesElement):
         """
-        单个元素更新self.df的symbol1, symbol2两列，如果符合条件，更新diff和equation列;
+        单个元素更新self.df的symbol1, symbol2两列，如果符合条件，更新slope, intercept和diff列;
         :param time_series_elm1:
         :param time_series_elm2:
         :return:
@@ -75,99 +596,457 @@ class DiffCalculator(ABC):
         if time_series_elm1.date_time != time_series_elm2.date_time:
             raise ValueError(f"DateTime mismatch: {time_series_elm1.date_time} vs {time_series_elm2.date_time}")
 
-        # 根据输入值插入或者更新self.df
-        # Create a DataFrame for the new element
-        new_row = pd.DataFrame({
-            "date_time": [time_series_elm1.date_time],
-            self.symbol1: [time_series_elm1.value],
-            self.symbol2: [time_series_elm2.value]
-        })
+        if self.metrics is not None:
+            self.metrics.increment(COUNTER_ROWS)
 
-        #  date_time is index,  If date_time already exists in self.df, update the existing row
-        # Set 'date_time' as the index for the new row
-        new_row.set_index('date_time', inplace=True)
+        if self.streaming:
+            self._update_streaming_element(time_series_elm1, time_series_elm2)
+            if self._checkpoint is not None:
+                self._checkpoint.tick(self)
+            return
+
+        # 已有时间戳的修正和迟到的bar: 按时间顺序插入, 只重新计算窗口覆盖该时间戳的行
+        if len(self.df) and (time_series_elm1.date_time in self.df.index
+                             or pd.Timestamp(time_series_elm1.date_time) < self.df.index[-1]):
+            self._update_late_element(time_series_elm1, time_series_elm2)
+            return
+
+        with self._stage(STAGE_MUTATION):
+            # 根据输入值插入或者更新self.df
+            # Create a DataFrame for the new element
+            new_row = pd.DataFrame({
+                "date_time": [time_series_elm1.date_time],
+                self.symbol1: [time_series_elm1.value],
+                self.symbol2: [time_series_elm2.value]
+            })
+
+            #  date_time is index,  If date_time already exists in self.df, update the existing row
+            # Set 'date_time' as the index for the new row
+            new_row.set_index('date_time', inplace=True)
 
-        # Check if the date_time already exists in self.df
-        if time_series_elm1.date_time in self.df.index:
-            # Update the existing row
-            self.df.loc[time_series_elm1.date_time, [self.symbol1, self.symbol2]] = new_row.loc[
-                time_series_elm1.date_time, [self.symbol1, self.symbol2]]
-        else:
             # Append the new row to the DataFrame
             self.df = pd.concat([self.df, new_row])
 
-        # Drop rows with NaN values if any
-        self.df = self.df.dropna()
+            # Drop rows with NaN values if any; slope, intercept, diff 在窗口预热期内本来就是NaN, 不参与判断
+            self.df = self.df.dropna(subset=[self.symbol1, self.symbol2])
 
-        # 如果self.df中time_series_elm1.date_time之前的记录数 >= self.FixedWindowLength，计算并更新diff和equation列;
+        # 如果self.df中time_series_elm1.date_time之前的记录数 >= self.FixedWindowLength，计算并更新slope, intercept和diff列;
         if ('diff' not in self.df.columns
-                or 'equation' not in self.df.columns
                 or time_series_elm1.date_time not in self.df.index
-                or pd.isna(self.df.at[time_series_elm1.date_time, 'diff'])
-                or pd.isna(self.df.at[time_series_elm1.date_time, 'equation'])):
-            if len(self.df[self.df.index < time_series_elm1.date_time]) >= self.FixedWindowLength:
+                or pd.isna(self.df.at[time_series_elm1.date_time, 'diff'])):
+            with self._stage(STAGE_WINDOW):
                 # Extract the relevant series for the calculation
                 relevant_df = self.df[self.df.index < time_series_elm1.date_time]
-                series_a = relevant_df[self.symbol1].iloc[-self.FixedWindowLength:]
-                series_b = relevant_df[self.symbol2].iloc[-self.FixedWindowLength:]
+                if self.WindowDuration is not None:
+                    # Tick 级别: 窗口为 [date_time - WindowDuration, date_time), 需要历史完整覆盖该时间段
+                    window_start = pd.Timestamp(time_series_elm1.date_time) - pd.Timedelta(self.WindowDuration)
+                    ready = len(relevant_df) > 0 and relevant_df.index[0] <= window_start
+                    relevant_df = relevant_df[relevant_df.index >= window_start]
+                    ready = ready and len(relevant_df) >= 2
+                else:
+                    ready = len(relevant_df) >= self.FixedWindowLength
+                    relevant_df = relevant_df.iloc[-self.FixedWindowLength:]
+            if ready:
+                series_a = relevant_df[self.symbol1]
+                series_b = relevant_df[self.symbol2]
 
-                # Perform OLS regression and update diff and equation
-                ols_result = self.ols_regression(series_a.values, series_b.values)
+                # Perform OLS regression and update slope, intercept and diff
+                with self._stage(STAGE_OLS):
+                    ols_result = self.ols_regression(series_a.values, series_b.values)
                 slope = ols_result["slope"]
                 intercept = ols_result["intercept"]
+                if self.metrics is not None:
+                    self.metrics.increment(COUNTER_REFITS)
 
                 # Calculate the diff for the current date_time
                 last_value_a = time_series_elm1.value
                 last_value_b = time_series_elm2.value
                 calculated_diff = last_value_a - (slope * last_value_b + intercept)
 
-                # Update diff and equation columns
-                self.df.at[time_series_elm1.date_time, 'diff'] = calculated_diff
-                self.df.at[time_series_elm1.date_time, 'equation'] = f"diff = {self.symbol1} - ({slope:.4f} * {self.symbol2} + {intercept:.4f})"
+                # Update slope, intercept and diff columns
+                with self._stage(STAGE_MUTATION):
+                    self.df.at[time_series_elm1.date_time, 'slope'] = slope
+                    self.df.at[time_series_elm1.date_time, 'intercept'] = intercept
+                    self.df.at[time_series_elm1.date_time, 'diff'] = calculated_diff
+
+        if self.signal is not None and len(self.df) and self.df.index[-1] == time_series_elm1.date_time:
+            diff = self.df.at[time_series_elm1.date_time, 'diff'] if 'diff' in self.df.columns else np.nan
+            with self._stage(STAGE_SIGNAL):
+                self.signal.update(time_series_elm1.date_time, float(diff))
+
+    def _affected_rows(self, date_times: np.ndarray, position: int, date_time, origins=()) -> int:
+        """
+        时间戳 date_time (位于 position) 被插入, 修正或删除后, 窗口覆盖它的行为 [position, end).
+        :param origins: 修改前后数据的起始时间; 不同时 (Tick 级别) 窗口是否被完整覆盖也会变化
+        :return: end
+        """
+        if self.WindowDuration is None:
+            return min(len(date_times), position + self.FixedWindowLength + 1)
+        duration = np.timedelta64(self.WindowDuration, 'ns')
+        end = int(np.searchsorted(date_times, date_time + duration, side='right'))
+        if len(origins) and min(origins) != max(origins):
+            end = max(end, int(np.searchsorted(date_times, max(origins) + duration, side='right')))
+        return end
+
+    def _refit_rows(self, date_times: np.ndarray, series_a: np.ndarray, series_b: np.ndarray, start: int, end: int,
+                    origin=None):
+        """
+        重新计算第 [start, end) 行的 slope 和 intercept, 只读取这些行的窗口所需的数据, 代价与窗口长度成正比.
+        :param origin: 整个历史的起始时间 (Tick 级别), None 表示 date_times[0]
+        :return: (slope, intercept)
+        """
+        if self.WindowDuration is not None:
+            duration = np.timedelta64(self.WindowDuration, 'ns')
+            offset = int(np.searchsorted(date_times, date_times[start] - duration, side='left'))
+            slope, intercept = rolling_ols_time(series_a[offset:end], series_b[offset:end], date_times[offset:end],
+                                                duration, origin=date_times[0] if origin is None else origin)
+        else:
+            offset = max(0, start - self.FixedWindowLength)
+            slope, intercept = rolling_ols(series_a[offset:end], series_b[offset:end], self.FixedWindowLength)
+        if self.metrics is not None:
+            self.metrics.increment(COUNTER_REFITS, int(np.isfinite(intercept[start - offset:]).sum()))
+        return slope[start - offset:], intercept[start - offset:]
+
+    def _update_late_element(self, time_series_elm1: TimeSeriesElement, time_series_elm2: TimeSeriesElement):
+        """
+        DataFrame 模式下修正已有的bar或插入迟到的bar (值为 NaN 时删除该bar), 保持 self.df 按时间排序,
+        只重新计算窗口覆盖该时间戳的行: 固定窗口为之后的 FixedWindowLength 行, Tick 级别为之后 WindowDuration 内的行.
+        """
+        date_time = pd.Timestamp(time_series_elm1.date_time)
+        value_a = float(time_series_elm1.value)
+        value_b = float(time_series_elm2.value)
+        valid = not (np.isnan(value_a) or np.isnan(value_b))
+
+        with self._stage(STAGE_MUTATION):
+            df = self.df
+            old_origin = df.index[0]
+            exists = date_time in df.index
+            if exists and valid:
+                df.loc[date_time, [self.symbol1, self.symbol2]] = [value_a, value_b]
+            elif exists:
+                df = df.drop(index=date_time)
+            elif valid:
+                position = df.index.searchsorted(date_time)
+                new_row = DataFrame({self.symbol1: [value_a], self.symbol2: [value_b]},
+                                    index=pd.DatetimeIndex([date_time], name=df.index.name))
+                df = pd.concat([df.iloc[:position], new_row, df.iloc[position:]])
+            else:
+                return
+            for name in self.FIELDS:
+                if name not in df.columns:
+                    df[name] = np.nan
+            self.df = df
+        if len(df) == 0:
+            return
+
+        with self._stage(STAGE_WINDOW):
+            date_times = df.index.to_numpy(dtype='datetime64[ns]')
+            series_a = df[self.symbol1].to_numpy(dtype=np.float64)
+            series_b = df[self.symbol2].to_numpy(dtype=np.float64)
+            start = int(np.searchsorted(date_times, date_time.to_datetime64(), side='left'))
+            end = self._affected_rows(date_times, start, date_time.to_datetime64(),
+                                      (old_origin.to_datetime64(), date_times[0]))
+        if start < end:
+            with self._stage(STAGE_OLS):
+                slope, intercept = self._refit_rows(date_times, series_a, series_b, start, end)
+            with self._stage(STAGE_MUTATION):
+                df.iloc[start:end, df.columns.get_loc('slope')] = slope
+                df.iloc[start:end, df.columns.get_loc('intercept')] = intercept
+                df.iloc[start:end, df.columns.get_loc('diff')] = series_a[start:end] - (
+                        slope * series_b[start:end] + intercept)
+
+        if self.signal is not None:
+            with self._stage(STAGE_SIGNAL):
+                if exists and valid and start == len(df) - 1:
+                    self.signal.replace_last(date_time, float(df['diff'].iat[-1]))
+                else:
+                    # 之前的 diff 改变了: 从第 start 行之前的状态开始, 只重放 z-score 和持仓状态受影响的行
+                    self._revise_signal(df.index, df['diff'].to_numpy(dtype=np.float64), start, end,
+                                        0 if exists and valid else (-1 if exists else 1))
+
+    def _update_streaming_element(self, time_series_elm1: TimeSeriesElement, time_series_elm2: TimeSeriesElement):
+        """
+        流式模式下的单元素更新: 只追加到列数组并更新环形缓冲区, 不触碰 DataFrame.
+        """
+        value_a = float(time_series_elm1.value)
+        value_b = float(time_series_elm2.value)
+        if np.isnan(value_a) or np.isnan(value_b):
+            return
+
+        state = self._stream
+        date_time = pd.Timestamp(time_series_elm1.date_time).to_datetime64()
+        last_date_time = state.last_date_time
+
+        if last_date_time is not None and date_time == last_date_time:
+            # 修正最后一个bar: 它的窗口不包含自身, 沿用已有的slope/intercept重新计算diff
+            i = state.size - 1
+            state.columns['value_a'][i] = value_a
+            state.columns['value_b'][i] = value_b
+            state.columns['diff'][i] = value_a - (state.columns['slope'][i] * value_b + state.columns['intercept'][i])
+            state.window.replace_last(value_a, value_b)
+            state.dirty = True
+            if self.signal is not None:
+                with self._stage(STAGE_SIGNAL):
+                    self.signal.replace_last(time_series_elm1.date_time, float(state.columns['diff'][i]))
+            return
+        if last_date_time is not None and date_time < last_date_time:
+            self._update_streaming_late_element(date_time, value_a, value_b)
+            return
+
+        if state.timed:
+            # Tick 级别: 先淘汰窗口之外的数据点, 窗口被完整覆盖时用 [date_time - WindowDuration, date_time) 内的数据点
+            nanoseconds = int(date_time.astype('datetime64[ns]').astype(np.int64))
+            with self._stage(STAGE_WINDOW):
+                state.window.evict(nanoseconds)
+            ready = state.window.is_ready(nanoseconds)
+        else:
+            # 窗口已满时, 用当前bar之前的 self.FixedWindowLength 个数据点计算diff
+            ready = state.window.is_full
+        if ready:
+            with self._stage(STAGE_OLS):
+                slope, intercept = state.window.fit()
+            calculated_diff = value_a - (slope * value_b + intercept)
+            if self.metrics is not None:
+                self.metrics.increment(COUNTER_REFITS)
+        else:
+            slope = intercept = calculated_diff = np.nan
+
+        with self._stage(STAGE_MUTATION):
+            state.append(date_time, value_a, value_b, slope, intercept, calculated_diff)
+        with self._stage(STAGE_WINDOW):
+            if state.timed:
+                state.window.push(nanoseconds, value_a, value_b)
+            else:
+                state.window.push(value_a, value_b)
+        if self.signal is not None:
+            with self._stage(STAGE_SIGNAL):
+                self.signal.update(time_series_elm1.date_time, float(calculated_diff))
+
+    def _update_streaming_late_element(self, date_time: np.datetime64, value_a: float, value_b: float):
+        """
+        流式模式下修正已有的bar或插入迟到的bar: 重新计算窗口覆盖该时间戳的行, 再用最后的数据重建窗口状态.
+        丢弃过旧的行之后 (max_history), 迟到的bar所需的窗口数据不在内存中时报错.
+        """
+        state = self._stream
+        size = state.size
+        date_times = state.date_time[:size]
+        position = int(np.searchsorted(date_times, date_time, side='left'))
+        if state.timed:
+            duration = np.timedelta64(self.WindowDuration, 'ns')
+            origin = np.datetime64(state.window.first_time, 'ns')
+            missing = state.truncated and date_time - duration < date_times[0]
+        else:
+            missing = state.truncated and position < self.FixedWindowLength
+        if missing:
+            raise ValueError(f"Late element {date_time} is older than the retained streaming history.")
+
+        with self._stage(STAGE_MUTATION):
+            if date_times[position] == date_time:
+                state.columns['value_a'][position] = value_a
+                state.columns['value_b'][position] = value_b
+                state.dirty = True
+                shift = 0
+            else:
+                position = state.insert(date_time, value_a, value_b)
+                shift = 1
+        size = state.size
+        date_times = state.date_time[:size]
+        series_a = state.columns['value_a'][:size]
+        series_b = state.columns['value_b'][:size]
+
+        with self._stage(STAGE_WINDOW):
+            if state.timed:
+                new_origin = min(origin, date_time)
+                end = self._affected_rows(date_times, position, date_time, (origin, new_origin))
+            else:
+                end = self._affected_rows(date_times, position, date_time)
+        with self._stage(STAGE_OLS):
+            slope, intercept = self._refit_rows(date_times, series_a, series_b, position, end,
+                                                new_origin if state.timed else None)
+        with self._stage(STAGE_MUTATION):
+            state.columns['slope'][position:end] = slope
+            state.columns['intercept'][position:end] = intercept
+            state.columns['diff'][position:end] = series_a[position:end] - (slope * series_b[position:end] + intercept)
+
+        # 窗口状态只依赖最后的数据点, 用它们重建 (代价与窗口长度成正比)
+        with self._stage(STAGE_WINDOW):
+            if state.timed:
+                offset = int(np.searchsorted(date_times, date_times[-1] - duration, side='left'))
+                state.window.seed(date_times[offset:], series_a[offset:], series_b[offset:])
+                state.window.first_time = int(new_origin.astype(np.int64))
+            else:
+                state.window.seed(series_a[-self.FixedWindowLength:], series_b[-self.FixedWindowLength:])
+
+        if self.signal is not None:
+            self._revise_signal(date_times, state.columns['diff'][:size], position, end, shift)
+
+    def _revise_signal(self, date_times, diffs: np.ndarray, start: int, end: int, shift: int):
+        """
+        第 [start, end) 行的 diff 改变后更新信号, 见 SpreadSignal.revise.
+        """
+        with self._stage(STAGE_SIGNAL):
+            replayed = self.signal.revise(date_times, diffs, start, end, shift)
+        if self.metrics is not None:
+            self.metrics.increment(COUNTER_SIGNAL_REPLAYS, replayed)
 
     def update_diff_and_equation(self):
         """
-        在self.df都完全的前提下，根据self.FixedWindowLength更新self.df中的diff列
+        在self.df都完全的前提下，根据self.FixedWindowLength更新self.df中的slope, intercept, diff列.
+        equation 不再逐行存储, 需要时通过 equation() / equations() / to_frame(with_equation=True) 生成.
         """
         # 如果self.df中没有对应的self.symbol1, self.symbol2列，则报错.
         if self.symbol1 not in self.df.columns or self.symbol2 not in self.df.columns:
             raise ValueError(f"DataFrame must contain columns for {self.symbol1} and {self.symbol2}.")
 
-        # 跳过self.FixedWindowLength行
-        for i in range(1, len(self.df)):
-            if i < self.FixedWindowLength:
-                continue
-            current_datetime = self.df.index[i]
-            prev_datetime = self.df.index[i - 1]
+        # 用累计和一次性计算所有窗口的回归结果: 第i行使用 [i - self.FixedWindowLength, i) 的数据点
+        with self._stage(STAGE_WINDOW):
+            series_a = self.df[self.symbol1].to_numpy(dtype=np.float64)
+            series_b = self.df[self.symbol2].to_numpy(dtype=np.float64)
+        with self._stage(STAGE_OLS):
+            if self.WindowDuration is not None:
+                slope, intercept = rolling_ols_time(series_a, series_b, self.df.index.to_numpy(), self.WindowDuration)
+            else:
+                slope, intercept = rolling_ols(series_a, series_b, self.FixedWindowLength)
+
+            # 根据ols_result计算: diff = y(the last) - (slope * x(the last) + intercept)
+            calculated_diff = series_a - (slope * series_b + intercept)
+
+        # 整列写入slope, intercept, diff
+        with self._stage(STAGE_MUTATION):
+            self.df['slope'] = slope
+            self.df['intercept'] = intercept
+            self.df['diff'] = calculated_diff
+        if self.metrics is not None:
+            self.metrics.increment(COUNTER_REFITS, int(np.isfinite(intercept).sum()))
+        if self.signal is not None:
+            with self._stage(STAGE_SIGNAL):
+                self.signal.run(self.df.index, calculated_diff)
+
+        if self.streaming:
+            self.enable_streaming()
 
-            # self.diff中，当前日期(current_datetime)向前取self.FixedWindowLength个数据点，得到seriesA，seriesB
-            window_end = i
-            window_start = i - self.FixedWindowLength
-            series_a = self.df.iloc[window_start:window_end][self.symbol1].values
-            series_b = self.df.iloc[window_start:window_end][self.symbol2].values
+    def backfill_chunked(self, path1, path2, output_dir, column: str = 'Close', chunksize: int = 1_000_000,
+                         dtype=np.float64) -> Dict[str, np.ndarray]:
+        """
+        超长历史的回填: 不经过 self.df, 从磁盘分块读取 symbol1 / symbol2 的文件, 块之间携带窗口状态,
+        按 self.FixedWindowLength (或 Tick 级别的 self.WindowDuration) 计算, 结果分块写入 output_dir 的 .npy 列.
+        内存占用为 O(chunksize + 窗口长度).
+        :param path1: symbol1 的文件 (.csv / .parquet / .npy 列目录)
+        :param path2: symbol2 的文件
+        :param output_dir: 输出目录
+        :param column: 使用的价格列
+        :param chunksize: 每块的行数
+        :param dtype: 存储类型, np.float32 使内存和磁盘占用减半
+        :return: 输出的列 (内存映射): date_time, value_a, value_b, slope, intercept, diff
+        """
+        if self.WindowDuration is not None:
+            engine = ChunkedBackfill(duration=self.WindowDuration, dtype=dtype)
+        else:
+            engine = ChunkedBackfill(window=self.FixedWindowLength, dtype=dtype)
+        chunks = iter_aligned_chunks(path1, path2, column, chunksize=chunksize)
+        with self._stage(STAGE_OLS):
+            result = engine.run(chunks, output_dir)
+        if self.metrics is not None:
+            self.metrics.increment(COUNTER_ROWS, engine.rows)
+            self.metrics.increment(COUNTER_REFITS, int(np.isfinite(result['intercept']).sum()))
+        return result
 
-            # 调用ols_regression(seriesA，seriesB)，得到ols_result
-            ols_result = self.ols_regression(series_a, series_b)
-            slope = ols_result["slope"]
-            intercept = ols_result["intercept"]
+    def sweep_windows(self, windows: List[int], n_jobs: int = 1, as_frame: bool = False, dtype=np.float64):
+        """
+        用多个候选窗口长度一次性计算 slope, intercept, diff, 用于调参; 不修改 self.df 和 self.FixedWindowLength.
+        所有窗口共享同一组累计矩, 每个窗口的结果与把 FixedWindowLength 设为该长度后调用 update_diff_and_equation 相同.
+        :param windows: 窗口长度列表
+        :param n_jobs: 并行计算的线程数, -1 表示使用全部CPU
+        :param as_frame: False 时返回形状为 (3, len(windows), len(self.df)) 的数组, 第0维依次为 self.FIELDS;
+                         True 时返回以 self.df.index 为 index, 列为 (window, field) 两级 MultiIndex 的 DataFrame
+        :param dtype: 结果的数据类型
+        """
+        if self.symbol1 not in self.df.columns or self.symbol2 not in self.df.columns:
+            raise ValueError(f"DataFrame must contain columns for {self.symbol1} and {self.symbol2}.")
 
-            self.df.at[current_datetime, 'slope'] = slope
-            self.df.at[current_datetime, 'intercept'] = intercept
+        windows = [int(window) for window in windows]
+        with self._stage(STAGE_WINDOW):
+            series_a = self.df[self.symbol1].to_numpy(dtype=np.float64)
+            series_b = self.df[self.symbol2].to_numpy(dtype=np.float64)
+        with self._stage(STAGE_OLS):
+            result = np.empty((len(self.FIELDS), len(windows), len(series_a)), dtype=dtype)
+            result[0], result[1] = rolling_ols_sweep(series_a, series_b, windows, n_jobs=n_jobs, dtype=dtype)
+            np.subtract(series_a, result[0] * series_b + result[1], out=result[2], casting='unsafe')
+        if self.metrics is not None:
+            self.metrics.increment(COUNTER_REFITS, sum(max(0, len(series_a) - window) for window in windows))
 
-            # 根据ols_result，循环计算: diff = y(the last) - (slope * x(the last) + intercept)
-            last_value_a = self.df.at[current_datetime, self.symbol1]
-            last_value_b = self.df.at[current_datetime, self.symbol2]
+        if not as_frame:
+            return result
+        columns = pd.MultiIndex.from_product([windows, self.FIELDS], names=['window', 'field'])
+        # (field, window, time) -> (time, window, field), 与列的顺序一致
+        return DataFrame(result.transpose(2, 1, 0).reshape(len(series_a), -1), index=self.df.index, columns=columns)
 
-            # Calculate diff
-            calculated_diff = last_value_a - (slope * last_value_b + intercept)
+    def last_result(self):
+        """
+        最后一行的计算结果.
+        :return: (date_time, slope, intercept, diff); 没有数据时返回 None
+        """
+        if self._stream is not None:
+            state = self._stream
+            if state.size == 0:
+                return None
+            i = state.size - 1
+            return (pd.Timestamp(state.date_time[i]), float(state.columns['slope'][i]),
+                    float(state.columns['intercept'][i]), float(state.columns['diff'][i]))
+        df = self._df
+        if df.empty:
+            return None
+        row = df.iloc[-1]
+        return (df.index[-1],) + tuple(float(row[name]) if name in df.columns else np.nan
+                                       for name in ('slope', 'intercept', 'diff'))
 
-            # 根据diff,更新对应行的diff值，并根据公式
-            self.df.at[current_datetime, 'diff'] = calculated_diff
+    def equation(self, date_time=None, with_values: bool = False) -> str:
+        """
+        按需生成某一行的 equation.
+        :param date_time: 行的时间, None 表示最后一个已计算出 slope 的行
+        :param with_values: True 时用该行的价格代替标的名称
+        :return: 例如 "diff = AAPL - (0.1234 * ABNB + 5.6789)"
+        """
+        df = self.df
+        if 'slope' not in df.columns:
+            raise ValueError("slope and intercept have not been calculated yet.")
+        if date_time is None:
+            computed = df['slope'].dropna()
+            if computed.empty:
+                raise ValueError("slope and intercept have not been calculated yet.")
+            date_time = computed.index[-1]
+        row = df.loc[date_time]
+        return format_equation(self.symbol1, self.symbol2, row['slope'], row['intercept'],
+                               row[self.symbol1] if with_values else None,
+                               row[self.symbol2] if with_values else None)
 
-            # 根据公式: diff = A - (slope * B + intercept) 更新equation列;
-            equation = f"{last_value_a} - ({slope} * {last_value_b} + {intercept})"
-            self.df.at[current_datetime, 'equation'] = equation
+    def equations(self, with_values: bool = False) -> pd.Series:
+        """
+        按需为所有已计算出 slope 的行生成 equation.
+        """
+        df = self.df
+        if 'slope' not in df.columns:
+            return pd.Series(index=df.index, dtype=object, name='equation')
+        computed = df.dropna(subset=['slope', 'intercept'])
+        slope = computed['slope'].tolist()
+        intercept = computed['intercept'].tolist()
+        if with_values:
+            values_a = computed[self.symbol1].tolist()
+            values_b = computed[self.symbol2].tolist()
+        else:
+            values_a = values_b = [None] * len(computed)
+        equations = [format_equation(self.symbol1, self.symbol2, *row)
+                     for row in zip(slope, intercept, values_a, values_b)]
+        return pd.Series(equations, index=computed.index, dtype=object, name='equation')
 
+    def to_frame(self, with_equation: bool = False, with_values: bool = False) -> DataFrame:
+        """
+        导出 self.df 的副本, 可选地附带按需生成的 equation 列.
+        """
+        df = self.df.copy()
+        if with_equation:
+            df['equation'] = self.equations(with_values)
+        return df
 
     @abstractmethod
     def calculate_window_length(self, resolution_level: ResolutionLevel) -> int:
@@ -178,38 +1057,69 @@ class DiffCalculator(ABC):
         """
         pass
 
-    def ols_regression(self, seriesA, seriesB):
+    @abstractmethod
+    def calculate_window_duration(self, resolution_level: ResolutionLevel) -> np.timedelta64:
+        """
+        根据输入的级别，计算基于时间的窗口时长 (用于 Tick 级别);
+        :param resolution_level:
+        :return:
+        """
+        pass
+
+    @staticmethod
+    def _validate_ols_inputs(seriesA, seriesB):
+        """
+        向量化地检查回归输入, 返回 float64 数组.
+        """
         # Convert series to numpy arrays if they are not already
-        series_a = np.array(seriesA)
-        series_b = np.array(seriesB)
+        series_a = np.asarray(seriesA)
+        series_b = np.asarray(seriesB)
 
         # Verify that series_a and series_b are not empty
         if series_a.size == 0 or series_b.size == 0:
             raise ValueError("seriesA and seriesB must not be empty.")
 
         # Verify that series_a and series_b have the same length
-        if len(series_a) != len(series_b):
+        if series_a.shape != series_b.shape:
             raise ValueError("seriesA and seriesB must have the same length.")
 
-        # Check for non-numeric elements
-        non_numeric_A = [x for x in series_a if not isinstance(x, (int, float))]
-        if non_numeric_A:
-            print(f"Non-numeric elements in seriesA: {non_numeric_A}")
-
-        non_numeric_B = [x for x in series_b if not isinstance(x, (int, float))]
-        if non_numeric_B:
-            print(f"Non-numeric elements in seriesB: {non_numeric_B}")
-
-        # Validate that all elements are numeric
-        if not np.issubdtype(series_a.dtype, np.number):
-            raise ValueError("seriesA must contain only numeric values.")
-        if not np.issubdtype(series_b.dtype, np.number):
-            raise ValueError("seriesB must contain only numeric values.")
+        # Validate that all elements are numeric; 只有在出错时才逐个找出非数值的元素
+        for name, series in (("seriesA", series_a), ("seriesB", series_b)):
+            if not np.issubdtype(series.dtype, np.number) or np.issubdtype(series.dtype, np.complexfloating):
+                non_numeric = [x for x in series.ravel() if not isinstance(x, (int, float, np.number))]
+                if non_numeric:
+                    print(f"Non-numeric elements in {name}: {non_numeric}")
+                raise ValueError(f"{name} must contain only numeric values.")
 
         # Verify seriesA and seriesB contain at least two data points
-        if len(series_a) < 2 or len(series_b) < 2:
+        if series_a.shape[-1] < 2:
             raise ValueError("seriesA and seriesB must contain at least two data points for OLS regression.")
 
+        return series_a.astype(np.float64, copy=False), series_b.astype(np.float64, copy=False)
+
+    def ols_regression(self, seriesA, seriesB, diagnostics: bool = False):
+        """
+        以 seriesA 为被解释变量, seriesB 为解释变量做OLS回归: seriesA = slope * seriesB + intercept.
+        :param seriesA: 被解释变量
+        :param seriesB: 解释变量
+        :param diagnostics: False 时使用闭式解 (快速路径); True 时用 statsmodels 拟合, 并额外返回残差统计量
+        :return: {"slope", "intercept"}; diagnostics 为 True 时还包括
+                 "rsquared", "resid_std", "stderr_slope", "stderr_intercept", "nobs"
+        """
+        series_a, series_b = self._validate_ols_inputs(seriesA, seriesB)
+        if series_a.ndim != 1:
+            raise ValueError("seriesA and seriesB must be one-dimensional; use ols_regression_batch for 2D input.")
+
+        if not diagnostics:
+            slope, intercept = ols_fit(series_a, series_b)
+            return {
+                "slope": slope,
+                "intercept": intercept
+            }
+
+        # statsmodels 导入较慢 (数秒), 只在需要诊断统计量时才导入
+        import statsmodels.api as sm
+
         # Add a constant term for the intercept
         series_b = sm.add_constant(series_b)
 
@@ -217,10 +1127,30 @@ class DiffCalculator(ABC):
         model = sm.OLS(series_a, series_b)
         results = model.fit()
 
-        # Return the regression coefficients and intercept
+        # Return the regression coefficients, intercept and residual statistics
         return {
             "slope": results.params[1],  # Slope
-            "intercept": results.params[0]  # Intercept
+            "intercept": results.params[0],  # Intercept
+            "rsquared": results.rsquared,
+            "resid_std": float(np.sqrt(results.scale)),
+            "stderr_slope": results.bse[1],
+            "stderr_intercept": results.bse[0],
+            "nobs": int(results.nobs)
+        }
+
+    def ols_regression_batch(self, seriesA, seriesB):
+        """
+        一次调用拟合多个窗口或配对: seriesA, seriesB 为形状 (k, n) 的二维数组, 每一行是一个独立的样本.
+        :return: {"slope": 形状 (k,) 的数组, "intercept": 形状 (k,) 的数组}
+        """
+        series_a, series_b = self._validate_ols_inputs(seriesA, seriesB)
+        if series_a.ndim != 2:
+            raise ValueError("seriesA and seriesB must be two-dimensional arrays of shape (k, n).")
+
+        slope, intercept = batch_ols_fit(series_a, series_b)
+        return {
+            "slope": slope,
+            "intercept": intercept
         }
 
 
@@ -228,7 +1158,10 @@ class DiffCalculatorSP500(DiffCalculator):
 
     def __init__(self, symbol1: str, symbol2: str, resolution: ResolutionLevel = ResolutionLevel.Daily):
         super().__init__(symbol1, symbol2, resolution)
-        self.FixedWindowLength = self.calculate_window_length(resolution)
+        if resolution == ResolutionLevel.Tick:
+            self.WindowDuration = self.calculate_window_duration(resolution)
+        else:
+            self.FixedWindowLength = self.calculate_window_length(resolution)
 
     def calculate_window_length(self, resolution_level: ResolutionLevel) -> int:
         """
@@ -254,16 +1187,30 @@ class DiffCalculatorSP500(DiffCalculator):
             # 每天6.5小时 * 3600秒
             return int(fixed_window_length * 6.5 * 3600)
         elif resolution_level == ResolutionLevel.Tick:
-            # 每次交易的窗口长度取决于实际的实现需求，这里没有具体实现
-            raise NotImplementedError("Tick resolution is not implemented.")
+            # Tick 数据不规则, 窗口按时间定义, 见 calculate_window_duration
+            raise ValueError("Tick resolution uses a time-based window; see calculate_window_duration.")
         else:
             raise ValueError(f"Unsupported resolution level: {resolution_level}")
 
+    def calculate_window_duration(self, resolution_level: ResolutionLevel) -> np.timedelta64:
+        """
+        根据输入的级别，计算窗口的时长。
+        :param resolution_level: 分辨率级别, 目前只有 Tick 使用基于时间的窗口
+        :return: 窗口时长
+        """
+        if resolution_level == ResolutionLevel.Tick:
+            # 126个交易日约为半年, Tick 的时间戳是自然时间, 因此取182个自然日
+            return np.timedelta64(182, 'D')
+        raise ValueError(f"Resolution level {resolution_level} uses a fixed window length; see calculate_window_length.")
+
 
 class DiffCalculatorCrypto(DiffCalculator):
     def __init__(self, symbol1: str, symbol2: str, resolution: ResolutionLevel = ResolutionLevel.Daily):
         super().__init__(symbol1, symbol2, resolution)
-        self.FixedWindowLength = self.calculate_window_length(resolution)
+        if resolution == ResolutionLevel.Tick:
+            self.WindowDuration = self.calculate_window_duration(resolution)
+        else:
+            self.FixedWindowLength = self.calculate_window_length(resolution)
 
     def calculate_window_length(self, resolution_level: ResolutionLevel) -> int:
         """
@@ -289,8 +1236,18 @@ class DiffCalculatorCrypto(DiffCalculator):
             # 每天24小时 * 3600秒
             return fixed_window_length * 24 * 3600
         elif resolution_level == ResolutionLevel.Tick:
-            # 每次交易的窗口长度取决于实际的实现需求，这里没有具体实现
-            raise NotImplementedError("Tick resolution is not implemented.")
+            # Tick 数据不规则, 窗口按时间定义, 见 calculate_window_duration
+            raise ValueError("Tick resolution uses a time-based window; see calculate_window_duration.")
         else:
             raise ValueError(f"Unsupported resolution level: {resolution_level}")
 
+    def calculate_window_duration(self, resolution_level: ResolutionLevel) -> np.timedelta64:
+        """
+        根据输入的级别，计算窗口的时长。
+        :param resolution_level: 分辨率级别, 目前只有 Tick 使用基于时间的窗口
+        :return: 窗口时长
+        """
+        if resolution_level == ResolutionLevel.Tick:
+            # 加密货币市场每天24小时交易, 183天
+            return np.timedelta64(183, 'D')
+        raise ValueError(f"Resolution level {resolution_level} uses a fixed window length; see calculate_window_length.")
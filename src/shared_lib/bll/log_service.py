@@ -1,40 +1,146 @@
 # log_service.py
 import os
+import queue
+import atexit
 import logging
 import datetime
-from logging.handlers import TimedRotatingFileHandler
+import threading
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 
-from shared_lib.tests import config
+from ..tests import config
+from .metrics import InMemoryMetricsSink
 
 MAX_BYTES = config.log_max_bytes  # 10 MB
+LOG_FORMAT = '%(asctime)s:%(levelname)s:%(message)s'
 
 
 class CustomHandler(TimedRotatingFileHandler):
-    def __init__(self, filename, maxBytes, backupCount, *args, **kwargs):
-        super().__init__(filename, *args, **kwargs)
+    """
+    按时间和文件大小两种条件滚动的日志文件.
+    文件大小在内存中累计 (只在打开文件时取一次), 不再对每条记录调用 os.path.getsize.
+    flush_on_emit 为 False 时每条记录不单独 flush, 由调用方 (BatchingQueueListener) 在一批记录写完后 flush.
+    """
+
+    def __init__(self, filename, maxBytes, backupCount, *args, flush_on_emit: bool = True, **kwargs):
         self.maxBytes = maxBytes
-        self.backupCount = backupCount
+        self.flush_on_emit = flush_on_emit
+        self._bytes = 0
+        super().__init__(filename, *args, backupCount=backupCount, **kwargs)
+
+    def _open(self):
+        stream = super()._open()
+        stream.seek(0, os.SEEK_END)
+        self._bytes = stream.tell()
+        return stream
 
     def shouldRollover(self, record):
-        # Call the parent class method
+        # 时间条件由父类判断; 大小条件只比较内存中的计数
         if super().shouldRollover(record):
             return 1
-        # Check if the current log file is larger than maxBytes
-        if os.path.getsize(self.baseFilename) >= self.maxBytes:
+        if self.maxBytes > 0 and self._bytes >= self.maxBytes:
             return 1
         return 0
 
-    def doRollover(self):
-        # Rollover the current log
-        super().doRollover()
-        # If there are more than backupCount logs, delete the oldest
-        logs = sorted([log for log in os.listdir(self.directory) if log.startswith(self.prefix)])
-        if len(logs) > self.backupCount:
-            os.remove(os.path.join(self.directory, logs[0]))
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            size = len(msg.encode(self.encoding or 'utf-8'))
+            # 写入这条记录会超过 maxBytes 时先滚动, 空文件除外
+            if super().shouldRollover(record) or (0 < self.maxBytes < self._bytes + size and self._bytes > 0):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self._bytes += size
+            if self.flush_on_emit:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def rotation_filename(self, default_name):
+        # 同一时间段内按大小多次滚动时, 依次使用 .1, .2, ... 后缀, 不覆盖已有的备份
+        name = super().rotation_filename(default_name)
+        counter = 0
+        candidate = name
+        while os.path.exists(candidate):
+            counter += 1
+            candidate = f"{name}.{counter}"
+        return candidate
+
+    def getFilesToDelete(self):
+        # 每次滚动只列一次目录; 按修改时间排序, 保留最新的 backupCount 个备份
+        directory, base_name = os.path.split(self.baseFilename)
+        prefix = base_name + "."
+        backups = []
+        for file_name in os.listdir(directory or '.'):
+            if file_name.startswith(prefix) and self.extMatch.match(file_name[len(prefix):]):
+                path = os.path.join(directory, file_name)
+                backups.append((os.path.getmtime(path), path))
+        backups.sort()
+        if len(backups) <= self.backupCount:
+            return []
+        return [path for _, path in backups[:len(backups) - self.backupCount]]
+
+
+class ThreadQueueHandler(QueueHandler):
+    """
+    用于同一进程内线程间队列的 QueueHandler: 记录不需要 pickle, 因此不复制 LogRecord, 也不在调用线程上格式化,
+    只把 args 合并进消息 (避免可变参数在写入前被修改). 格式化由后台线程的 handler 完成.
+    """
+
+    def prepare(self, record):
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    在后台线程中处理队列中的日志记录: 一次取出所有已到达的记录 (最多 batch_size 条), 全部写入后每个 handler 只 flush 一次.
+    """
+
+    def __init__(self, log_queue, *handlers, respect_handler_level: bool = False, batch_size: int = 256):
+        super().__init__(log_queue, *handlers, respect_handler_level=respect_handler_level)
+        self.batch_size = batch_size
+
+    def _monitor(self):
+        log_queue = self.queue
+        has_task_done = hasattr(log_queue, 'task_done')
+        stop = False
+        while not stop:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+                if has_task_done:
+                    log_queue.task_done()
+            for handler in self.handlers:
+                handler.flush()
+
+
+_listener: BatchingQueueListener = None
 
 
 # Configure logging
-def configure_logging():
+def configure_logging(asynchronous: bool = False, batch_size: int = 256):
+    """
+    :param asynchronous: True 时调用线程只把记录放入无界队列, 格式化, 写文件和滚动都在后台线程中完成
+    :param batch_size: 异步模式下后台线程一次最多写入的记录数
+    :return: 异步模式下返回 BatchingQueueListener, 否则返回 None
+    """
+    global _listener
+    stop_logging()
+
     # Create a log directory if it doesn't exist
     if not os.path.exists('log'):
         os.makedirs('log')
@@ -43,8 +149,98 @@ def configure_logging():
     current_date = datetime.datetime.now().strftime('%Y-%m-%d')
     # Set the log filename to the current date
     log_filename = os.path.join('log', f'{current_date}.log')
-    logging.basicConfig(filename=log_filename, level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
 
     # Create a handler that writes log messages to a file, with a new file created each day or when the file size exceeds 10MB
-    handler = CustomHandler(log_filename, maxBytes=MAX_BYTES, backupCount=7, when='midnight', interval=1)
-    logging.getLogger('').addHandler(handler)
+    handler = CustomHandler(log_filename, maxBytes=MAX_BYTES, backupCount=7, when='midnight', interval=1,
+                            encoding='utf-8', flush_on_emit=not asynchronous)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger('')
+    root.setLevel(logging.INFO)
+    if not asynchronous:
+        root.addHandler(handler)
+        return None
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(ThreadQueueHandler(log_queue))
+    _listener = BatchingQueueListener(log_queue, handler, batch_size=batch_size)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """
+    停止异步日志的后台线程: 先写完队列中剩余的记录, 再关闭文件. 进程退出时会自动调用.
+    """
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    root = logging.getLogger('')
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler) and handler.queue is listener.queue:
+            root.removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+atexit.register(stop_logging)
+
+
+def log_metrics(sink: InMemoryMetricsSink, logger: logging.Logger = None, level=logging.INFO):
+    """
+    把 sink 当前的计数器和各阶段的延迟统计写入日志, 每个指标一行.
+    """
+    logger = logger or logging.getLogger('metrics')
+    if not logger.isEnabledFor(level):
+        return
+    snapshot = sink.snapshot()
+    for name, value in sorted(snapshot['counters'].items()):
+        logger.log(level, f"{name} count={value}")
+    for name, summary in sorted(snapshot['timings'].items()):
+        logger.log(level, f"{name} count={summary['count']} total={summary['total']:.6f}s mean={summary['mean'] * 1e6:.1f}us "
+                          f"p50={summary['p50'] * 1e6:.1f}us p99={summary['p99'] * 1e6:.1f}us max={summary['max'] * 1e6:.1f}us")
+
+
+class MetricsReporter:
+    """
+    后台线程, 每隔 interval 秒调用一次 log_metrics; 指标的记录本身不经过日志, 不影响热点路径.
+    """
+
+    def __init__(self, sink: InMemoryMetricsSink, interval: float = 60.0, logger: logging.Logger = None,
+                 level=logging.INFO, reset: bool = False):
+        """
+        :param reset: 为 True 时每次输出后清空 sink, 日志中的统计只覆盖上一个周期
+        """
+        self.sink = sink
+        self.interval = interval
+        self.logger = logger
+        self.level = level
+        self.reset = reset
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def report(self):
+        log_metrics(self.sink, self.logger, self.level)
+        if self.reset:
+            self.sink.reset()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='MetricsReporter', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止后台线程并输出最后一次.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.report()
@@ -0,0 +1,132 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import Dict
+
+# 延迟直方图的桶边界: 1µs 到约 67s, 每个桶是前一个的2倍
+HISTOGRAM_BOUNDS = [1e-6 * 2 ** i for i in range(27)]
+
+
+class IMetricsSink(ABC):
+    @abstractmethod
+    def record_timing(self, name: str, seconds: float):
+        pass
+
+    @abstractmethod
+    def increment(self, name: str, value: int = 1):
+        pass
+
+
+class LatencyHistogram:
+    """
+    固定对数分桶的延迟直方图, 记录的代价为 O(log(桶数)), 内存固定.
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        近似分位数: 返回第一个累计计数达到 q 的桶的上边界 (最后一个桶返回 max).
+        """
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(HISTOGRAM_BOUNDS[i], self.max) if i < len(HISTOGRAM_BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.mean,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+        }
+
+
+class InMemoryMetricsSink(IMetricsSink):
+    """
+    在内存中累计计数器和每个阶段的延迟直方图.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+    def record_timing(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        with self._lock:
+            histogram.record(seconds)
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        """
+        :return: {'counters': {name: value}, 'timings': {name: summary}}
+        """
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timings': {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms = {}
+
+
+class StageTimer:
+    """
+    计时一个阶段并把耗时写入 sink 的上下文管理器. 可以重复使用, 但不能嵌套或跨线程同时使用同一个实例.
+    """
+    __slots__ = ('sink', 'name', 'start')
+
+    def __init__(self, sink: IMetricsSink, name: str):
+        self.sink = sink
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.sink.record_timing(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# 关闭指标时所有阶段共用的空上下文管理器
+NULL_STAGE = nullcontext()
@@ -0,0 +1,214 @@
+import itertools
+from typing import Sequence
+import numpy as np
+from pandas import DataFrame
+from src.shared_lib.bll.spread_signal import rolling_zscore
+
+# 向量化的配对交易回测: 输入 DiffCalculator 的价格, slope 和 diff 列, 用数组运算模拟持仓, 按对冲比例计算盈亏和交易成本.
+#
+# 持仓规则与 SpreadSignal 一致: 无持仓时 z >= entry 做空价差, z <= -entry 做多价差; |z| <= exit 平仓;
+# |z| >= stop 止损, 之后 |z| 回到 exit 以内才允许再次开仓. z-score 为 NaN 的bar不改变持仓.
+# 状态机按 "exit bar 之间的区间" 展开: 每个区间内第一个 entry bar 决定方向, 其后第一个 stop bar 之后空仓,
+# 因此只需要沿时间轴的 cumsum / maximum.accumulate, 没有逐行的 Python 循环.
+#
+# 第 t 个bar收盘时按 position[t] 调整持仓, 持有到 t + 1: pnl[t + 1] = qa[t] * Δa + qb[t] * Δb,
+# 其中 qa = position, qb = -position * hedge; hedge 为开仓时的 slope (rebalance=True 时为每个bar的 slope).
+# 交易成本为成交金额乘以 cost.
+
+STATS_COLUMNS = ['total_pnl', 'sharpe', 'max_drawdown', 'trades', 'exposure']
+
+
+def _segment_base(counts: np.ndarray, last_exit: np.ndarray) -> np.ndarray:
+    """
+    counts 在当前区间起点 (最近的 exit bar) 处的值, 没有 exit bar 之前为0.
+    """
+    base = np.take_along_axis(counts, np.maximum(last_exit, 0), axis=-1)
+    return np.where(last_exit >= 0, base, counts.dtype.type(0))
+
+
+def positions(zscore, entry, exit, stop=None):
+    """
+    由 z-score 计算持仓. 阈值可以是标量, 也可以是形状为 (k, 1) 的数组, 一次计算 k 组阈值.
+    :param zscore: 形状为 (n,) 的 z-score
+    :param entry: 开仓阈值
+    :param exit: 平仓阈值
+    :param stop: 止损阈值, None 或 NaN 表示不止损
+    :return: (position, entry_index), 形状为 (n,) 或 (k, n); position 取值 1 / -1 / 0,
+             entry_index 为当前持仓的开仓bar位置 (无持仓时无意义)
+    """
+    zscore = np.asarray(zscore, dtype=np.float64)
+    entry = np.asarray(entry, dtype=np.float64)
+    exit = np.asarray(exit, dtype=np.float64)
+    stop = np.asarray(np.inf if stop is None else stop, dtype=np.float64)
+    stop = np.where(np.isnan(stop), np.inf, stop)
+    if np.any(exit < 0) or np.any(exit >= entry):
+        raise ValueError("thresholds must satisfy 0 <= exit < entry.")
+    if np.any(stop <= entry):
+        raise ValueError("stop must be larger than entry.")
+
+    with np.errstate(invalid='ignore'):
+        magnitude = np.abs(zscore)
+        exit_mask = magnitude <= exit
+        entry_mask = magnitude >= entry
+        stop_mask = magnitude >= stop
+    shape = np.broadcast_shapes(exit_mask.shape, entry_mask.shape, stop_mask.shape)
+    exit_mask, entry_mask, stop_mask = (np.broadcast_to(mask, shape) for mask in (exit_mask, entry_mask, stop_mask))
+    # 位置和计数用 int32, 内存带宽是批量计算的瓶颈
+    index_dtype = np.int32 if shape[-1] < np.iinfo(np.int32).max else np.int64
+    index = np.arange(shape[-1], dtype=index_dtype)
+    no_index = index_dtype(-1)
+
+    # 当前区间的起点: 最近的 exit bar
+    last_exit = np.maximum.accumulate(np.where(exit_mask, index, no_index), axis=-1)
+    entry_counts = np.cumsum(entry_mask, axis=-1, dtype=index_dtype)
+    entries_in_segment = entry_counts - _segment_base(entry_counts, last_exit)
+    in_trade = entries_in_segment >= 1
+
+    # 区间内第一个 entry bar 的位置和方向
+    first_entry = entry_mask & (entries_in_segment == 1)
+    entry_index = np.maximum.accumulate(np.where(first_entry, index, no_index), axis=-1)
+    with np.errstate(invalid='ignore'):
+        direction = np.where(zscore > 0, np.int8(-1), np.int8(1))[np.maximum(entry_index, 0)]
+
+    # 开仓之后的第一个 stop bar 起空仓, 直到下一个 exit bar
+    stop_counts = np.cumsum(stop_mask & in_trade & (index > entry_index), axis=-1, dtype=index_dtype)
+    stopped = (stop_counts - _segment_base(stop_counts, last_exit)) >= 1
+
+    position = np.where(in_trade & ~stopped, direction, np.int8(0))
+    return position, entry_index
+
+
+class BacktestResult:
+    __slots__ = ('position', 'hedge', 'pnl', 'cost', 'equity')
+
+    def __init__(self, position, hedge, pnl, cost):
+        """
+        :param position: 价差持仓, 1 / -1 / 0
+        :param hedge: 每个bar使用的对冲比例 (symbol2 相对 symbol1 的数量)
+        :param pnl: 每个bar的毛盈亏
+        :param cost: 每个bar的交易成本
+        """
+        self.position = position
+        self.hedge = hedge
+        self.pnl = pnl
+        self.cost = cost
+        self.equity = np.cumsum(pnl - cost, axis=-1)
+
+    def stats(self, periods_per_year: float = None) -> dict:
+        """
+        :param periods_per_year: 年化夏普比率所用的每年bar数, None 表示不年化
+        :return: STATS_COLUMNS 对应的统计量
+        """
+        return {name: values.item() for name, values in _stats(self.position, self.pnl - self.cost, self.equity,
+                                                               periods_per_year).items()}
+
+
+def _stats(position, net, equity, periods_per_year: float = None) -> dict:
+    mean = net.mean(axis=-1)
+    std = net.std(axis=-1, ddof=1) if net.shape[-1] > 1 else np.full(mean.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, mean / std, np.nan)
+    if periods_per_year is not None:
+        sharpe = sharpe * np.sqrt(periods_per_year)
+    previous = np.concatenate([np.zeros(position.shape[:-1] + (1,), dtype=position.dtype), position[..., :-1]],
+                              axis=-1)
+    trades = ((position != 0) & (position != previous)).sum(axis=-1)
+    drawdown = (np.maximum.accumulate(np.maximum(equity, 0.0), axis=-1) - equity).max(axis=-1)
+    return {'total_pnl': equity[..., -1], 'sharpe': sharpe, 'max_drawdown': drawdown, 'trades': trades,
+            'exposure': (position != 0).mean(axis=-1)}
+
+
+def simulate(value_a, value_b, slope, position, entry_index, cost: float = 0.0,
+             rebalance: bool = False) -> BacktestResult:
+    """
+    由持仓计算盈亏. position / entry_index 为 positions() 的结果, 可以是 (n,) 或 (k, n).
+    :param value_a: symbol1 的价格
+    :param value_b: symbol2 的价格
+    :param slope: 回归斜率, 即对冲比例
+    :param cost: 交易成本, 成交金额的比例
+    :param rebalance: False 时整笔交易使用开仓时的对冲比例, True 时每个bar按当时的 slope 调整 symbol2 的数量
+    """
+    value_a = np.asarray(value_a, dtype=np.float64)
+    value_b = np.asarray(value_b, dtype=np.float64)
+    slope = np.asarray(slope, dtype=np.float64)
+    hedge = slope if rebalance else slope[np.maximum(entry_index, 0)]
+    holding = position != 0
+    quantity_a = position.astype(np.float64)
+    quantity_b = np.where(holding, -quantity_a * hedge, 0.0)
+
+    pnl = np.zeros(quantity_a.shape)
+    pnl[..., 1:] = quantity_a[..., :-1] * np.diff(value_a) + quantity_b[..., :-1] * np.diff(value_b)
+    traded_a = np.abs(np.diff(quantity_a, axis=-1, prepend=0.0))
+    traded_b = np.abs(np.diff(quantity_b, axis=-1, prepend=0.0))
+    trade_cost = cost * (traded_a * value_a + traded_b * value_b)
+    return BacktestResult(position, np.where(holding, hedge, np.nan), pnl, trade_cost)
+
+
+class PairBacktester:
+    """
+    基于 DiffCalculator 结果的回测: 构造时取出价格, slope 和 diff 列并计算一次 z-score, 之后每组阈值只做数组运算.
+    """
+
+    def __init__(self, calculator, window: int = None, ddof: int = 1):
+        """
+        :param calculator: 已经调用过 update_diff_and_equation 的 DiffCalculator
+        :param window: z-score 的窗口长度, 默认使用 calculator.signal 的窗口, 否则为 calculator.FixedWindowLength
+        """
+        df = calculator.df
+        if 'diff' not in df.columns:
+            raise ValueError("DataFrame must contain slope and diff columns, call update_diff_and_equation first.")
+        if window is None:
+            window = calculator.signal.window if calculator.signal is not None else calculator.FixedWindowLength
+        if not window:
+            raise ValueError("window must be given for time-based (Tick) windows.")
+        self.index = df.index
+        self.value_a = df[calculator.symbol1].to_numpy(dtype=np.float64)
+        self.value_b = df[calculator.symbol2].to_numpy(dtype=np.float64)
+        self.slope = df['slope'].to_numpy(dtype=np.float64)
+        self.diff = df['diff'].to_numpy(dtype=np.float64)
+        self.window = window
+        _, _, self.zscore = rolling_zscore(self.diff, window, ddof)
+
+    def run(self, entry: float = 2.0, exit: float = 0.5, stop: float = None, cost: float = 0.0,
+            rebalance: bool = False) -> BacktestResult:
+        """
+        回测一组阈值, 参数见 positions() 和 simulate().
+        """
+        position, entry_index = positions(self.zscore, entry, exit, stop)
+        return simulate(self.value_a, self.value_b, self.slope, position, entry_index, cost, rebalance)
+
+    def run_frame(self, entry: float = 2.0, exit: float = 0.5, stop: float = None, cost: float = 0.0,
+                  rebalance: bool = False) -> DataFrame:
+        """
+        同 run, 结果为以 date_time 为 index 的 DataFrame.
+        """
+        result = self.run(entry, exit, stop, cost, rebalance)
+        return DataFrame({'zscore': self.zscore, 'position': result.position, 'hedge': result.hedge,
+                          'pnl': result.pnl, 'cost': result.cost, 'equity': result.equity}, index=self.index)
+
+    def grid(self, entries: Sequence[float], exits: Sequence[float], stops: Sequence[float] = (None,),
+             cost: float = 0.0, rebalance: bool = False, periods_per_year: float = None,
+             block_size: int = 16) -> DataFrame:
+        """
+        批量回测 entries x exits x stops 的所有有效组合 (exit < entry < stop), 每 block_size 组阈值一次数组运算.
+        :param block_size: 每次同时计算的组合数, 内存占用与 block_size * len(self.diff) 成正比
+        :return: 每组阈值一行, 列为 entry, exit, stop 和 STATS_COLUMNS
+        """
+        combinations = [(entry, exit, np.nan if stop is None else stop)
+                        for entry, exit, stop in itertools.product(entries, exits, stops)
+                        if 0 <= exit < entry and (stop is None or stop > entry)]
+        if not combinations:
+            raise ValueError("No valid threshold combination: thresholds must satisfy 0 <= exit < entry < stop.")
+        thresholds = np.array(combinations, dtype=np.float64)
+
+        blocks = []
+        for start in range(0, len(thresholds), block_size):
+            block = thresholds[start:start + block_size]
+            position, entry_index = positions(self.zscore, block[:, 0:1], block[:, 1:2], block[:, 2:3])
+            result = simulate(self.value_a, self.value_b, self.slope, position, entry_index, cost, rebalance)
+            blocks.append(_stats(result.position, result.pnl - result.cost, result.equity, periods_per_year))
+
+        frame = DataFrame(thresholds, columns=['entry', 'exit', 'stop'])
+        for name in STATS_COLUMNS:
+            frame[name] = np.concatenate([block[name] for block in blocks])
+        return frame
@@ -0,0 +1,150 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory, util
+from typing import List, Tuple
+import numpy as np
+from src.shared_lib.bll.universe_spread_engine import UniverseSpreadEngine
+
+logger = logging.getLogger(__name__)
+
+_ALIGNMENT = 64
+
+# 工作进程内的全局状态: 由 _init_worker 在进程启动时设置一次
+_worker_shm = None
+_worker_engine = None
+
+
+def _shared_layout(arrays: dict):
+    """
+    计算每个数组在共享内存块中的位置.
+    :return: ([(name, dtype, shape, offset), ...], 总字节数)
+    """
+    layout = []
+    offset = 0
+    for name, array in arrays.items():
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+    return layout, max(offset, 1)
+
+
+def _attach_arrays(shm: shared_memory.SharedMemory, layout) -> dict:
+    return {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            for name, dtype, shape, offset in layout}
+
+
+def _init_worker(shm_name: str, layout, window: int, symbols: List[str]):
+    global _worker_shm, _worker_engine
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_engine = UniverseSpreadEngine.from_state_arrays(window, symbols, _attach_arrays(_worker_shm, layout))
+    # 工作进程退出时关闭共享内存; fork 出的进程不会执行 atexit, 所以用 multiprocessing 的退出回调
+    util.Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker():
+    global _worker_shm, _worker_engine
+    # 先释放引用共享内存的数组, 否则 close 会因缓冲区仍被导出而失败
+    _worker_engine = None
+    if _worker_shm is not None:
+        _worker_shm.close()
+        _worker_shm = None
+
+
+def _scan_chunk(pairs: List[Tuple[str, str]], dtype, reducer):
+    result = _worker_engine.compute_chunk(pairs, dtype)
+    if reducer is not None:
+        result = reducer(pairs, result)
+    return pairs, result
+
+
+def last_values(pairs: List[Tuple[str, str]], result: np.ndarray) -> np.ndarray:
+    """
+    只返回每个配对最后一行的 slope, intercept, diff, 形状为 (len(FIELDS), len(pairs)).
+    可作为 ParallelPairScanner.scan 的 reducer, 以减少进程间传输的数据量.
+    """
+    return result[:, :, -1].copy()
+
+
+class ScanStats:
+    __slots__ = ('pairs', 'chunks', 'seconds')
+
+    def __init__(self):
+        self.pairs = 0
+        self.chunks = 0
+        self.seconds = 0.0
+
+    @property
+    def pairs_per_second(self) -> float:
+        return self.pairs / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return (f"Scanned {self.pairs} pairs in {self.chunks} chunks, {self.seconds:.3f}s, "
+                f"{self.pairs_per_second:.1f} pairs/s")
+
+
+class ParallelPairScanner:
+    """
+    多进程配对扫描: 价格矩阵和共享的滚动矩只通过 multiprocessing.shared_memory 发布一次,
+    工作进程直接在共享内存上构建 UniverseSpreadEngine; 任务只传递配对列表, 结果按完成顺序返回.
+    """
+
+    def __init__(self, prices, window: int, symbols: List[str] = None, date_times=None,
+                 max_workers: int = None, mp_context=None):
+        """
+        :param prices: DataFrame (index 为时间, 列为标的) 或二维数组 (时间 × 标的)
+        :param window: 窗口长度, 通常取 DiffCalculator.FixedWindowLength
+        :param max_workers: 工作进程数, 默认为CPU核数
+        :param mp_context: multiprocessing 上下文, 默认使用平台默认的启动方式
+        """
+        self.engine = UniverseSpreadEngine(prices, window, symbols, date_times)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.mp_context = mp_context
+        self.stats = ScanStats()
+
+    def _publish(self):
+        arrays = self.engine.state_arrays()
+        layout, size = _shared_layout(arrays)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        for name, shared in _attach_arrays(shm, layout).items():
+            shared[...] = arrays[name]
+        return shm, layout
+
+    def scan(self, pairs: List[Tuple[str, str]] = None, chunk_size: int = 64, dtype=np.float64, reducer=None):
+        """
+        把配对分片到各个工作进程, 按完成顺序生成结果.
+        :param pairs: (symbol1, symbol2) 列表, None 表示全部配对
+        :param chunk_size: 每个任务的配对数
+        :param dtype: 结果的数据类型
+        :param reducer: 可选的模块级函数 reducer(pairs, result), 在工作进程内对结果做归约 (例如 last_values)
+        :return: 生成 (pairs_chunk, result)
+        """
+        pairs = self.engine.all_pairs() if pairs is None else list(pairs)
+        chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+        self.stats = ScanStats()
+        start_time = time.perf_counter()
+
+        shm, layout = self._publish()
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.mp_context,
+                                     initializer=_init_worker,
+                                     initargs=(shm.name, layout, self.engine.window, self.engine.symbols)) as executor:
+                # 限制同时在途的任务数, 避免结果堆积占用内存
+                max_in_flight = 2 * self.max_workers
+                pending = set()
+                next_chunk = 0
+                while next_chunk < len(chunks) or pending:
+                    while next_chunk < len(chunks) and len(pending) < max_in_flight:
+                        pending.add(executor.submit(_scan_chunk, chunks[next_chunk], dtype, reducer))
+                        next_chunk += 1
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        chunk, result = future.result()
+                        self.stats.pairs += len(chunk)
+                        self.stats.chunks += 1
+                        self.stats.seconds = time.perf_counter() - start_time
+                        yield chunk, result
+        finally:
+            shm.close()
+            shm.unlink()
+        logger.info(str(self.stats))
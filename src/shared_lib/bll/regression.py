@@ -0,0 +1,603 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# 滚动OLS引擎: 基于累计和(Σx, Σy, Σxy, Σx²)在O(n)时间内计算每一行的 slope / intercept.
+#
+# 约定与 DiffCalculator.ols_regression 一致: series_a 为被解释变量(y), series_b 为解释变量(x),
+# 即 series_a = slope * series_b + intercept.
+#
+# 精度: 累计和按块重新开始 (见 block_cumsums), 每块减去块内的参考值, 窗口和只由同一块内的两个局部累计和相减得到,
+# 误差只与窗口长度有关而与序列总长度无关. 在价格量级的数据上, 与逐窗口的两遍法OLS相比 slope 的相对误差 < 1e-9,
+# intercept 和 diff 的绝对误差 < 1e-8, 对数百万行的序列同样成立 (见 tests/test_rolling_ols.py).
+# 窗口内 series_b 方差为0时(退化窗口), slope 和 intercept 返回 NaN, 而不是 statsmodels 的伪逆解.
+
+RELATIVE_TOLERANCE = 1e-9
+ABSOLUTE_TOLERANCE = 1e-8
+
+# rolling_ols_sweep 中共享同一组累计矩的最长窗口与最短窗口之比的上限: 块长远大于窗口时短窗口的误差随块长增长
+SWEEP_BLOCK_RATIO = 4
+
+
+def _spans(values: np.ndarray, block: int, fill) -> np.ndarray:
+    n_blocks = values.shape[0] // block + 1
+    padded = np.full(((n_blocks + 1) * block,) + values.shape[1:], fill, dtype=values.dtype)
+    padded[:values.shape[0]] = values
+    blocks = padded.reshape((n_blocks + 1, block) + values.shape[1:])
+    return np.concatenate([blocks[:-1], blocks[1:]], axis=1)
+
+
+def block_spans(values, block: int):
+    """
+    把序列切成长度为 block 的块, 第 b 块的跨度为 [b * block, (b + 2) * block) (与下一块重叠),
+    因此任意长度不超过 block, 起点在第 b 块内的窗口都完整地落在第 b 块的跨度内.
+    :param values: 形状为 (n, ...) 的数组
+    :param block: 块长, 不小于最长的窗口
+    :return: (spans, reference): spans 形状为 (n // block + 1, 2 * block, ...), 超出序列的部分为 NaN;
+             reference 为每个跨度内第一个有效值, 没有有效值时为0
+    """
+    spans = _spans(np.asarray(values, dtype=np.float64), block, np.nan)
+    finite = np.isfinite(spans)
+    first = np.argmax(finite, axis=1)[:, None]
+    reference = np.where(finite.any(axis=1), np.take_along_axis(spans, first, axis=1)[:, 0], 0.0)
+    return spans, reference
+
+
+def span_cumsum0(values: np.ndarray) -> np.ndarray:
+    """
+    block_spans 的每个跨度内带前导0的累计和 (沿第1维).
+    """
+    out = np.empty((values.shape[0], values.shape[1] + 1) + values.shape[2:], dtype=np.float64)
+    out[:, 0] = 0.0
+    np.cumsum(values, axis=1, out=out[:, 1:])
+    return out
+
+
+def span_positions(starts, ends, block: int):
+    """
+    把窗口 [starts[i], ends[i]) 映射到 block_spans 的跨度: 窗口和为 cs[blocks, hi] - cs[blocks, lo].
+    :return: (blocks, lo, hi)
+    """
+    starts = np.asarray(starts, dtype=np.intp)
+    ends = np.asarray(ends, dtype=np.intp)
+    if np.any(ends - starts > block):
+        raise ValueError("window is longer than the cumulative sum block.")
+    blocks = starts // block
+    return blocks, starts - blocks * block, ends - blocks * block
+
+
+def block_cumsums(values, block: int, valid: np.ndarray = None):
+    """
+    分块重新居中的累计和: 每个跨度减去自己的参考值后做累计和, 窗口和的误差只取决于块长, 而不会随序列长度增长.
+    :param values: 形状为 (n, ...) 的数组
+    :param block: 块长, 不小于最长的窗口
+    :param valid: 可选的有效值掩码; 给出时无效值按0累计, 同时返回有效值计数的累计和
+    :return: (centered, cs, cs_sq, cs_valid, reference); centered 为减去参考值后的跨度数据 (用于计算交叉项),
+             valid 为 None 时 cs_valid 也为 None
+    """
+    spans, reference = block_spans(values, block)
+    centered = spans - reference[:, None]
+    cs_valid = None
+    if valid is not None:
+        valid_spans = _spans(np.asarray(valid, dtype=bool), block, False)
+        centered = np.where(valid_spans, centered, 0.0)
+        cs_valid = span_cumsum0(valid_spans.astype(np.float64))
+    return centered, span_cumsum0(centered), span_cumsum0(centered * centered), cs_valid, reference
+
+
+def centered_cumsums(series_a, series_b, block: int):
+    """
+    分块减去参考值后的累计矩 (见 block_cumsums), 长度不超过 block 的任意窗口的 Σx, Σy, Σx², Σxy 都可以由它们相减得到.
+    :param series_a: 被解释变量
+    :param series_b: 解释变量
+    :param block: 块长, 不小于最长的窗口
+    :return: (block, cs_x, cs_y, cs_xx, cs_xy, x_ref, y_ref), x_ref 和 y_ref 为每块的参考值
+    """
+    y = np.asarray(series_a, dtype=np.float64)
+    x = np.asarray(series_b, dtype=np.float64)
+    if x.shape != y.shape:
+        raise ValueError("seriesA and seriesB must have the same length.")
+
+    block = max(int(block), 1)
+    dx, cs_x, cs_xx, _, x_ref = block_cumsums(x, block)
+    dy, cs_y, _, _, y_ref = block_cumsums(y, block)
+    return block, cs_x, cs_y, cs_xx, span_cumsum0(dx * dy), x_ref, y_ref
+
+
+def window_sums(series_a, series_b, starts, ends, cumsums=None):
+    """
+    计算每个窗口 [starts[i], ends[i]) 内的 n, Σx, Σy, Σx², Σxy (x 为 series_b, y 为 series_a, 均已减去所在块的参考值).
+    :param series_a: 被解释变量
+    :param series_b: 解释变量
+    :param starts: 每个窗口的起始位置(包含)
+    :param ends: 每个窗口的结束位置(不包含)
+    :param cumsums: 已经计算好的 centered_cumsums(series_a, series_b, block), 多次调用时复用;
+                    None 时以最长的窗口为块长计算
+    :return: (n, sx, sy, sxx, sxy, x_ref, y_ref), x_ref 和 y_ref 为每个窗口的参考值
+    """
+    starts = np.asarray(starts, dtype=np.intp)
+    ends = np.asarray(ends, dtype=np.intp)
+    if cumsums is None:
+        cumsums = centered_cumsums(series_a, series_b, int((ends - starts).max(initial=1)))
+    block, cs_x, cs_y, cs_xx, cs_xy, x_ref, y_ref = cumsums
+
+    blocks, lo, hi = span_positions(starts, ends, block)
+    # 按展平后的位置取值, 比二维花式索引快
+    width = cs_x.shape[1]
+    lo = blocks * width + lo
+    hi = blocks * width + hi
+    n = (ends - starts).astype(np.float64)
+    sx, sy, sxx, sxy = (np.take(cs, hi) - np.take(cs, lo) for cs in (cs_x, cs_y, cs_xx, cs_xy))
+    return n, sx, sy, sxx, sxy, x_ref[blocks], y_ref[blocks]
+
+
+def solve_ols(n, sx, sy, sxx, sxy, x_ref=0.0, y_ref=0.0):
+    """
+    由窗口累计量求闭式解. 支持标量和数组(逐元素).
+    :return: (slope, intercept)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var_x = sxx - sx * sx / n
+        cov_xy = sxy - sx * sy / n
+        slope = np.where(var_x > 0, cov_xy / var_x, np.nan)
+        intercept = (sy - slope * sx) / n + y_ref - slope * x_ref
+    return slope, intercept
+
+
+def batch_ols_fit(series_a, series_b):
+    """
+    批量闭式OLS: 每一行是一个独立的样本 (一个窗口或一个配对), 一次调用拟合所有行.
+    先减去各行的均值再求和 (两遍法), 精度与 statsmodels 相当.
+    :param series_a: 被解释变量, 形状为 (k, n) 的二维数组
+    :param series_b: 解释变量, 形状为 (k, n) 的二维数组
+    :return: (slope, intercept), 形状均为 (k,)
+    """
+    y = np.asarray(series_a, dtype=np.float64)
+    x = np.asarray(series_b, dtype=np.float64)
+    mean_x = x.mean(axis=-1)
+    mean_y = y.mean(axis=-1)
+    dx = x - mean_x[..., None]
+    dy = y - mean_y[..., None]
+    var_x = np.einsum('...i,...i->...', dx, dx)
+    cov_xy = np.einsum('...i,...i->...', dx, dy)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(var_x > 0, cov_xy / var_x, np.nan)
+    intercept = mean_y - slope * mean_x
+    return slope, intercept
+
+
+def ols_fit(series_a, series_b):
+    """
+    单个样本的闭式OLS.
+    :return: (slope, intercept); series_b 方差为0时返回 NaN
+    """
+    slope, intercept = batch_ols_fit(series_a, series_b)
+    return float(slope), float(intercept)
+
+
+def rolling_ols(series_a, series_b, window: int):
+    """
+    对每一行 i, 用它之前的 window 个数据点 [i - window, i) 做OLS回归 (不包含第 i 行本身),
+    与 DiffCalculator.update_diff_and_equation 原有的窗口定义一致. 前 window 行没有足够的数据, 结果为 NaN.
+    :param series_a: 被解释变量 (symbol1)
+    :param series_b: 解释变量 (symbol2)
+    :param window: 窗口长度
+    :return: (slope, intercept), 长度与输入相同的 float64 数组
+    """
+    if window < 2:
+        raise ValueError("window must contain at least two data points for OLS regression.")
+
+    length = len(series_a)
+    slope = np.full(length, np.nan)
+    intercept = np.full(length, np.nan)
+    if length <= window:
+        return slope, intercept
+
+    ends = np.arange(window, length)
+    starts = ends - window
+    sums = window_sums(series_a, series_b, starts, ends)
+    slope[window:], intercept[window:] = solve_ols(*sums)
+    return slope, intercept
+
+
+def _as_nanoseconds(date_times) -> np.ndarray:
+    return np.asarray(date_times).astype('datetime64[ns]').astype(np.int64)
+
+
+def _duration_nanoseconds(duration) -> int:
+    duration = int(np.timedelta64(duration, 'ns').astype(np.int64))
+    if duration <= 0:
+        raise ValueError("window duration must be positive.")
+    return duration
+
+
+def rolling_ols_time(series_a, series_b, date_times, duration, origin=None):
+    """
+    基于时间的滚动OLS (用于不规则的 Tick 数据): 对每一行 i, 用时间在 [t_i - duration, t_i) 内且位于 i 之前的数据点做回归.
+    只有当数据的起始时间 <= t_i - duration (窗口被完整覆盖) 且窗口内至少有2个数据点时才有结果, 否则为 NaN.
+    :param series_a: 被解释变量 (symbol1)
+    :param series_b: 解释变量 (symbol2)
+    :param date_times: 按时间排序的时间戳
+    :param duration: 窗口时长, np.timedelta64 / datetime.timedelta / pd.Timedelta
+    :param origin: 数据的起始时间, None 表示 date_times[0]; 分块计算时传入整个历史的起始时间
+    :return: (slope, intercept), 长度与输入相同的 float64 数组
+    """
+    nanoseconds = _as_nanoseconds(date_times)
+    duration = _duration_nanoseconds(duration)
+    if len(nanoseconds) != len(series_a):
+        raise ValueError("date_times must have the same length as the series.")
+    if len(nanoseconds) > 1 and np.any(nanoseconds[1:] < nanoseconds[:-1]):
+        raise ValueError("date_times must be sorted for time-based windows.")
+
+    length = len(series_a)
+    slope = np.full(length, np.nan)
+    intercept = np.full(length, np.nan)
+    if length == 0:
+        return slope, intercept
+
+    origin = nanoseconds[0] if origin is None else int(_as_nanoseconds(origin))
+    cutoffs = nanoseconds - duration
+    starts = np.searchsorted(nanoseconds, cutoffs, side='left')
+    ends = np.arange(length)
+    valid = np.flatnonzero((cutoffs >= origin) & (ends - starts >= 2))
+    if len(valid):
+        slope[valid], intercept[valid] = solve_ols(*window_sums(series_a, series_b, starts[valid], ends[valid]))
+    return slope, intercept
+
+
+def _sweep_blocks(windows) -> dict:
+    """
+    从最长的窗口开始分组, 组内窗口共享以最长窗口为块长的累计矩.
+    :return: {window: block}
+    """
+    blocks = {}
+    block = None
+    for window in sorted(set(windows), reverse=True):
+        if block is None or window * SWEEP_BLOCK_RATIO < block:
+            block = window
+        blocks[window] = block
+    return blocks
+
+
+def rolling_ols_sweep(series_a, series_b, windows, n_jobs: int = 1, dtype=np.float64):
+    """
+    一次计算多个窗口长度的 rolling_ols: 长度相近 (相差不超过 SWEEP_BLOCK_RATIO 倍) 的窗口共享一组分块累计矩,
+    每个窗口只需要一次相减和闭式求解.
+    :param series_a: 被解释变量 (symbol1)
+    :param series_b: 解释变量 (symbol2)
+    :param windows: 窗口长度列表
+    :param n_jobs: 并行计算窗口的线程数, -1 表示使用全部CPU; numpy 运算期间释放GIL, 线程共享累计矩而无需复制
+    :param dtype: 结果的数据类型
+    :return: (slope, intercept), 形状均为 (len(windows), len(series_a)); 第 k 行与 rolling_ols(..., windows[k]) 相同
+    """
+    windows = [int(window) for window in windows]
+    if not windows:
+        raise ValueError("windows must contain at least one window length.")
+    if min(windows) < 2:
+        raise ValueError("window must contain at least two data points for OLS regression.")
+
+    length = len(series_a)
+    blocks = _sweep_blocks(windows)
+    cumsums = {block: centered_cumsums(series_a, series_b, block) for block in set(blocks.values())}
+    slope = np.full((len(windows), length), np.nan, dtype=dtype)
+    intercept = np.full((len(windows), length), np.nan, dtype=dtype)
+
+    def fit(k: int):
+        window = windows[k]
+        if length <= window:
+            return
+        ends = np.arange(window, length)
+        sums = window_sums(None, None, ends - window, ends, cumsums[blocks[window]])
+        slope[k, window:], intercept[k, window:] = solve_ols(*sums)
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs <= 1 or len(windows) == 1:
+        for k in range(len(windows)):
+            fit(k)
+    else:
+        with ThreadPoolExecutor(max_workers=min(n_jobs, len(windows))) as executor:
+            list(executor.map(fit, range(len(windows))))
+    return slope, intercept
+
+
+class WindowState:
+    """
+    窗口状态的导出和恢复 (用于快照): STATE_ARRAYS 为缓冲区数组, STATE_SCALARS 为位置和累计量.
+    恢复后的状态与导出时完全一致, 之后的计算结果逐位相同.
+    """
+    STATE_ARRAYS = ()
+    STATE_SCALARS = ()
+
+    def get_state(self) -> dict:
+        state = {name: getattr(self, name) for name in self.STATE_ARRAYS}
+        for name in self.STATE_SCALARS:
+            value = getattr(self, name)
+            state[name] = value.item() if isinstance(value, np.generic) else value
+        return state
+
+    def set_state(self, state: dict):
+        for name in self.STATE_ARRAYS:
+            setattr(self, name, np.array(state[name], dtype=getattr(self, name).dtype))
+        for name in self.STATE_SCALARS:
+            setattr(self, name, state[name])
+
+
+class RollingWindow(WindowState):
+    """
+    固定长度窗口的环形缓冲区, 维护回归所需的累计量 (Σx, Σy, Σx², Σxy), 每次 push 的代价为 O(1).
+    为了抑制长时间运行时浮点累计误差的漂移, 每 push window 次会根据缓冲区重新计算一次累计量 (均摊 O(1)).
+    """
+    STATE_ARRAYS = ('buffer_a', 'buffer_b')
+    STATE_SCALARS = ('head', 'count', 'x_ref', 'y_ref', 'sx', 'sy', 'sxx', 'sxy', '_pushes_since_resync')
+
+    def __init__(self, window: int):
+        if window < 2:
+            raise ValueError("window must contain at least two data points for OLS regression.")
+        self.window = window
+        self.buffer_a = np.empty(window, dtype=np.float64)
+        self.buffer_b = np.empty(window, dtype=np.float64)
+        self.head = 0  # 下一个写入位置, 也是窗口满时最旧的元素位置
+        self.count = 0
+        self.x_ref = 0.0
+        self.y_ref = 0.0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self._pushes_since_resync = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def is_full(self) -> bool:
+        return self.count == self.window
+
+    def _add(self, value_a: float, value_b: float, sign: float):
+        dx = value_b - self.x_ref
+        dy = value_a - self.y_ref
+        self.sx += sign * dx
+        self.sy += sign * dy
+        self.sxx += sign * dx * dx
+        self.sxy += sign * dx * dy
+
+    def push(self, value_a: float, value_b: float):
+        """
+        追加一个数据点, 窗口已满时淘汰最旧的数据点.
+        """
+        if self.count == 0:
+            self.x_ref = value_b
+            self.y_ref = value_a
+        if self.count == self.window:
+            self._add(self.buffer_a[self.head], self.buffer_b[self.head], -1.0)
+        else:
+            self.count += 1
+        self.buffer_a[self.head] = value_a
+        self.buffer_b[self.head] = value_b
+        self._add(value_a, value_b, 1.0)
+        self.head = (self.head + 1) % self.window
+
+        self._pushes_since_resync += 1
+        if self._pushes_since_resync >= self.window:
+            self.resync()
+
+    def replace_last(self, value_a: float, value_b: float):
+        """
+        修正最新的数据点 (同一时间戳的bar被更新).
+        """
+        if self.count == 0:
+            raise ValueError("RollingWindow is empty.")
+        last = (self.head - 1) % self.window
+        self._add(self.buffer_a[last], self.buffer_b[last], -1.0)
+        self.buffer_a[last] = value_a
+        self.buffer_b[last] = value_b
+        self._add(value_a, value_b, 1.0)
+
+    def values(self):
+        """
+        按时间顺序返回窗口内的数据 (series_a, series_b).
+        """
+        order = (np.arange(self.count) + self.head - self.count) % self.window
+        return self.buffer_a[order], self.buffer_b[order]
+
+    def resync(self):
+        """
+        以当前窗口的第一个数据点为参考值, 根据缓冲区重新计算累计量.
+        """
+        self._pushes_since_resync = 0
+        if self.count == 0:
+            return
+        series_a, series_b = self.values()
+        self.x_ref = float(series_b[0])
+        self.y_ref = float(series_a[0])
+        dx = series_b - self.x_ref
+        dy = series_a - self.y_ref
+        self.sx = float(dx.sum())
+        self.sy = float(dy.sum())
+        self.sxx = float(dx @ dx)
+        self.sxy = float(dx @ dy)
+
+    def seed(self, series_a, series_b):
+        """
+        用历史数据的最后 window 个数据点初始化窗口.
+        """
+        series_a = np.asarray(series_a, dtype=np.float64)[-self.window:]
+        series_b = np.asarray(series_b, dtype=np.float64)[-self.window:]
+        self.count = len(series_a)
+        self.buffer_a[:self.count] = series_a
+        self.buffer_b[:self.count] = series_b
+        self.head = self.count % self.window
+        self.resync()
+
+    def fit(self):
+        """
+        :return: (slope, intercept); 窗口内数据点少于2个时返回 NaN.
+        """
+        if self.count < 2:
+            return np.nan, np.nan
+        slope, intercept = solve_ols(float(self.count), self.sx, self.sy, self.sxx, self.sxy, self.x_ref, self.y_ref)
+        return float(slope), float(intercept)
+
+    def set_state(self, state: dict):
+        if len(state['buffer_a']) != self.window:
+            raise ValueError(f"Window state has length {len(state['buffer_a'])}, expected {self.window}.")
+        super().set_state(state)
+
+
+class TimeWindow(WindowState):
+    """
+    基于时间的窗口 (用于 Tick 数据): 按时间排序的环形缓冲区, 维护回归所需的累计量.
+    push 为 O(1); evict 淘汰早于 now - duration 的数据点, 每个数据点只会被淘汰一次 (均摊 O(1)).
+    缓冲区容量按需倍增, 只取决于一个窗口内最多的数据点数, 与历史长度无关.
+    为了抑制浮点累计误差, 每追加与窗口内数据点数相当的次数后重新计算一次累计量 (均摊 O(1)).
+    """
+    STATE_ARRAYS = ('buffer_t', 'buffer_a', 'buffer_b')
+    STATE_SCALARS = ('head', 'count', 'first_time', 'x_ref', 'y_ref', 'sx', 'sy', 'sxx', 'sxy',
+                     '_pushes_since_resync')
+
+    def __init__(self, duration, capacity: int = 1024):
+        """
+        :param duration: 窗口时长, np.timedelta64 / datetime.timedelta / pd.Timedelta
+        """
+        self.duration = _duration_nanoseconds(duration)
+        self.buffer_t = np.empty(capacity, dtype=np.int64)
+        self.buffer_a = np.empty(capacity, dtype=np.float64)
+        self.buffer_b = np.empty(capacity, dtype=np.float64)
+        self.head = 0  # 最旧的数据点的位置
+        self.count = 0
+        self.first_time = None  # 推入过的最早的时间, 用于判断窗口是否已被完整覆盖
+        self.x_ref = 0.0
+        self.y_ref = 0.0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+        self._pushes_since_resync = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self) -> int:
+        return len(self.buffer_t)
+
+    def _add(self, value_a: float, value_b: float, sign: float):
+        dx = value_b - self.x_ref
+        dy = value_a - self.y_ref
+        self.sx += sign * dx
+        self.sy += sign * dy
+        self.sxx += sign * dx * dx
+        self.sxy += sign * dx * dy
+
+    def _grow(self):
+        order = (np.arange(self.count) + self.head) % self.capacity
+        capacity = 2 * self.capacity
+        for name in ('buffer_t', 'buffer_a', 'buffer_b'):
+            grown = np.empty(capacity, dtype=getattr(self, name).dtype)
+            grown[:self.count] = getattr(self, name)[order]
+            setattr(self, name, grown)
+        self.head = 0
+
+    def push(self, nanoseconds: int, value_a: float, value_b: float):
+        """
+        追加一个数据点, 时间不能早于窗口内最新的数据点.
+        """
+        if self.count == 0:
+            self.x_ref = value_b
+            self.y_ref = value_a
+        if self.first_time is None:
+            self.first_time = nanoseconds
+        if self.count == self.capacity:
+            self._grow()
+        i = (self.head + self.count) % self.capacity
+        self.buffer_t[i] = nanoseconds
+        self.buffer_a[i] = value_a
+        self.buffer_b[i] = value_b
+        self._add(value_a, value_b, 1.0)
+        self.count += 1
+
+        self._pushes_since_resync += 1
+        if self._pushes_since_resync >= max(self.count, 64):
+            self.resync()
+
+    def evict(self, now: int):
+        """
+        淘汰时间早于 now - duration 的数据点.
+        """
+        cutoff = now - self.duration
+        buffer_t = self.buffer_t
+        while self.count and buffer_t[self.head] < cutoff:
+            self._add(self.buffer_a[self.head], self.buffer_b[self.head], -1.0)
+            self.head = (self.head + 1) % self.capacity
+            self.count -= 1
+        if self.count == 0:
+            self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def is_ready(self, now: int) -> bool:
+        """
+        窗口 [now - duration, now) 已被完整覆盖且至少有2个数据点.
+        """
+        return self.first_time is not None and self.first_time <= now - self.duration and self.count >= 2
+
+    def replace_last(self, value_a: float, value_b: float):
+        """
+        修正最新的数据点 (同一时间戳的tick被更新).
+        """
+        if self.count == 0:
+            raise ValueError("TimeWindow is empty.")
+        last = (self.head + self.count - 1) % self.capacity
+        self._add(self.buffer_a[last], self.buffer_b[last], -1.0)
+        self.buffer_a[last] = value_a
+        self.buffer_b[last] = value_b
+        self._add(value_a, value_b, 1.0)
+
+    def values(self):
+        """
+        按时间顺序返回窗口内的数据 (nanoseconds, series_a, series_b).
+        """
+        order = (np.arange(self.count) + self.head) % self.capacity
+        return self.buffer_t[order], self.buffer_a[order], self.buffer_b[order]
+
+    def resync(self):
+        """
+        以当前窗口的第一个数据点为参考值, 根据缓冲区重新计算累计量.
+        """
+        self._pushes_since_resync = 0
+        if self.count == 0:
+            return
+        _, series_a, series_b = self.values()
+        self.x_ref = float(series_b[0])
+        self.y_ref = float(series_a[0])
+        dx = series_b - self.x_ref
+        dy = series_a - self.y_ref
+        self.sx = float(dx.sum())
+        self.sy = float(dy.sum())
+        self.sxx = float(dx @ dx)
+        self.sxy = float(dx @ dy)
+
+    def seed(self, date_times, series_a, series_b):
+        """
+        用历史数据初始化窗口: 保留最后一个数据点之前 duration 以内的数据点.
+        """
+        nanoseconds = _as_nanoseconds(date_times)
+        if len(nanoseconds) == 0:
+            return
+        self.first_time = int(nanoseconds[0])
+        start = int(np.searchsorted(nanoseconds, nanoseconds[-1] - self.duration, side='left'))
+        count = len(nanoseconds) - start
+        capacity = self.capacity
+        while capacity < count:
+            capacity *= 2
+        self.buffer_t = np.empty(capacity, dtype=np.int64)
+        self.buffer_a = np.empty(capacity, dtype=np.float64)
+        self.buffer_b = np.empty(capacity, dtype=np.float64)
+        self.buffer_t[:count] = nanoseconds[start:]
+        self.buffer_a[:count] = np.asarray(series_a, dtype=np.float64)[start:]
+        self.buffer_b[:count] = np.asarray(series_b, dtype=np.float64)[start:]
+        self.head = 0
+        self.count = count
+        self.resync()
+
+    def fit(self):
+        """
+        :return: (slope, intercept); 窗口内数据点少于2个时返回 NaN.
+        """
+        if self.count < 2:
+            return np.nan, np.nan
+        slope, intercept = solve_ols(float(self.count), self.sx, self.sy, self.sxx, self.sxy, self.x_ref, self.y_ref)
+        return float(slope), float(intercept)
@@ -0,0 +1,290 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List
+import numpy as np
+from src.shared_lib.models.enums import ResolutionLevel
+from src.shared_lib.models.time_series import TimeSeries
+
+# 从 Second / Minute 级别的序列聚合出更粗的级别. 时间戳为无时区的交易所当地时间 (与 tests/data 和 data_source_service 一致),
+# 每个聚合后的bar以所在区间的起始时间作为时间戳.
+
+RESAMPLE_RESOLUTIONS = (ResolutionLevel.Minute, ResolutionLevel.Hourly, ResolutionLevel.Daily,
+                        ResolutionLevel.Weekly, ResolutionLevel.Monthly)
+AGGREGATIONS = ('last', 'first', 'max', 'min', 'sum', 'mean', 'count')
+
+_NS_PER_MINUTE = 60 * 10 ** 9
+_NS_PER_HOUR = 60 * _NS_PER_MINUTE
+_NS_PER_DAY = 24 * _NS_PER_HOUR
+
+
+def _parse_time_of_day(value) -> int:
+    """
+    'HH:MM' -> 当天的纳秒数.
+    """
+    hours, minutes = str(value).split(':')
+    return int(hours) * _NS_PER_HOUR + int(minutes) * _NS_PER_MINUTE
+
+
+def _weekday(days: np.ndarray) -> np.ndarray:
+    # 1970-01-01 是星期四; 星期一为0
+    return (days + 3) % 7
+
+
+class TradingCalendar(ABC):
+    """
+    交易日历: 决定哪些bar属于交易时段, 以及每个bar属于哪个聚合区间.
+    """
+    # Hourly 区间的起点相对整点的偏移, 纳秒
+    hourly_offset = 0
+
+    @abstractmethod
+    def session_mask(self, nanoseconds: np.ndarray) -> np.ndarray:
+        """
+        :param nanoseconds: int64 纳秒时间戳
+        :return: 属于交易时段的bar为 True
+        """
+        pass
+
+    def bucket_labels(self, nanoseconds: np.ndarray, resolution: ResolutionLevel) -> np.ndarray:
+        """
+        每个bar所属区间的起始时间 (int64 纳秒).
+        """
+        if resolution == ResolutionLevel.Minute:
+            return nanoseconds - nanoseconds % _NS_PER_MINUTE
+        if resolution == ResolutionLevel.Hourly:
+            shifted = nanoseconds - self.hourly_offset
+            return shifted - shifted % _NS_PER_HOUR + self.hourly_offset
+        days = nanoseconds // _NS_PER_DAY
+        if resolution == ResolutionLevel.Daily:
+            return days * _NS_PER_DAY
+        if resolution == ResolutionLevel.Weekly:
+            return (days - _weekday(days)) * _NS_PER_DAY
+        if resolution == ResolutionLevel.Monthly:
+            months = days.astype('datetime64[D]').astype('datetime64[M]')
+            return months.astype('datetime64[ns]').astype(np.int64)
+        raise ValueError(f"Unsupported resolution level for resampling: {resolution}")
+
+
+class ContinuousCalendar(TradingCalendar):
+    """
+    7x24 小时连续交易 (加密货币): 所有bar都属于交易时段, 区间按自然小时/日/周/月划分.
+    """
+
+    def session_mask(self, nanoseconds: np.ndarray) -> np.ndarray:
+        return np.ones(len(nanoseconds), dtype=bool)
+
+
+class SessionCalendar(TradingCalendar):
+    """
+    有固定交易时段的市场: 只保留交易日 [open_time, close_time) 内的bar, Hourly 区间从开盘时间起算 (如 09:30, 10:30, ...).
+    """
+
+    def __init__(self, open_time: str = '09:30', close_time: str = '16:00', weekdays: Iterable[int] = range(5),
+                 holidays: Iterable = ()):
+        """
+        :param open_time: 开盘时间 'HH:MM'
+        :param close_time: 收盘时间 'HH:MM'
+        :param weekdays: 交易的星期 (星期一为0)
+        :param holidays: 休市的日期
+        """
+        self.open_time = _parse_time_of_day(open_time)
+        self.close_time = _parse_time_of_day(close_time)
+        if self.close_time <= self.open_time:
+            raise ValueError("close_time must be later than open_time.")
+        self.weekdays = np.array(sorted(set(weekdays)), dtype=np.int64)
+        self.holidays = np.array(sorted(holidays), dtype='datetime64[D]').astype(np.int64)
+        self.hourly_offset = self.open_time % _NS_PER_HOUR
+
+    def session_mask(self, nanoseconds: np.ndarray) -> np.ndarray:
+        days = nanoseconds // _NS_PER_DAY
+        time_of_day = nanoseconds - days * _NS_PER_DAY
+        mask = (time_of_day >= self.open_time) & (time_of_day < self.close_time)
+        mask &= np.isin(_weekday(days), self.weekdays)
+        if len(self.holidays):
+            mask &= ~np.isin(days, self.holidays)
+        return mask
+
+
+SP500_CALENDAR = SessionCalendar('09:30', '16:00')
+CRYPTO_CALENDAR = ContinuousCalendar()
+
+
+def _validate_how(how: str):
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Unsupported aggregation: {how}; expected one of {AGGREGATIONS}")
+
+
+def _prepare(time_series: TimeSeries, calendar: TradingCalendar):
+    """
+    转换为排序后的 int64 纳秒时间戳和数值, 去掉 NaN 和交易时段之外的bar.
+    """
+    date_times, values = time_series.to_numpy()
+    nanoseconds = date_times.astype('datetime64[ns]').astype(np.int64)
+    valid = np.isfinite(values) & ~np.isnat(date_times)
+    if len(nanoseconds) > 1 and np.any(nanoseconds[1:] < nanoseconds[:-1]):
+        order = np.argsort(nanoseconds, kind='stable')
+        nanoseconds, values, valid = nanoseconds[order], values[order], valid[order]
+    valid &= calendar.session_mask(nanoseconds)
+    return nanoseconds[valid], values[valid]
+
+
+def _aggregate(labels: np.ndarray, values: np.ndarray, how: str):
+    """
+    对已排序的区间标签做分组聚合.
+    :return: (区间标签, 聚合值, bar数); how 为 'mean' 时聚合值为和, 由调用方除以bar数
+    """
+    if len(labels) == 0:
+        return labels, values, np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    counts = np.diff(np.r_[starts, len(labels)])
+    if how == 'last':
+        aggregated = values[starts + counts - 1]
+    elif how == 'first':
+        aggregated = values[starts]
+    elif how == 'max':
+        aggregated = np.maximum.reduceat(values, starts)
+    elif how == 'min':
+        aggregated = np.minimum.reduceat(values, starts)
+    elif how in ('sum', 'mean'):
+        aggregated = np.add.reduceat(values, starts)
+    else:
+        aggregated = counts.astype(np.float64)
+    return labels[starts], aggregated, counts
+
+
+def _combine(old: float, new: float, how: str) -> float:
+    """
+    把同一区间的两段聚合结果合并 (区间跨越了两次更新).
+    """
+    if how == 'last':
+        return new
+    if how == 'first':
+        return old
+    if how == 'max':
+        return max(old, new)
+    if how == 'min':
+        return min(old, new)
+    return old + new
+
+
+def resample(time_series: TimeSeries, resolution: ResolutionLevel, calendar: TradingCalendar = CRYPTO_CALENDAR,
+             how: str = 'last') -> TimeSeries:
+    """
+    把细粒度的序列聚合到 resolution 级别, 一次向量化计算.
+    :param time_series: Second / Minute 级别的序列
+    :param resolution: 目标级别, 见 RESAMPLE_RESOLUTIONS
+    :param calendar: SP500_CALENDAR, CRYPTO_CALENDAR 或自定义日历
+    :param how: 聚合方式, 见 AGGREGATIONS; 价格序列通常取 'last' (收盘价)
+    """
+    _validate_how(how)
+    nanoseconds, values = _prepare(time_series, calendar)
+    labels, aggregated, counts = _aggregate(calendar.bucket_labels(nanoseconds, resolution), values, how)
+    if how == 'mean':
+        aggregated = aggregated / counts
+    return TimeSeries.from_numpy(labels.astype('datetime64[ns]'), aggregated)
+
+
+class _Tier:
+    """
+    一个级别的缓存: 可增长的区间标签, 聚合值和bar数数组. 最后一个区间可能还未结束, 新的bar会合并进去.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.labels = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.counts = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def _reserve(self, size: int):
+        if size <= len(self.labels):
+            return
+        capacity = max(size, 2 * len(self.labels))
+        for name in ('labels', 'values', 'counts'):
+            array = getattr(self, name)
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, name, grown)
+
+    def merge(self, labels: np.ndarray, values: np.ndarray, counts: np.ndarray, how: str):
+        if len(labels) == 0:
+            return
+        if self.size and labels[0] == self.labels[self.size - 1]:
+            last = self.size - 1
+            self.values[last] = _combine(self.values[last], values[0], how)
+            self.counts[last] += counts[0]
+            labels, values, counts = labels[1:], values[1:], counts[1:]
+        self._reserve(self.size + len(labels))
+        end = self.size + len(labels)
+        self.labels[self.size:end] = labels
+        self.values[self.size:end] = values
+        self.counts[self.size:end] = counts
+        self.size = end
+
+
+class MultiResolutionCache:
+    """
+    多级别的聚合缓存: 每个级别只在导入新的细粒度bar时增量更新, 不重新聚合全部历史.
+    新的bar必须晚于已导入的最后一个bar.
+    """
+
+    def __init__(self, calendar: TradingCalendar = CRYPTO_CALENDAR,
+                 resolutions: Iterable[ResolutionLevel] = (ResolutionLevel.Hourly, ResolutionLevel.Daily,
+                                                           ResolutionLevel.Weekly, ResolutionLevel.Monthly),
+                 how: str = 'last'):
+        """
+        :param calendar: 交易日历
+        :param resolutions: 需要缓存的级别
+        :param how: 聚合方式, 见 AGGREGATIONS
+        """
+        _validate_how(how)
+        resolutions = list(resolutions)
+        for resolution in resolutions:
+            if resolution not in RESAMPLE_RESOLUTIONS:
+                raise ValueError(f"Unsupported resolution level for resampling: {resolution}")
+        self.calendar = calendar
+        self.how = how
+        self.resolutions: List[ResolutionLevel] = resolutions
+        self._tiers: Dict[ResolutionLevel, _Tier] = {resolution: _Tier() for resolution in resolutions}
+        self._last_nanoseconds = None
+
+    @property
+    def last_date_time(self):
+        """
+        已导入的最后一个bar的时间, 没有时返回 None.
+        """
+        return None if self._last_nanoseconds is None else np.datetime64(self._last_nanoseconds, 'ns')
+
+    def update(self, time_series: TimeSeries):
+        """
+        导入一批新的细粒度bar, 并增量更新每个级别的缓存.
+        """
+        nanoseconds, values = _prepare(time_series, self.calendar)
+        if len(nanoseconds) == 0:
+            return
+        if self._last_nanoseconds is not None and nanoseconds[0] <= self._last_nanoseconds:
+            raise ValueError(f"Out-of-order bars: {np.datetime64(int(nanoseconds[0]), 'ns')} <= {self.last_date_time}")
+        for resolution, tier in self._tiers.items():
+            labels = self.calendar.bucket_labels(nanoseconds, resolution)
+            tier.merge(*_aggregate(labels, values, self.how), self.how)
+        self._last_nanoseconds = int(nanoseconds[-1])
+
+    def append_value(self, date_time, value: float):
+        """
+        导入单个bar.
+        """
+        self.update(TimeSeries.from_numpy(np.array([date_time], dtype='datetime64[ns]'),
+                                          np.array([value], dtype=np.float64)))
+
+    def get(self, resolution: ResolutionLevel, include_partial: bool = True) -> TimeSeries:
+        """
+        :param resolution: 缓存的级别之一
+        :param include_partial: False 时不包括最后一个 (可能尚未结束的) 区间
+        :return: 该级别的序列; 'mean' 以外的聚合方式返回缓存的视图, 不复制数据
+        """
+        if resolution not in self._tiers:
+            raise ValueError(f"Resolution level {resolution} is not cached; cached levels: {self.resolutions}")
+        tier = self._tiers[resolution]
+        size = tier.size if include_partial else max(0, tier.size - 1)
+        values = tier.values[:size]
+        if self.how == 'mean':
+            values = values / tier.counts[:size]
+        return TimeSeries.from_numpy(tier.labels[:size].view('datetime64[ns]'), values)
@@ -0,0 +1,254 @@
+import json
+import os
+import re
+import shutil
+import time
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from src.shared_lib.bll.regression import rolling_ols
+from src.shared_lib.models.enums import ResolutionLevel
+
+CACHE_VERSION = 1
+
+
+class SpreadCache:
+    """
+    计算结果 (价格, slope, intercept, diff) 的持久化缓存, 以 (symbol1, symbol2, resolution, FixedWindowLength) 为键.
+
+    每个键一个目录, 每列一个只追加的二进制文件, meta.json 中的行数为准; 读取时用 np.memmap 按时间范围只加载需要的部分.
+    新的bar到达时, refresh 只重新计算最后一个缓存时间戳之后的部分 (加上窗口预热所需的数据);
+    缓存中的价格或时间戳与新数据不一致时 (历史被修正或有迟到的bar), 从第一个不一致的行开始重新计算.
+    """
+    COLUMNS = {'date_time': np.int64, 'value_a': np.float64, 'value_b': np.float64,
+               'slope': np.float64, 'intercept': np.float64, 'diff': np.float64}
+
+    def __init__(self, root_dir: str, max_bytes: int = None, max_age: timedelta = None):
+        """
+        :param root_dir: 缓存目录
+        :param max_bytes: 缓存总大小上限, 超出时按最近访问时间淘汰; None 表示不限制
+        :param max_age: 超过该时间未访问的条目会被淘汰; None 表示不限制
+        """
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(root_dir, exist_ok=True)
+
+    @staticmethod
+    def key(symbol1: str, symbol2: str, resolution: ResolutionLevel, window: int) -> str:
+        safe = [re.sub(r'[^A-Za-z0-9._-]', '_', symbol) for symbol in (symbol1, symbol2)]
+        return f"{safe[0]}__{safe[1]}__{resolution.value}__{window}"
+
+    @classmethod
+    def key_for(cls, calculator) -> str:
+        return cls.key(calculator.symbol1, calculator.symbol2, calculator.resolution, calculator.FixedWindowLength)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root_dir, key)
+
+    def _read_meta(self, key: str):
+        path = os.path.join(self._entry_dir(key), 'meta.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != CACHE_VERSION:
+            return None
+        return meta
+
+    def _write_meta(self, key: str, meta: dict):
+        path = os.path.join(self._entry_dir(key), 'meta.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    def _touch(self, key: str, meta: dict):
+        meta['last_access'] = time.time()
+        self._write_meta(key, meta)
+
+    def _column(self, key: str, name: str, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.empty(0, dtype=self.COLUMNS[name])
+        return np.memmap(os.path.join(self._entry_dir(key), f'{name}.bin'), dtype=self.COLUMNS[name],
+                         mode='r', shape=(rows,))
+
+    def rows(self, key: str) -> int:
+        meta = self._read_meta(key)
+        return meta['rows'] if meta else 0
+
+    def last_timestamp(self, key: str):
+        """
+        :return: 最后一个缓存的时间戳 (np.datetime64), 没有缓存时返回 None
+        """
+        rows = self.rows(key)
+        if rows == 0:
+            return None
+        return self._column(key, 'date_time', rows)[-1].astype('datetime64[ns]')
+
+    def truncate(self, key: str, rows: int):
+        """
+        只保留前 rows 行; 文件中多余的数据在下一次 append 时截掉.
+        """
+        meta = self._read_meta(key)
+        if meta is None or rows >= meta['rows']:
+            return
+        if rows == 0:
+            self.invalidate(key)
+            return
+        meta['rows'] = rows
+        self._write_meta(key, meta)
+
+    def append(self, key: str, columns: dict):
+        """
+        追加计算结果; 时间戳必须晚于最后一个缓存的时间戳.
+        :param columns: COLUMNS 中每一列对应一个等长的数组
+        """
+        date_times = np.asarray(columns['date_time']).astype('datetime64[ns]').view(np.int64)
+        if date_times.size == 0:
+            return
+        meta = self._read_meta(key)
+        if meta is None:
+            self.invalidate(key)
+            os.makedirs(self._entry_dir(key), exist_ok=True)
+            meta = {'version': CACHE_VERSION, 'rows': 0}
+        rows = meta['rows']
+        if rows and date_times[0] <= self._column(key, 'date_time', rows)[-1]:
+            raise ValueError("Appended rows must be later than the last cached timestamp.")
+
+        for name, dtype in self.COLUMNS.items():
+            values = date_times if name == 'date_time' else np.asarray(columns[name], dtype=dtype)
+            path = os.path.join(self._entry_dir(key), f'{name}.bin')
+            # 以 meta 中的行数为准, 截掉上次中断写入留下的多余数据
+            with open(path, 'ab') as f:
+                f.truncate(rows * np.dtype(dtype).itemsize)
+                f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+        meta['rows'] = rows + len(date_times)
+        self._touch(key, meta)
+        self.evict(keep=key)
+
+    def read(self, key: str, start=None, end=None) -> DataFrame:
+        """
+        读取 [start, end] 时间范围内的缓存, 只加载该范围的数据.
+        :return: 以 date_time 为 index, 包含 value_a, value_b, slope, intercept, diff 列的 DataFrame
+        """
+        meta = self._read_meta(key)
+        rows = meta['rows'] if meta else 0
+        date_times = self._column(key, 'date_time', rows)
+        lo = 0 if start is None else int(np.searchsorted(date_times, pd.Timestamp(start).value, side='left'))
+        hi = rows if end is None else int(np.searchsorted(date_times, pd.Timestamp(end).value, side='right'))
+        df = DataFrame({name: np.array(self._column(key, name, rows)[lo:hi])
+                        for name in self.COLUMNS if name != 'date_time'},
+                       index=pd.DatetimeIndex(np.array(date_times[lo:hi]).view('datetime64[ns]'), name='date_time'))
+        if meta:
+            self._touch(key, meta)
+        return df
+
+    def refresh(self, calculator) -> DataFrame:
+        """
+        用缓存填充 calculator.df 的 slope, intercept, diff 列, 只计算最后一个缓存时间戳之后的新行并写回缓存.
+        缓存的时间戳或价格与 calculator.df 不一致时 (历史数据被修正, 或最后一个缓存时间戳之前有迟到的bar),
+        缓存从第一个不一致的行截断, 之后的行重新计算.
+        :return: calculator.df
+        """
+        if calculator.WindowDuration is not None:
+            raise ValueError("SpreadCache only supports fixed-length windows, not time-based (Tick) windows.")
+        key = self.key_for(calculator)
+        window = calculator.FixedWindowLength
+        df = calculator.df
+        if calculator.symbol1 not in df.columns or calculator.symbol2 not in df.columns:
+            raise ValueError(f"DataFrame must contain columns for {calculator.symbol1} and {calculator.symbol2}.")
+
+        date_times = df.index.to_numpy(dtype='datetime64[ns]')
+        series_a = df[calculator.symbol1].to_numpy(dtype=np.float64)
+        series_b = df[calculator.symbol2].to_numpy(dtype=np.float64)
+
+        start = self._matching_prefix(key, date_times, series_a, series_b)
+
+        # 只计算新行: 从 start - window 开始的数据足以得到 start 之后每一行的窗口
+        offset = max(0, start - window)
+        slope_tail, intercept_tail = rolling_ols(series_a[offset:], series_b[offset:], window)
+        slope_tail, intercept_tail = slope_tail[start - offset:], intercept_tail[start - offset:]
+        diff_tail = series_a[start:] - (slope_tail * series_b[start:] + intercept_tail)
+        self.append(key, {'date_time': date_times[start:], 'value_a': series_a[start:], 'value_b': series_b[start:],
+                          'slope': slope_tail, 'intercept': intercept_tail, 'diff': diff_tail})
+
+        slope = np.full(len(df), np.nan)
+        intercept = np.full(len(df), np.nan)
+        if start > 0:
+            # 前 start 行与缓存中从 date_times[0] 开始的行一一对应
+            cached = self.read(key, date_times[0], date_times[start - 1])
+            slope[:start] = cached['slope'].to_numpy()
+            intercept[:start] = cached['intercept'].to_numpy()
+        slope[start:] = slope_tail
+        intercept[start:] = intercept_tail
+
+        df['slope'] = slope
+        df['intercept'] = intercept
+        df['diff'] = series_a - (slope * series_b + intercept)
+        if calculator.streaming:
+            calculator.enable_streaming()
+        return df
+
+    def _matching_prefix(self, key: str, date_times: np.ndarray, series_a: np.ndarray, series_b: np.ndarray) -> int:
+        """
+        比较缓存中从 date_times[0] 开始的行与新数据的时间戳和价格 (内存映射, 逐列向量化比较),
+        把缓存截断到第一个不一致的行.
+        :return: 与缓存一致的行数, 之后的行需要重新计算
+        """
+        rows = self.rows(key)
+        if rows == 0 or len(date_times) == 0:
+            return 0
+        cached_times = self._column(key, 'date_time', rows)
+        first = int(np.searchsorted(cached_times, date_times[0].astype(np.int64), side='left'))
+        length = min(rows - first, len(date_times))
+        same = cached_times[first:first + length] == date_times[:length].astype(np.int64)
+        for name, values in (('value_a', series_a), ('value_b', series_b)):
+            cached = self._column(key, name, rows)[first:first + length]
+            same &= (cached == values[:length]) | (np.isnan(cached) & np.isnan(values[:length]))
+        mismatch = np.flatnonzero(~same)
+        matched = int(mismatch[0]) if len(mismatch) else length
+        if matched < length:
+            self.truncate(key, first + matched)
+        return matched
+
+    def invalidate(self, key: str):
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def entries(self):
+        """
+        :return: [(key, 字节数, 最近访问时间), ...]
+        """
+        result = []
+        for key in os.listdir(self.root_dir):
+            meta = self._read_meta(key)
+            if meta is None:
+                continue
+            entry_dir = self._entry_dir(key)
+            size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+            result.append((key, size, meta.get('last_access', 0.0)))
+        return result
+
+    def evict(self, keep: str = None):
+        """
+        先淘汰超过 max_age 未访问的条目, 再按最近访问时间从旧到新淘汰, 直到总大小不超过 max_bytes.
+        :param keep: 不参与淘汰的键 (例如刚刚写入的条目)
+        """
+        if self.max_bytes is None and self.max_age is None:
+            return
+        entries = sorted((entry for entry in self.entries() if entry[0] != keep), key=lambda entry: entry[2])
+        if self.max_age is not None:
+            cutoff = time.time() - self.max_age.total_seconds()
+            for key, _, last_access in entries:
+                if last_access < cutoff:
+                    self.invalidate(key)
+            entries = [entry for entry in entries if entry[2] >= cutoff]
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in entries) + sum(size for key, size, _ in self.entries() if key == keep)
+            for key, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                self.invalidate(key)
+                total -= size
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterable, Dict, List
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculator
+from src.shared_lib.models.time_series import TimeSeries, TimeSeriesElement
+
+logger = logging.getLogger(__name__)
+
+
+class Bar:
+    __slots__ = ('symbol', 'date_time', 'value', 'received_at')
+
+    def __init__(self, symbol: str, date_time, value: float, received_at: float = None):
+        self.symbol = symbol
+        self.date_time = date_time
+        self.value = value
+        self.received_at = time.perf_counter() if received_at is None else received_at
+
+    def __str__(self):
+        return f"Symbol: {self.symbol}, DateTime: {self.date_time}, Value: {self.value}"
+
+
+class SpreadUpdate:
+    __slots__ = ('symbol1', 'symbol2', 'date_time', 'slope', 'intercept', 'diff', 'coalesced', 'latency')
+
+    def __init__(self, symbol1: str, symbol2: str, date_time, slope: float, intercept: float, diff: float,
+                 coalesced: int = 0, latency: float = 0.0):
+        self.symbol1 = symbol1
+        self.symbol2 = symbol2
+        self.date_time = date_time
+        self.slope = slope
+        self.intercept = intercept
+        self.diff = diff
+        self.coalesced = coalesced  # 被合并 (未单独输出) 的更新数
+        self.latency = latency  # 从收到触发的bar到输出的时间, 秒
+
+    def __str__(self):
+        return f"{self.symbol1}/{self.symbol2} DateTime: {self.date_time}, Diff: {self.diff}"
+
+
+async def simulated_feed(time_series_by_symbol: Dict[str, TimeSeries], delay: float = 0.0):
+    """
+    本地模拟行情: 把多个标的的序列按时间合并后逐个输出 Bar.
+    :param time_series_by_symbol: {symbol: TimeSeries}
+    :param delay: 每个bar之间的等待时间, 秒; None 表示不让出事件循环 (模拟突发行情)
+    """
+    symbols = list(time_series_by_symbol)
+    date_times = np.concatenate([time_series_by_symbol[symbol].date_times.astype('datetime64[ns]')
+                                 for symbol in symbols])
+    values = np.concatenate([time_series_by_symbol[symbol].values for symbol in symbols])
+    owners = np.repeat(np.arange(len(symbols)), [len(time_series_by_symbol[symbol]) for symbol in symbols])
+    order = np.argsort(date_times, kind='stable')
+    for date_time, value, owner in zip(date_times[order].astype('datetime64[us]').tolist(),
+                                       values[order].tolist(), owners[order].tolist()):
+        yield Bar(symbols[owner], date_time, value)
+        if delay is not None:
+            await asyncio.sleep(delay)
+
+
+class _Subscription:
+    __slots__ = ('calculator', 'pending', 'wakeup', 'drained', 'idle', 'worker')
+
+    def __init__(self, calculator: DiffCalculator):
+        self.calculator = calculator
+        self.worker: asyncio.Task = None  # 由 SpreadPipeline.run 创建的工作协程
+        self.pending = deque()
+        self.wakeup = asyncio.Event()  # 有新的待处理配对
+        self.drained = asyncio.Event()  # 待处理队列已被取走, 用于背压
+        self.idle = asyncio.Event()  # 所有配对都已处理且结果已输出
+        self.drained.set()
+        self.idle.set()
+
+
+class SpreadPipeline:
+    """
+    把行情 bar 分发给订阅了该标的的所有 DiffCalculator, 按时间戳配对两条腿后交给计算器, 并把价差更新输出到队列.
+
+    - 每个计算器有自己的待处理队列和工作协程, 路由的代价只与订阅该标的的计算器数量有关;
+    - 计算器落后时, 工作协程一次处理所有待处理的配对, coalesce 为 True 时只输出最后一个更新;
+    - 某个计算器的待处理配对达到 max_pending 时, 路由会等待它处理完 (背压), 输出队列满时工作协程同样会等待;
+    - 每个标的缓存最近 max_lag 个时间戳的 bar, 一条腿领先另一条腿不超过 max_lag 个bar时仍能配对;
+      更早的 bar 被淘汰, 其中从未配对过的计入 stale_bars.
+    输入结束且所有配对处理完后, 向输出队列放入 None 作为结束标志.
+    计算器抛出 ValueError 以外的异常时, 工作协程退出, 异常由 run (以及之后的 route) 抛出, 而不是让路由永远等待.
+    """
+
+    def __init__(self, calculators: List[DiffCalculator], output_queue: asyncio.Queue = None,
+                 max_pending: int = 1000, coalesce: bool = True, max_lag: int = 100):
+        """
+        :param max_lag: 每个标的缓存的待配对 bar 数
+        """
+        if max_lag < 1:
+            raise ValueError("max_lag must be at least 1.")
+        self.output_queue = output_queue if output_queue is not None else asyncio.Queue(maxsize=10000)
+        self.max_pending = max_pending
+        self.max_lag = max_lag
+        self.coalesce = coalesce
+        self.subscriptions: List[_Subscription] = [_Subscription(calculator) for calculator in calculators]
+        self._by_symbol: Dict[str, List[_Subscription]] = {}
+        for subscription in self.subscriptions:
+            for symbol in (subscription.calculator.symbol1, subscription.calculator.symbol2):
+                self._by_symbol.setdefault(symbol, []).append(subscription)
+        # 每个标的最近的 bar, 所有计算器共享: {symbol: {date_time: [bar, 配对次数]}}, 按到达顺序排列
+        self._bars: Dict[str, Dict[object, list]] = {}
+        self.stale_bars = 0  # 被淘汰时从未配对过的 bar 数
+
+    def _buffer(self, bar: Bar) -> list:
+        """
+        缓存 bar (同一时间戳的 bar 被修正值代替), 超过 max_lag 个时间戳时淘汰最早的.
+        :return: bar 的缓存项
+        """
+        bars = self._bars.setdefault(bar.symbol, {})
+        entry = bars.get(bar.date_time)
+        if entry is not None:
+            entry[0] = bar
+            return entry
+        entry = bars[bar.date_time] = [bar, 0]
+        if len(bars) > self.max_lag:
+            _, paired = bars.pop(next(iter(bars)))
+            if not paired:
+                self.stale_bars += 1
+        return entry
+
+    async def route(self, bar: Bar):
+        """
+        处理一个 bar: 与另一条腿同一时间戳的 bar 配对后放入计算器的待处理队列.
+        另一条腿的 bar 还没有到达时, 由它到达时完成配对.
+        """
+        entry = self._buffer(bar)
+        for subscription in self._by_symbol.get(bar.symbol, ()):
+            self._check_worker(subscription)
+            calculator = subscription.calculator
+            other_symbol = calculator.symbol2 if bar.symbol == calculator.symbol1 else calculator.symbol1
+            other = self._bars.get(other_symbol, {}).get(bar.date_time)
+            if other is None:
+                continue
+            entry[1] += 1
+            other[1] += 1
+            bar1, bar2 = (bar, other[0]) if bar.symbol == calculator.symbol1 else (other[0], bar)
+            subscription.pending.append((bar1, bar2))
+            subscription.drained.clear()
+            subscription.idle.clear()
+            subscription.wakeup.set()
+            if len(subscription.pending) >= self.max_pending:
+                await self._wait(subscription, subscription.drained)
+
+    @staticmethod
+    def _check_worker(subscription: _Subscription):
+        """
+        工作协程已经异常退出时抛出它的异常.
+        """
+        worker = subscription.worker
+        if worker is not None and worker.done():
+            worker.result()
+            raise RuntimeError(f"Worker for {subscription.calculator.symbol1}/{subscription.calculator.symbol2} "
+                               f"has stopped.")
+
+    async def _wait(self, subscription: _Subscription, event: asyncio.Event):
+        """
+        等待 event, 工作协程先退出时抛出它的异常.
+        """
+        if subscription.worker is None:
+            await event.wait()
+            return
+        self._check_worker(subscription)
+        waiter = asyncio.ensure_future(event.wait())
+        done, _ = await asyncio.wait({waiter, subscription.worker}, return_when=asyncio.FIRST_COMPLETED)
+        if waiter not in done:
+            waiter.cancel()
+            self._check_worker(subscription)
+
+    async def _work(self, subscription: _Subscription):
+        calculator = subscription.calculator
+        try:
+            while True:
+                await subscription.wakeup.wait()
+                subscription.wakeup.clear()
+                batch = list(subscription.pending)
+                subscription.pending.clear()
+                subscription.drained.set()
+
+                updates = []
+                for bar1, bar2 in batch:
+                    try:
+                        calculator.update_time_series_element(TimeSeriesElement(bar1.date_time, bar1.value),
+                                                              TimeSeriesElement(bar2.date_time, bar2.value))
+                    except ValueError as e:
+                        logger.warning(f"Skipped bar for {calculator.symbol1}/{calculator.symbol2}: {e}")
+                        continue
+                    result = calculator.last_result()
+                    if result is not None:
+                        updates.append((result, max(bar1.received_at, bar2.received_at)))
+
+                if self.coalesce and len(updates) > 1:
+                    updates = [(updates[-1][0], updates[-1][1], len(updates) - 1)]
+                else:
+                    updates = [(result, received_at, 0) for result, received_at in updates]
+                for (date_time, slope, intercept, diff), received_at, coalesced in updates:
+                    await self.output_queue.put(SpreadUpdate(calculator.symbol1, calculator.symbol2, date_time,
+                                                             slope, intercept, diff, coalesced,
+                                                             time.perf_counter() - received_at))
+                if not subscription.pending:
+                    subscription.idle.set()
+                # 让出事件循环, 避免一个计算器长期占用
+                await asyncio.sleep(0)
+        finally:
+            # 工作协程退出时解除路由的背压等待
+            subscription.drained.set()
+
+    async def run(self, bars: AsyncIterable[Bar]):
+        """
+        消费行情直到结束.
+        """
+        workers = []
+        for subscription in self.subscriptions:
+            subscription.worker = asyncio.create_task(self._work(subscription))
+            workers.append(subscription.worker)
+        try:
+            async for bar in bars:
+                await self.route(bar)
+            # 等待所有计算器处理完; 工作协程异常退出时直接抛出
+            for subscription in self.subscriptions:
+                await self._wait(subscription, subscription.idle)
+        finally:
+            for subscription in self.subscriptions:
+                subscription.worker = None
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        await self.output_queue.put(None)
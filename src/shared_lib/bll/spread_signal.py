@@ -0,0 +1,490 @@
+from collections import deque
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+from src.shared_lib.bll.regression import block_cumsums, span_positions, WindowState
+from src.shared_lib.models.enums import SignalType
+
+# 每行处理之后的状态编码: 持仓 -1 / 0 / 1, 止损之后等待 |z| 回到 exit 以内时为 _STOPPED
+_STOPPED = 2
+
+
+def rolling_zscore(diff, window: int, ddof: int = 1):
+    """
+    价差的滚动均值, 标准差和 z-score, 与 pandas 的 rolling(window).mean() / .std(ddof) 一致:
+    第 i 行使用 [i - window + 1, i] 的数据 (包含当前行), 窗口内有 NaN 时结果为 NaN.
+    累计和分块重新居中 (见 regression.block_cumsums), 误差不随序列长度增长;
+    窗口内所有值相同时标准差精确为0 (z-score 为 NaN), 与 RollingZScore 一致.
+    :param diff: 价差序列
+    :param window: 窗口长度
+    :param ddof: 标准差的自由度修正, 1 为样本标准差
+    :return: (mean, std, zscore), 长度与输入相同的 float64 数组
+    """
+    if window <= ddof:
+        raise ValueError("window must be larger than ddof.")
+    diff = np.asarray(diff, dtype=np.float64)
+    length = len(diff)
+    mean = np.full(length, np.nan)
+    std = np.full(length, np.nan)
+    if length < window:
+        return mean, std, mean.copy()
+
+    finite = np.isfinite(diff)
+    _, cs, cs_sq, cs_valid, reference = block_cumsums(diff, window, finite)
+
+    ends = np.arange(window, length + 1)
+    starts = ends - window
+    blocks, lo, hi = span_positions(starts, ends, window)
+    valid = (cs_valid[blocks, hi] - cs_valid[blocks, lo]) == window
+    total = cs[blocks, hi] - cs[blocks, lo]
+    total_sq = cs_sq[blocks, hi] - cs_sq[blocks, lo]
+    centered_mean = total / window
+    variance = np.maximum(total_sq - total * centered_mean, 0.0) / (window - ddof)
+
+    # 平坦的窗口: 相邻值的变化次数为0 (整数累计, 没有舍入误差)
+    changes = np.zeros(length + 1, dtype=np.int64)
+    np.cumsum(diff[1:] != diff[:-1], out=changes[2:])
+    flat = changes[ends] == changes[starts + 1]
+    last = diff[window - 1:]
+
+    mean[window - 1:] = np.where(valid, np.where(flat, last, centered_mean + reference[blocks]), np.nan)
+    std[window - 1:] = np.where(valid, np.where(flat, 0.0, np.sqrt(variance)), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = np.where(std > 0, (diff - mean) / std, np.nan)
+    return mean, std, zscore
+
+
+class RollingZScore(WindowState):
+    """
+    固定窗口的增量均值和方差 (Welford 算法的滑动窗口形式), 每次 push 的代价为 O(1).
+    窗口包含当前值; 遇到 NaN 时清空窗口, 与 pandas rolling 在窗口内有 NaN 时返回 NaN 的行为一致.
+    每 push window 次根据缓冲区重新计算一次, 抑制浮点误差的累积.
+    另外记录末尾连续相同值的个数, 窗口内所有值相同时标准差精确为0, 与 rolling_zscore 一致.
+    """
+    STATE_ARRAYS = ('buffer',)
+    STATE_SCALARS = ('head', 'count', 'mean', 'm2', '_run', '_pushes_since_resync')
+
+    def __init__(self, window: int, ddof: int = 1):
+        if window <= ddof:
+            raise ValueError("window must be larger than ddof.")
+        self.window = window
+        self.ddof = ddof
+        self.buffer = np.empty(window, dtype=np.float64)
+        self.head = 0  # 下一个写入位置, 也是窗口满时最旧的元素位置
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # 与均值之差的平方和
+        self._run = 0  # 末尾连续相同值的个数
+        self._pushes_since_resync = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def is_full(self) -> bool:
+        return self.count == self.window
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self._run = 0
+        self._pushes_since_resync = 0
+
+    def push(self, value: float):
+        if value != value:
+            self.reset()
+            return
+        self._run = self._run + 1 if self.count and value == self.buffer[(self.head - 1) % self.window] else 1
+        if self.count == self.window:
+            old = self.buffer[self.head]
+            old_mean = self.mean
+            self.mean = old_mean + (value - old) / self.window
+            self.m2 += (value - old) * (value - self.mean + old - old_mean)
+        else:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        self.buffer[self.head] = value
+        self.head = (self.head + 1) % self.window
+
+        self._pushes_since_resync += 1
+        if self._pushes_since_resync >= self.window:
+            self.resync()
+
+    def replace_last(self, value: float):
+        """
+        修正最新的值 (同一时间戳的bar被更新).
+        """
+        if self.count == 0:
+            raise ValueError("RollingZScore is empty.")
+        if value != value:
+            self.reset()
+            return
+        last = (self.head - 1) % self.window
+        self.buffer[last] = value
+        self.resync()
+
+    def values(self) -> np.ndarray:
+        """
+        按时间顺序返回窗口内的值.
+        """
+        return self.buffer[(np.arange(self.count) + self.head - self.count) % self.window]
+
+    def resync(self):
+        self._pushes_since_resync = 0
+        if self.count == 0:
+            return
+        values = self.values()
+        self.mean = float(values.mean())
+        self.m2 = float(((values - self.mean) ** 2).sum())
+        changed = np.flatnonzero(values[1:] != values[:-1])
+        self._run = self.count - 1 - int(changed[-1]) if len(changed) else self.count
+
+    def seed(self, values):
+        """
+        用历史值初始化: 从最后一个 NaN 之后的值中取最后 window 个.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        nan_positions = np.flatnonzero(~np.isfinite(values))
+        if len(nan_positions):
+            values = values[nan_positions[-1] + 1:]
+        values = values[-self.window:]
+        self.reset()
+        self.count = len(values)
+        self.buffer[:self.count] = values
+        self.head = self.count % self.window
+        self.resync()
+
+    @property
+    def std(self) -> float:
+        if self.count < self.window:
+            return np.nan
+        if self._run >= self.window:
+            return 0.0
+        return float(np.sqrt(max(self.m2, 0.0) / (self.count - self.ddof)))
+
+    def zscore(self, value: float) -> float:
+        """
+        value 相对当前窗口的 z-score; 窗口未满或标准差为0时返回 NaN.
+        """
+        std = self.std
+        if not std > 0:
+            return np.nan
+        return (value - self.mean) / std
+
+
+class SignalEvent:
+    __slots__ = ('date_time', 'signal_type', 'zscore', 'diff')
+
+    def __init__(self, date_time, signal_type: SignalType, zscore: float, diff: float):
+        self.date_time = date_time
+        self.signal_type = signal_type
+        self.zscore = zscore
+        self.diff = diff
+
+    def __str__(self):
+        return f"DateTime: {self.date_time}, Signal: {self.signal_type.value}, ZScore: {self.zscore}, Diff: {self.diff}"
+
+    def __eq__(self, other):
+        if not isinstance(other, SignalEvent):
+            return False
+        return (self.date_time == other.date_time and self.signal_type == other.signal_type
+                and self.zscore == other.zscore and self.diff == other.diff)
+
+
+class SpreadSignal:
+    """
+    价差的 z-score 信号: 增量维护 diff 的滚动均值和标准差, z-score 越过阈值时产生 SignalEvent.
+
+    - 无持仓时 z >= entry 产生 EnterShort, z <= -entry 产生 EnterLong;
+    - 有持仓时 |z| <= exit 产生 Exit; 设置了 stop 时 |z| >= stop 产生 Stop, 之后 |z| 回到 exit 以内才允许再次开仓;
+    - z-score 为 NaN 的bar不改变持仓状态.
+
+    每个bar处理之后的持仓状态按行记录 (row_states), 之前的 diff 被修改时 revise 只需要重放受影响的行.
+    """
+
+    def __init__(self, window: int, entry: float = 2.0, exit: float = 0.5, stop: float = None, ddof: int = 1,
+                 on_event: Callable[[SignalEvent], None] = None, max_events: int = 10000, max_history: int = None):
+        """
+        :param window: 均值和标准差的窗口长度
+        :param entry: 开仓阈值
+        :param exit: 平仓阈值
+        :param stop: 止损阈值, None 表示不止损
+        :param on_event: 产生事件时的回调
+        :param max_events: self.events 最多保留的事件数
+        :param max_history: 按行记录的持仓状态最多保留的行数, None 表示全部保留
+        """
+        if not 0 <= exit < entry:
+            raise ValueError("thresholds must satisfy 0 <= exit < entry.")
+        if stop is not None and stop <= entry:
+            raise ValueError("stop must be larger than entry.")
+        self.stats = RollingZScore(window, ddof)
+        self.entry = entry
+        self.exit = exit
+        self.stop = stop
+        self.on_event = on_event
+        self.events = deque(maxlen=max_events)
+        self.position = 0  # 1: 持有价差多头, -1: 空头, 0: 无持仓
+        self.stopped = False  # 止损之后, |z| 回到 exit 以内之前不再开仓
+        self.last_zscore = np.nan
+        self.max_history = max_history
+        self._states = np.empty(1024, dtype=np.int8)  # 每行处理之后的状态编码, 见 _STOPPED
+        self._size = 0
+        self._last_state = None  # 最后一个bar处理之前的 (position, stopped, events 数量), 用于 replace_last
+
+    @property
+    def window(self) -> int:
+        return self.stats.window
+
+    @property
+    def row_states(self) -> np.ndarray:
+        """
+        最近各行处理之后的状态编码 (与价差的行末尾对齐): 持仓 -1 / 0 / 1, 止损之后等待回到 exit 以内时为 2.
+        """
+        return self._states[:self._size]
+
+    def restore_row_states(self, states):
+        """
+        恢复按行记录的状态 (例如从快照中), 之后的 revise 可以从这些行开始重放.
+        """
+        self._size = 0
+        self._extend_states(np.asarray(states, dtype=np.int8))
+
+    def reset(self):
+        self.stats.reset()
+        self.events.clear()
+        self.position = 0
+        self.stopped = False
+        self.last_zscore = np.nan
+        self._size = 0
+        self._last_state = None
+
+    @staticmethod
+    def _decode(code: int):
+        """
+        :return: 状态编码对应的 (position, stopped)
+        """
+        return (0, True) if code == _STOPPED else (int(code), False)
+
+    def _state_code(self) -> int:
+        return _STOPPED if self.stopped else self.position
+
+    def _record(self, code: int):
+        if self._size == len(self._states):
+            if self.max_history is not None and self._size >= 2 * self.max_history:
+                # 丢弃最旧的行, 每 max_history 行一次, 均摊 O(1)
+                start = self._size - self.max_history
+                self._states[:self.max_history] = self._states[start:self._size]
+                self._size = self.max_history
+            else:
+                self._states = np.resize(self._states, 2 * len(self._states))
+        self._states[self._size] = code
+        self._size += 1
+
+    def _extend_states(self, codes: np.ndarray):
+        size = self._size + len(codes)
+        if size > len(self._states):
+            self._states = np.resize(self._states, max(size, 2 * len(self._states)))
+        self._states[self._size:size] = codes
+        self._size = size
+
+    @staticmethod
+    def _fill_states(first: int, stop: int, initial: int, rows: np.ndarray, codes) -> np.ndarray:
+        """
+        第 [first, stop) 行处理之后的状态: 只有 rows 中的行可能改变状态, 其余的行沿用之前一行的状态.
+        :param initial: 第 first 行之前的状态
+        :param codes: rows 中每一行处理之后的状态
+        """
+        index = np.searchsorted(rows, np.arange(first, stop), side='right')
+        return np.concatenate(([initial], codes)).astype(np.int8)[index]
+
+    def _candidates(self, zscore: np.ndarray) -> np.ndarray:
+        """
+        只有 |z| >= entry 或 |z| <= exit 的bar才可能改变状态, 其余的bar可以跳过.
+        """
+        with np.errstate(invalid='ignore'):
+            return np.flatnonzero((np.abs(zscore) >= self.entry) | (np.abs(zscore) <= self.exit))
+
+    def _transition(self, zscore: float) -> Optional[SignalType]:
+        if zscore != zscore:
+            return None
+        if self.position == 0:
+            if self.stopped:
+                self.stopped = abs(zscore) > self.exit
+                return None
+            if zscore >= self.entry:
+                self.position = -1
+                return SignalType.EnterShort
+            if zscore <= -self.entry:
+                self.position = 1
+                return SignalType.EnterLong
+            return None
+        if self.stop is not None and abs(zscore) >= self.stop:
+            self.position = 0
+            self.stopped = True
+            return SignalType.Stop
+        if abs(zscore) <= self.exit:
+            self.position = 0
+            return SignalType.Exit
+        return None
+
+    def _emit(self, date_time, zscore: float, diff: float, notify: bool = True) -> Optional[SignalEvent]:
+        self.last_zscore = zscore
+        signal_type = self._transition(zscore)
+        if signal_type is None:
+            return None
+        event = SignalEvent(date_time, signal_type, zscore, diff)
+        self.events.append(event)
+        if notify and self.on_event is not None:
+            self.on_event(event)
+        return event
+
+    def update(self, date_time, diff: float) -> Optional[SignalEvent]:
+        """
+        处理一个新的bar, 代价为 O(1).
+        :return: 产生的事件, 没有时返回 None
+        """
+        self._last_state = (self.position, self.stopped, len(self.events))
+        self.stats.push(diff)
+        event = self._emit(date_time, self.stats.zscore(diff), diff)
+        self._record(self._state_code())
+        return event
+
+    def replace_last(self, date_time, diff: float) -> Optional[SignalEvent]:
+        """
+        修正最后一个bar的 diff: 撤销它产生的事件和持仓变化后重新计算.
+        """
+        if self._last_state is None:
+            return self.update(date_time, diff)
+        self.position, self.stopped, event_count = self._last_state
+        while len(self.events) > event_count:
+            self.events.pop()
+        if len(self.stats) == 0:
+            self.stats.push(diff)
+        else:
+            self.stats.replace_last(diff)
+        event = self._emit(date_time, self.stats.zscore(diff), diff)
+        if self._size:
+            self._states[self._size - 1] = self._state_code()
+        return event
+
+    def run(self, date_times, diffs):
+        """
+        批量处理完整的历史: 向量化计算 z-score, 再按时间顺序只处理可能改变状态的bar
+        (历史事件只记录在 self.events 中, 不调用 on_event). 之后可以继续调用 update 增量处理新的bar.
+        :return: (mean, std, zscore) 数组
+        """
+        self.reset()
+        diffs = np.asarray(diffs, dtype=np.float64)
+        mean, std, zscore = rolling_zscore(diffs, self.window, self.stats.ddof)
+
+        if len(diffs) == 0:
+            return mean, std, zscore
+        if not hasattr(date_times, '__getitem__'):
+            date_times = list(date_times)
+
+        last = len(diffs) - 1
+        rows = self._candidates(zscore)
+        rows = rows[rows < last]
+        codes = []
+        for i in rows.tolist():
+            self._emit(date_times[i], float(zscore[i]), float(diffs[i]), notify=False)
+            codes.append(self._state_code())
+        # 记录最后一个bar之前的状态, 使 replace_last 可以修正它
+        self._last_state = (self.position, self.stopped, len(self.events))
+        self._emit(date_times[last], float(zscore[last]), float(diffs[last]), notify=False)
+        codes.append(self._state_code())
+        self._extend_states(self._fill_states(0, len(diffs), 0, np.append(rows, last), codes))
+
+        self.stats.seed(diffs)
+        return mean, std, zscore
+
+    def revise(self, date_times, diffs, start: int, end: int, shift: int = 0) -> int:
+        """
+        之前的 diff 被修改后 (迟到的bar插入到第 start 行, 修正或删除第 start 行, 第 [start, end) 行的 diff 随之改变)
+        只重新处理受影响的行: 回到第 start 行之前的状态, 重放 z-score 改变的行 [start, end + window - 1),
+        之后继续重放到某一行的状态与修改前相同为止, 再之后的行和事件保持不变.
+        代价与窗口长度 (以及状态收敛所需的行数) 成正比, 与历史长度无关. 修改前没有的事件调用 on_event.
+        :param date_times: 修改之后的时间
+        :param diffs: 修改之后的 diff
+        :param shift: 行数的变化, 插入为 1, 删除为 -1, 修正为 0
+        :return: 重新处理的行数
+        """
+        diffs = np.asarray(diffs, dtype=np.float64)
+        length = len(diffs)
+        window = self.window
+        count = length - shift - start  # 修改之前第 start 行及之后的行数
+        if count < 0 or count + (start > 0) > self._size:
+            # 需要的状态已经被丢弃 (max_history), 只能用现有的行重新计算
+            self.run(date_times, diffs)
+            return length
+
+        initial = int(self._states[self._size - count - 1]) if start > 0 else 0
+        old_states = self._states[self._size - count:self._size].copy()
+        self._size -= count
+        # 撤销第 start 行及之后的事件, 状态收敛之后的部分再原样放回
+        after = pd.Timestamp(date_times[start - 1]) if start > 0 else None
+        old_events = []
+        while self.events and (after is None or pd.Timestamp(self.events[-1].date_time) > after):
+            old_events.append(self.events.pop())
+        old_events.reverse()
+
+        self.position, self.stopped = self._decode(initial)
+        z_stop = min(length, max(start, end) + window - 1)  # z-score 可能改变的行为 [start, z_stop)
+        new_events = []
+        converged = None  # 之后的状态与修改前相同的行
+        first = start
+        while first < length and converged is None:
+            stop = min(length, max(z_stop, first + 4 * window))
+            offset = max(0, first - window + 1)
+            zscore = rolling_zscore(diffs[offset:stop], window, self.stats.ddof)[2][first - offset:]
+            rows = first + self._candidates(zscore)
+            codes = []
+            for i in rows.tolist():
+                event = self._emit(date_times[i], float(zscore[i - first]), float(diffs[i]), notify=False)
+                if event is not None:
+                    new_events.append((i, event))
+                codes.append(self._state_code())
+            states = self._fill_states(first, stop, initial, rows, codes)
+
+            # z-score 不再改变的行中, 状态与修改前对应行 (第 i - shift 行) 相同的第一行
+            low = max(first, z_stop - 1, start + shift)
+            high = min(stop, start + shift + count)
+            if low < high:
+                same = np.flatnonzero(states[low - first:high - first]
+                                      == old_states[low - shift - start:high - shift - start])
+                if len(same):
+                    converged = low + int(same[0])
+            if converged is None:
+                self._extend_states(states)
+                initial = int(states[-1])
+            else:
+                self._extend_states(states[:converged + 1 - first])
+                self._extend_states(old_states[converged + 1 - shift - start:])
+            first = stop
+
+        if converged is not None:
+            # 收敛之后重放产生的事件被修改前的事件代替
+            while new_events and new_events[-1][0] > converged:
+                new_events.pop()
+                self.events.pop()
+            limit = pd.Timestamp(date_times[converged])
+            self.events.extend(event for event in old_events if pd.Timestamp(event.date_time) > limit)
+
+        self.position, self.stopped = self._decode(int(self._states[self._size - 1]) if self._size else 0)
+        self.stats.seed(diffs[-window:])
+        self.last_zscore = self.stats.zscore(diffs[-1]) if length else np.nan
+        position, stopped = self._decode(int(self._states[self._size - 2]) if self._size >= 2 else 0)
+        last_events = int(bool(self.events) and length > 0
+                          and pd.Timestamp(self.events[-1].date_time) == pd.Timestamp(date_times[-1]))
+        self._last_state = (position, stopped, len(self.events) - last_events)
+
+        if self.on_event is not None:
+            old_keys = {(pd.Timestamp(event.date_time), event.signal_type) for event in old_events}
+            for _, event in new_events:
+                if (pd.Timestamp(event.date_time), event.signal_type) not in old_keys:
+                    self.on_event(event)
+        return first - start
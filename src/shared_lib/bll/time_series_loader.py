@@ -0,0 +1,337 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterator, List, Sequence
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from src.shared_lib.models.time_series import TimeSeries
+
+# 读取 DateTime,Open,High,Low,Close,Volume 格式的行情文件, 直接得到按列存储的数组, 不生成逐行的对象.
+# 支持 CSV (可分块读取), 每列一个 .npy 文件的目录 (可内存映射) 和 Parquet (需要安装 pyarrow).
+
+DATE_COLUMN = 'DateTime'
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+CACHE_META = 'meta.json'
+
+
+def _parse_date_times(values) -> np.ndarray:
+    """
+    字符串时间 -> datetime64[ns]. 格式由第一个值推断, 同一文件内格式不一致时逐个解析.
+    """
+    try:
+        date_times = pd.to_datetime(values)
+    except ValueError:
+        date_times = pd.to_datetime(values, format='mixed')
+    return np.asarray(date_times, dtype='datetime64[ns]')
+
+
+def _to_columns(df: DataFrame, columns: Sequence[str], date_column: str) -> Dict[str, np.ndarray]:
+    arrays = {date_column: _parse_date_times(df[date_column])}
+    for column in columns:
+        arrays[column] = df[column].to_numpy(dtype=np.float64)
+    return arrays
+
+
+def read_csv(path, columns: Sequence[str] = ('Close',), date_column: str = DATE_COLUMN) -> Dict[str, np.ndarray]:
+    """
+    读取 CSV 中的时间列和指定的数值列 (只解析需要的列).
+    :return: {date_column: datetime64[ns] 数组, column: float64 数组, ...}
+    """
+    columns = list(columns)
+    df = pd.read_csv(path, usecols=[date_column] + columns, dtype={column: np.float64 for column in columns})
+    return _to_columns(df, columns, date_column)
+
+
+def iter_csv(path, columns: Sequence[str] = ('Close',), date_column: str = DATE_COLUMN,
+             chunksize: int = 1_000_000) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    分块读取大文件, 每块的格式同 read_csv, 内存占用只与 chunksize 有关.
+    """
+    columns = list(columns)
+    with pd.read_csv(path, usecols=[date_column] + columns, dtype={column: np.float64 for column in columns},
+                     chunksize=chunksize) as reader:
+        for df in reader:
+            yield _to_columns(df, columns, date_column)
+
+
+def save_npy(directory, arrays: Dict[str, np.ndarray]):
+    """
+    每列保存为 directory 下的 {column}.npy.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), np.asarray(array))
+
+
+def load_npy(directory, columns: Sequence[str] = None, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    读取 save_npy 保存的列.
+    :param columns: 需要的列, None 表示全部
+    :param mmap: True 时以只读方式内存映射, 不把整个文件读入内存
+    """
+    if columns is None:
+        columns = sorted(file_name[:-4] for file_name in os.listdir(directory) if file_name.endswith('.npy'))
+    mmap_mode = 'r' if mmap else None
+    return {column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode=mmap_mode) for column in columns}
+
+
+class NpyColumnWriter:
+    """
+    分块追加写入 .npy 列目录, 结果可以直接用 load_npy / load_columns 读取 (可内存映射).
+    数据直接追加到文件末尾, 每次追加后原地改写文件头中的行数 (numpy 为一维数组的行数预留了空间), 内存占用与总行数无关.
+    """
+
+    def __init__(self, directory, dtypes: Dict[str, np.dtype], resume: bool = False):
+        """
+        :param directory: 输出目录
+        :param dtypes: {列名: 数据类型}
+        :param resume: False 时覆盖已有的同名列; True 时在已有的列 (np.save 或本类写入的一维数组) 之后继续追加
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in dtypes.items()}
+        self.rows = 0
+        self._files = {}
+        self._header_sizes = {}
+        rows = set()
+        try:
+            for name in self.dtypes:
+                path = os.path.join(directory, f"{name}.npy")
+                if resume and os.path.exists(path):
+                    f = self._files[name] = open(path, 'r+b')
+                    rows.add(self._read_header(name))
+                else:
+                    f = self._files[name] = open(path, 'w+b')
+                    self._write_header(name)
+                    rows.add(0)
+                self._header_sizes[name] = f.tell()
+            if len(rows) > 1:
+                raise ValueError(f"Columns in {directory} have different lengths.")
+        except Exception:
+            self.close()
+            raise
+        self.rows = rows.pop() if rows else 0
+
+    def _read_header(self, name: str) -> int:
+        """
+        :return: 已有文件的行数
+        """
+        f = self._files[name]
+        if np.lib.format.read_magic(f) != (1, 0):
+            raise ValueError(f"{name}.npy can not be appended to: unsupported format version.")
+        shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        if len(shape) != 1 or dtype != self.dtypes[name]:
+            raise ValueError(f"{name}.npy can not be appended to: {dtype}{shape}.")
+        return shape[0]
+
+    def _write_header(self, name: str):
+        f = self._files[name]
+        f.seek(0)
+        np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(self.dtypes[name]),
+                                                 'fortran_order': False, 'shape': (self.rows,)})
+
+    def append(self, columns: Dict[str, np.ndarray]):
+        """
+        :param columns: 每一列对应一个等长的数组
+        """
+        lengths = {len(columns[name]) for name in self.dtypes}
+        if len(lengths) != 1:
+            raise ValueError("All columns must have the same length.")
+        length = lengths.pop()
+        if length == 0:
+            return
+        for name, dtype in self.dtypes.items():
+            f = self._files[name]
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        self.rows += length
+        for name in self.dtypes:
+            self._write_header(name)
+            if self._files[name].tell() != self._header_sizes[name]:
+                raise ValueError(f"Header of {name}.npy can not be updated in place.")
+
+    def truncate(self, rows: int):
+        """
+        只保留前 rows 行, 之后的 append 从第 rows 行开始写入.
+        """
+        if not 0 <= rows <= self.rows:
+            raise ValueError(f"rows must be between 0 and {self.rows}.")
+        self.rows = rows
+        for name, dtype in self.dtypes.items():
+            self._files[name].truncate(self._header_sizes[name] + rows * dtype.itemsize)
+            self._write_header(name)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _parquet():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("pyarrow is required for Parquet support: pip install pyarrow") from e
+    return pa, pq
+
+
+def save_parquet(path, arrays: Dict[str, np.ndarray]):
+    pa, pq = _parquet()
+    pq.write_table(pa.table({name: np.asarray(array) for name, array in arrays.items()}), path)
+
+
+def load_parquet(path, columns: Sequence[str] = None) -> Dict[str, np.ndarray]:
+    """
+    读取 Parquet 文件中的列 (只读取需要的列).
+    """
+    _, pq = _parquet()
+    table = pq.read_table(path, columns=None if columns is None else list(columns))
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def iter_columns(path, columns: Sequence[str] = ('Close',), date_column: str = DATE_COLUMN,
+                 chunksize: int = 1_000_000) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    按路径自动选择格式分块读取: .csv 分块解析, .parquet 按 batch 读取, .npy 列目录内存映射后按块切片.
+    每块的格式同 read_csv, 内存占用只与 chunksize 有关.
+    """
+    path = os.fspath(path)
+    names = [date_column] + list(columns)
+    if os.path.isdir(path):
+        arrays = load_npy(path, names, mmap=True)
+        rows = len(arrays[date_column])
+        for start in range(0, rows, chunksize):
+            chunk = {name: np.array(array[start:start + chunksize]) for name, array in arrays.items()}
+            chunk[date_column] = chunk[date_column].astype('datetime64[ns]')
+            yield chunk
+    elif path.endswith('.parquet'):
+        _, pq = _parquet()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=names):
+            chunk = {name: batch.column(name).to_numpy(zero_copy_only=False) for name in names}
+            date_times = chunk[date_column]
+            if not np.issubdtype(date_times.dtype, np.datetime64):
+                date_times = _parse_date_times(date_times)
+            chunk[date_column] = date_times.astype('datetime64[ns]')
+            yield chunk
+    else:
+        yield from iter_csv(path, columns, date_column, chunksize)
+
+
+def _available_columns(path) -> List[str]:
+    """
+    文件包含的 PRICE_COLUMNS 中的列.
+    """
+    path = os.fspath(path)
+    if os.path.isdir(path):
+        names = [file_name[:-4] for file_name in os.listdir(path) if file_name.endswith('.npy')]
+    elif path.endswith('.parquet'):
+        names = _parquet()[1].read_schema(path).names
+    else:
+        names = pd.read_csv(path, nrows=0).columns
+    return [column for column in PRICE_COLUMNS if column in names]
+
+
+def convert_csv(path, directory, columns: Sequence[str] = None, date_column: str = DATE_COLUMN,
+                chunksize: int = 1_000_000) -> Dict[str, np.ndarray]:
+    """
+    把 CSV 转换为 .npy 列目录, 以后的读取不再解析文本. 分块读取并逐块追加写入 (NpyColumnWriter),
+    内存占用只与 chunksize 有关, 适用于大文件.
+    meta.json 记录源文件的路径, 大小和修改时间, 源文件变化后 load_columns(cache_dir=...) 会重新转换.
+    :param columns: 需要转换的数值列, None 表示 PRICE_COLUMNS 中文件包含的列
+    :return: 转换后的列 (内存映射)
+    """
+    columns = _available_columns(path) if columns is None else list(columns)
+    meta_path = os.path.join(directory, CACHE_META)
+    if os.path.exists(meta_path):
+        # 中途退出时不留下看起来有效的缓存
+        os.remove(meta_path)
+    dtypes = {date_column: np.dtype('datetime64[ns]')}
+    dtypes.update({column: np.dtype(np.float64) for column in columns})
+    with NpyColumnWriter(directory, dtypes) as writer:
+        for arrays in iter_csv(path, columns, date_column, chunksize):
+            writer.append(arrays)
+
+    stat = os.stat(path)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'source': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                   'columns': [date_column] + columns}, f)
+    return load_npy(directory, [date_column] + columns)
+
+
+def _cache_directory(cache_dir, path) -> str:
+    """
+    CSV 在缓存目录中对应的子目录: 文件名加上完整路径的哈希, 不同目录下的同名文件不共用缓存.
+    """
+    path = os.path.abspath(path)
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(os.fspath(cache_dir), f"{os.path.splitext(os.path.basename(path))[0]}-{digest}")
+
+
+def _cache_is_valid(path, directory, names: List[str]) -> bool:
+    meta_path = os.path.join(directory, CACHE_META)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    stat = os.stat(path)
+    return (meta.get('source') == os.path.abspath(path) and meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns
+            and set(names) <= set(meta['columns']))
+
+
+def load_columns(path, columns: Sequence[str] = ('Close',), date_column: str = DATE_COLUMN,
+                 cache_dir=None, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    按路径自动选择格式读取时间列和指定的数值列: .csv, .parquet, 或 .npy 列目录.
+    :param cache_dir: 读取 CSV 时的缓存目录; 第一次读取时转换为 .npy, 之后直接内存映射
+    :param mmap: 读取 .npy 时是否内存映射
+    """
+    path = os.fspath(path)
+    names = [date_column] + list(columns)
+    if os.path.isdir(path):
+        return load_npy(path, names, mmap)
+    if path.endswith('.parquet'):
+        return load_parquet(path, names)
+    if cache_dir is None:
+        return read_csv(path, columns, date_column)
+
+    directory = _cache_directory(cache_dir, path)
+    if not _cache_is_valid(path, directory, names):
+        convert_csv(path, directory, date_column=date_column)
+        if not _cache_is_valid(path, directory, names):
+            # 需要的列不在 PRICE_COLUMNS 中, 按需要的列重新转换
+            convert_csv(path, directory, columns, date_column)
+    return load_npy(directory, names, mmap)
+
+
+def load_time_series(path, column: str = 'Close', date_column: str = DATE_COLUMN, cache_dir=None,
+                     dropna: bool = False) -> TimeSeries:
+    """
+    读取一个数值列为 TimeSeries, 可以直接传给 DiffCalculator.update_time_series.
+    :param dropna: 是否去掉数值为 NaN 的行
+    """
+    arrays = load_columns(path, [column], date_column, cache_dir)
+    date_times, values = arrays[date_column], arrays[column]
+    if dropna:
+        valid = np.isfinite(values)
+        date_times, values = date_times[valid], values[valid]
+    return TimeSeries.from_numpy(date_times, values)
+
+
+def load_frame(path, columns: Sequence[str] = None, date_column: str = DATE_COLUMN, cache_dir=None) -> DataFrame:
+    """
+    读取为以 date_column 为 index 的 DataFrame.
+    :param columns: 需要的数值列, None 表示 PRICE_COLUMNS 中文件包含的列
+    """
+    if columns is None:
+        columns = _available_columns(path)
+    arrays = load_columns(path, columns, date_column, cache_dir)
+    index = pd.DatetimeIndex(arrays.pop(date_column), name=date_column)
+    return DataFrame(arrays, index=index)
@@ -0,0 +1,156 @@
+from itertools import combinations
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from src.shared_lib.bll.regression import block_cumsums, span_cumsum0, span_positions, solve_ols
+
+
+class UniverseSpreadEngine:
+    """
+    整个股票池的批量价差计算: 输入价格矩阵 (时间 × 标的), 对指定的配对 (或全部配对) 计算滚动的 slope, intercept, diff.
+    窗口定义与 DiffCalculator 一致: 第 i 行使用 [i - window, i) 的数据点, 以 symbol1 为被解释变量.
+
+    每个标的的 Σx, Σx² 和有效值计数只计算一次, 所有配对共享; 每个配对只需要额外计算 Σxy.
+    累计和以窗口长度为块长分块重新居中 (见 regression.block_cumsums), 长历史上不会因大数相减损失精度.
+    窗口内任一腿有 NaN 时, 该行结果为 NaN.
+    """
+    FIELDS = ('slope', 'intercept', 'diff')
+    STATE_ARRAYS = ('prices', 'reference', '_centered', '_cs_x', '_cs_xx', '_cs_valid')
+
+    def __init__(self, prices, window: int, symbols: List[str] = None, date_times=None):
+        """
+        :param prices: DataFrame (index 为时间, 列为标的) 或二维数组 (时间 × 标的)
+        :param window: 窗口长度, 通常取 DiffCalculator.FixedWindowLength
+        :param symbols: prices 为数组时的标的名称
+        :param date_times: prices 为数组时的时间轴
+        """
+        if window < 2:
+            raise ValueError("window must contain at least two data points for OLS regression.")
+
+        if isinstance(prices, DataFrame):
+            symbols = list(prices.columns)
+            date_times = prices.index.to_numpy()
+            prices = prices.to_numpy(dtype=np.float64)
+        else:
+            prices = np.asarray(prices, dtype=np.float64)
+            if symbols is None:
+                raise ValueError("symbols must be given when prices is an array.")
+        if prices.ndim != 2 or prices.shape[1] != len(symbols):
+            raise ValueError("prices must be a 2D array of shape (time, len(symbols)).")
+
+        self.window = window
+        self.symbols = list(symbols)
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.date_times = np.asarray(date_times) if date_times is not None else None
+        self.prices = prices
+
+        # 共享的滚动矩: 每个标的分块减去参考值后的 Σx, Σx², 以及有效值计数
+        self._centered, self._cs_x, self._cs_xx, self._cs_valid, self.reference = \
+            block_cumsums(prices, window, np.isfinite(prices))
+
+    def state_arrays(self) -> dict:
+        """
+        计算所需的全部数组 (价格矩阵和共享的滚动矩), 用于发布到共享内存.
+        """
+        return {name: getattr(self, name) for name in self.STATE_ARRAYS}
+
+    @classmethod
+    def from_state_arrays(cls, window: int, symbols: List[str], arrays: dict, date_times=None):
+        """
+        由 state_arrays 的结果 (例如共享内存中的视图) 直接构建, 不复制也不重新计算滚动矩.
+        """
+        engine = cls.__new__(cls)
+        engine.window = window
+        engine.symbols = list(symbols)
+        engine.symbol_index = {symbol: i for i, symbol in enumerate(engine.symbols)}
+        engine.date_times = date_times
+        for name in cls.STATE_ARRAYS:
+            setattr(engine, name, arrays[name])
+        return engine
+
+    @property
+    def length(self) -> int:
+        return self.prices.shape[0]
+
+    def all_pairs(self) -> List[Tuple[str, str]]:
+        return list(combinations(self.symbols, 2))
+
+    def _window_sums(self, cumsum: np.ndarray, positions, columns) -> np.ndarray:
+        blocks, lo, hi = positions
+        return cumsum[blocks[:, None], hi[:, None], columns] - cumsum[blocks[:, None], lo[:, None], columns]
+
+    def compute_chunk(self, pairs: List[Tuple[str, str]], dtype=np.float64) -> np.ndarray:
+        """
+        一次性计算一批配对.
+        :return: 形状为 (len(FIELDS), len(pairs), 时间) 的数组
+        """
+        index_a = np.array([self.symbol_index[symbol1] for symbol1, _ in pairs], dtype=np.intp)
+        index_b = np.array([self.symbol_index[symbol2] for _, symbol2 in pairs], dtype=np.intp)
+        result = np.full((len(self.FIELDS), len(pairs), self.length), np.nan, dtype=dtype)
+        if self.length <= self.window:
+            return result
+
+        ends = np.arange(self.window, self.length)
+        positions = span_positions(ends - self.window, ends, self.window)
+        sx = self._window_sums(self._cs_x, positions, index_b)
+        sy = self._window_sums(self._cs_x, positions, index_a)
+        sxx = self._window_sums(self._cs_xx, positions, index_b)
+        sxy = self._window_sums(span_cumsum0(self._centered[:, :, index_b] * self._centered[:, :, index_a]),
+                                positions, np.arange(len(pairs)))
+        count_a = self._window_sums(self._cs_valid, positions, index_a)
+        count_b = self._window_sums(self._cs_valid, positions, index_b)
+
+        reference = self.reference[positions[0]]
+        slope, intercept = solve_ols(float(self.window), sx, sy, sxx, sxy, reference[:, index_b], reference[:, index_a])
+        complete = (count_a == self.window) & (count_b == self.window)
+        slope = np.where(complete, slope, np.nan)
+        intercept = np.where(complete, intercept, np.nan)
+        diff = self.prices[self.window:, index_a] - (slope * self.prices[self.window:, index_b] + intercept)
+
+        result[0, :, self.window:] = slope.T
+        result[1, :, self.window:] = intercept.T
+        result[2, :, self.window:] = diff.T
+        return result
+
+    def iter_chunks(self, pairs: List[Tuple[str, str]] = None, chunk_size: int = 64, dtype=np.float64):
+        """
+        分块计算, 每块最多 chunk_size 个配对, 内存占用与配对总数无关.
+        :return: 生成 (pairs_chunk, result), result 的形状为 (len(FIELDS), len(pairs_chunk), 时间)
+        """
+        pairs = self.all_pairs() if pairs is None else list(pairs)
+        for start in range(0, len(pairs), chunk_size):
+            chunk = pairs[start:start + chunk_size]
+            yield chunk, self.compute_chunk(chunk, dtype)
+
+    def compute(self, pairs: List[Tuple[str, str]] = None, chunk_size: int = 64, dtype=np.float64) -> np.ndarray:
+        """
+        :param pairs: (symbol1, symbol2) 列表, None 表示全部配对
+        :param chunk_size: 每批计算的配对数
+        :param dtype: 结果的数据类型, 可用 np.float32 减半内存
+        :return: 形状为 (len(FIELDS), len(pairs), 时间) 的数组
+        """
+        pairs = self.all_pairs() if pairs is None else list(pairs)
+        result = np.empty((len(self.FIELDS), len(pairs), self.length), dtype=dtype)
+        offset = 0
+        for chunk, chunk_result in self.iter_chunks(pairs, chunk_size, dtype):
+            result[:, offset:offset + len(chunk)] = chunk_result
+            offset += len(chunk)
+        return result
+
+    def to_long_frame(self, pairs: List[Tuple[str, str]], result: np.ndarray, dropna: bool = True) -> DataFrame:
+        """
+        把 compute 的结果转换为长表: date_time, symbol1, symbol2, slope, intercept, diff.
+        """
+        n_pairs, length = len(pairs), self.length
+        date_times = self.date_times if self.date_times is not None else np.arange(length)
+        df = DataFrame({
+            'date_time': np.tile(date_times, n_pairs),
+            'symbol1': pd.Categorical(np.repeat([symbol1 for symbol1, _ in pairs], length), categories=self.symbols),
+            'symbol2': pd.Categorical(np.repeat([symbol2 for _, symbol2 in pairs], length), categories=self.symbols),
+        })
+        for i, field in enumerate(self.FIELDS):
+            df[field] = result[i].reshape(-1)
+        if dropna:
+            df = df.dropna(subset=['diff']).reset_index(drop=True)
+        return df
@@ -9,3 +9,16 @@ class ResolutionLevel(Enum):
     Weekly = "wk"
     Monthly = "mo"
     Other = "other"
+
+
+class AlignmentMode(Enum):
+    Strict = "strict"   # 两个序列的时间戳必须完全一致
+    Inner = "inner"     # 只保留两个序列共有的时间戳
+    AsOf = "asof"       # 以第一个序列的时间戳为准, 取第二个序列在该时刻之前(含)的最新值
+
+
+class SignalType(Enum):
+    EnterLong = "enter_long"    # z-score 低于 -entry: 买入价差 (买 symbol1, 卖 symbol2)
+    EnterShort = "enter_short"  # z-score 高于 entry: 卖出价差
+    Exit = "exit"               # |z-score| 回到 exit 以内: 平仓
+    Stop = "stop"               # |z-score| 超过 stop: 止损平仓
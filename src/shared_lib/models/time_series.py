@@ -1,7 +1,11 @@
+from collections.abc import MutableSequence
 from datetime import datetime
+import numpy as np
 
 
 class TimeSeriesElement:
+    __slots__ = ('date_time', 'value')
+
     def __init__(self, date_time: datetime, value: float):
         self.date_time = date_time
         self.value = value
@@ -18,17 +22,227 @@ class TimeSeriesElement:
         return hash((self.date_time, self.value))
 
 
+def _as_datetime64(date_times) -> np.ndarray:
+    """
+    统一转换为 datetime64[ns]; 已经是 datetime64[ns] 数组时原样返回 (不复制), 其他单位 ([D], [s] 等) 转换后复制.
+    """
+    array = np.asarray(date_times)
+    if np.issubdtype(array.dtype, np.datetime64):
+        return array.astype('datetime64[ns]', copy=False)
+    return np.array(date_times, dtype='datetime64[ns]')
+
+
+def _to_datetime64(date_time) -> np.datetime64:
+    """
+    单个时间 -> datetime64[ns], pd.Timestamp 保留纳秒.
+    """
+    if hasattr(date_time, 'to_datetime64'):
+        date_time = date_time.to_datetime64()
+    return np.datetime64(date_time, 'ns')
+
+
+def _coerce_float(value) -> float:
+    """
+    无法转换为数值的元素 (如 NaT, 非数字字符串) 转换为 NaN.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_datetime(value: np.datetime64):
+    """
+    datetime64[ns] -> datetime, 有微秒以下的部分时 (Tick 数据) 返回保留纳秒的 pd.Timestamp; NaT -> None.
+    """
+    if not np.isnat(value) and value.astype(np.int64) % 1000:
+        import pandas as pd
+        return pd.Timestamp(value)
+    return value.astype('datetime64[us]').item()
+
+
+class _ElementView(MutableSequence):
+    """
+    TimeSeries.series 返回的可写视图: 读取时按需生成 TimeSeriesElement, 修改 (append, 赋值, 插入, 删除) 直接写入 TimeSeries.
+    """
+    __slots__ = ('_time_series',)
+
+    def __init__(self, time_series: 'TimeSeries'):
+        self._time_series = time_series
+
+    def __len__(self):
+        return len(self._time_series)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return list(self._time_series[item])
+        return self._time_series[item]
+
+    def __setitem__(self, item, element: TimeSeriesElement):
+        if isinstance(item, slice):
+            raise TypeError("Slice assignment is not supported, assign TimeSeries.series instead.")
+        date_times, values = self._time_series.to_numpy()
+        date_times[item] = _to_datetime64(element.date_time)
+        values[item] = element.value
+
+    def __delitem__(self, item):
+        time_series = self._time_series
+        keep = np.ones(len(time_series), dtype=bool)
+        keep[item] = False
+        time_series._set_arrays(time_series.date_times[keep], time_series.values[keep])
+
+    def insert(self, index: int, element: TimeSeriesElement):
+        time_series = self._time_series
+        if index >= len(time_series):
+            time_series.append(element)
+            return
+        time_series._set_arrays(np.insert(time_series.date_times, index, _to_datetime64(element.date_time)),
+                                np.insert(time_series.values, index, _coerce_float(element.value)))
+
+    def append(self, element: TimeSeriesElement):
+        self._time_series.append(element)
+
+    def __iter__(self):
+        return iter(self._time_series)
+
+    def __eq__(self, other):
+        if isinstance(other, (_ElementView, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"[{', '.join(str(element) for element in self)}]"
+
+
 class TimeSeries:
-    def __init__(self):
-        self.series = []
+    """
+    按列存储的时间序列: 一个 datetime64[ns] 数组 (date_times) 和一个 float64 数组 (values).
+    切片返回共享内存的视图; 逐元素的接口 (索引/迭代/series) 按需生成 TimeSeriesElement.
+    """
+
+    def __init__(self, date_times=None, values=None):
+        if date_times is None:
+            self._date_times = np.empty(0, dtype='datetime64[ns]')
+            self._values = np.empty(0, dtype=np.float64)
+        else:
+            self._set_arrays(_as_datetime64(date_times), np.asarray(values, dtype=np.float64))
+            return
+        self._size = 0
+
+    def _set_arrays(self, date_times: np.ndarray, values: np.ndarray):
+        if date_times.shape != values.shape or values.ndim != 1:
+            raise ValueError("date_times and values must be one-dimensional arrays of the same length.")
+        self._date_times = date_times
+        self._values = values
+        self._size = len(values)
+
+    @classmethod
+    def from_numpy(cls, date_times: np.ndarray, values: np.ndarray) -> 'TimeSeries':
+        """
+        由数组构建; date_times 为 datetime64[ns] 且 values 为 float64 时不复制数据.
+        """
+        return cls(date_times, values)
+
+    @classmethod
+    def from_dataframe(cls, df, value_column: str = 'Close', date_column: str = None) -> 'TimeSeries':
+        """
+        由 DataFrame 构建. date_column 为 None 时使用 index 作为时间列.
+        列的类型已经是 datetime64[ns] / float64 时不复制数据.
+        """
+        date_times = df.index if date_column is None else df[date_column]
+        return cls(date_times.to_numpy(), df[value_column].to_numpy())
+
+    @classmethod
+    def from_elements(cls, elements) -> 'TimeSeries':
+        """
+        由 TimeSeriesElement 列表构建, 非数值的 value 转换为 NaN.
+        """
+        elements = list(elements)
+        date_times = np.array([_to_datetime64(element.date_time) for element in elements], dtype='datetime64[ns]')
+        try:
+            values = np.fromiter((element.value for element in elements), dtype=np.float64, count=len(elements))
+        except (TypeError, ValueError):
+            values = np.fromiter((_coerce_float(element.value) for element in elements), dtype=np.float64,
+                                 count=len(elements))
+        return cls(date_times, values)
+
+    @property
+    def date_times(self) -> np.ndarray:
+        return self._date_times[:self._size]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[:self._size]
+
+    @property
+    def series(self) -> MutableSequence:
+        """
+        兼容原有接口: 返回 TimeSeriesElement 的可写视图, series.append(elm) 等修改直接写入本序列.
+        元素按需生成, 对大序列逐个访问的开销较大.
+        """
+        return _ElementView(self)
+
+    @series.setter
+    def series(self, elements):
+        time_series = TimeSeries.from_elements(elements)
+        self._set_arrays(time_series.date_times, time_series.values)
+
+    def to_numpy(self):
+        """
+        :return: (date_times, values) 两个数组视图, 不复制数据.
+        """
+        return self.date_times, self.values
+
+    def to_frame(self, name: str = 'value'):
+        """
+        转换为以 date_time 为 index 的 DataFrame.
+        """
+        import pandas as pd
+        return pd.DataFrame({name: self.values}, index=pd.DatetimeIndex(self.date_times, name='date_time'))
+
+    def append(self, element: TimeSeriesElement):
+        self.append_value(element.date_time, element.value)
+
+    def append_value(self, date_time, value: float):
+        """
+        追加一个数据点, 容量不足时倍增 (均摊 O(1)).
+        """
+        if self._size == len(self._values):
+            capacity = max(16, 2 * self._size)
+            date_times = np.empty(capacity, dtype=self._date_times.dtype)
+            values = np.empty(capacity, dtype=np.float64)
+            date_times[:self._size] = self.date_times
+            values[:self._size] = self.values
+            self._date_times, self._values = date_times, values
+        self._date_times[self._size] = _to_datetime64(date_time)
+        self._values[self._size] = value
+        self._size += 1
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return TimeSeries(self.date_times[item], self.values[item])
+        date_times, values = self.to_numpy()
+        return TimeSeriesElement(_to_datetime(date_times[item]), float(values[item]))
+
+    def __iter__(self):
+        date_times = self.date_times
+        if (date_times[~np.isnat(date_times)].astype(np.int64) % 1000).any():
+            date_times = [_to_datetime(date_time) for date_time in date_times]
+        else:
+            date_times = date_times.astype('datetime64[us]').tolist()
+        return (TimeSeriesElement(date_time, value) for date_time, value in zip(date_times, self.values.tolist()))
 
     def __str__(self):
-        return f"TimeSeries with {len(self.series)} elements: [{', '.join(str(elm) for elm in self.series)}]"
+        return f"TimeSeries with {len(self)} elements: [{', '.join(str(elm) for elm in self)}]"
 
     def __eq__(self, other):
         if not isinstance(other, TimeSeries):
             return False
-        return self.series == other.series
+        return (np.array_equal(self.date_times, other.date_times)
+                and np.array_equal(self.values, other.values, equal_nan=True))
 
     def __hash__(self):
-        return hash(tuple(self.series))
+        return hash((self.date_times.astype('datetime64[ns]').tobytes(), self.values.tobytes()))
@@ -0,0 +1,35 @@
+import os
+import unittest
+from src.shared_lib.benchmarks import bench_diff_calculator
+from src.shared_lib.benchmarks.bench_diff_calculator import CALIBRATION_KEY, compare
+
+
+class TestBenchmarkComparison(unittest.TestCase):
+
+    def make_results(self, calibration, seconds):
+        return {CALIBRATION_KEY: {'seconds': calibration, 'peak_bytes': 0},
+                'A/Daily/update': {'seconds': seconds, 'peak_bytes': 1000}}
+
+    def test_scales_baseline_by_calibration(self):
+        baseline = self.make_results(0.1, 0.05)
+        # 整台机器慢一倍不是回归
+        self.assertEqual(compare(self.make_results(0.2, 0.1), baseline, 2.0, 1.25), [])
+        # 同一台机器上慢三倍是回归
+        regressions = compare(self.make_results(0.1, 0.15), baseline, 2.0, 1.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('A/Daily/update'))
+
+    def test_baseline_without_calibration(self):
+        baseline = {'A/Daily/update': {'seconds': 0.05, 'peak_bytes': 1000}}
+        self.assertEqual(compare(self.make_results(0.3, 0.09), baseline, 2.0, 1.25), [])
+
+
+@unittest.skipUnless(os.environ.get('RUN_BENCHMARKS'), "set RUN_BENCHMARKS=1 to compare the benchmarks with baseline.json")
+class TestBenchmarks(unittest.TestCase):
+
+    def test_diff_calculator_has_no_regressions(self):
+        self.assertEqual(bench_diff_calculator.main(['--resolutions', 'Daily', 'Hourly', 'Minute']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
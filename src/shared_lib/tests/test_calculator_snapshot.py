@@ -0,0 +1,154 @@
+import gc
+import json
+import os
+import tempfile
+import unittest
+import weakref
+from pathlib import Path
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500, DiffCalculatorCrypto, read_snapshot_meta
+from src.shared_lib.bll.time_series_loader import load_time_series
+from src.shared_lib.models.enums import ResolutionLevel
+from src.shared_lib.models.time_series import *
+
+
+class TestCalculatorSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        data_dir = Path(__file__).parent / "data"
+        self.time_series1 = load_time_series(data_dir / "AAPL.csv", dropna=True)
+        self.time_series2 = load_time_series(data_dir / "ABNB.csv", dropna=True)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "calculator.npz")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_streaming(self, rows: int, **kwargs):
+        calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        calculator.update_time_series(self.time_series1[:rows], self.time_series2[:rows])
+        calculator.update_diff_and_equation()
+        calculator.enable_streaming(**kwargs)
+        return calculator
+
+    def feed(self, calculator, start: int, end: int):
+        for elm1, elm2 in zip(self.time_series1[start:end], self.time_series2[start:end]):
+            calculator.update_time_series_element(elm1, elm2)
+
+    def test_restore_continues_identically(self):
+        original = self.make_streaming(1500)
+        original.enable_signal(window=40, entry=1.5, exit=0.3)
+        self.feed(original, 1500, 2000)
+        original.save_snapshot(self.path)
+
+        restored = DiffCalculatorSP500.from_snapshot(self.path)
+        self.assertTrue(restored.streaming)
+        self.assertEqual(restored.signal.position, original.signal.position)
+        self.feed(original, 2000, len(self.time_series1))
+        self.feed(restored, 2000, len(self.time_series1))
+
+        np.testing.assert_array_equal(restored.df['diff'].to_numpy(), original.df['diff'].to_numpy())
+        self.assertEqual(restored.signal.last_zscore, original.signal.last_zscore)
+        self.assertEqual(restored.signal.position, original.signal.position)
+
+    def test_partial_history(self):
+        original = self.make_streaming(2000)
+        original.save_snapshot(self.path, history=100)
+        restored = DiffCalculatorSP500.from_snapshot(self.path)
+        self.assertEqual(len(restored.df), 100)
+        self.feed(original, 2000, 2100)
+        self.feed(restored, 2000, 2100)
+        np.testing.assert_array_equal(restored.df['diff'].to_numpy()[-100:], original.df['diff'].to_numpy()[-100:])
+        # 窗口所需的历史不在快照中, 迟到的bar被拒绝
+        with self.assertRaises(ValueError):
+            restored.update_time_series_element(self.time_series1[1990], self.time_series2[1990])
+
+    def test_tick_restore(self):
+        rng = np.random.default_rng(31)
+        rows = 2000
+        gaps = rng.exponential(scale=400 * 86400 / rows, size=rows).astype(np.int64)
+        date_times = np.datetime64('2023-01-01', 'ns') + np.cumsum(gaps).astype('timedelta64[s]')
+        series_b = 30.0 + np.cumsum(rng.normal(scale=0.2, size=rows))
+        series_a = 0.8 * series_b + 2.0 + rng.normal(scale=0.1, size=rows)
+        original = DiffCalculatorCrypto("A", "B", ResolutionLevel.Tick)
+        original.update_time_series((date_times[:1500], series_a[:1500]), (date_times[:1500], series_b[:1500]))
+        original.enable_streaming()
+        original.save_snapshot(self.path)
+        restored = DiffCalculatorCrypto.from_snapshot(self.path)
+        for calculator in (original, restored):
+            for i in range(1500, rows):
+                calculator.update_time_series_element(TimeSeriesElement(date_times[i], series_a[i]),
+                                                      TimeSeriesElement(date_times[i], series_b[i]))
+        self.assertGreater(restored.df['diff'].notna().sum(), 0)
+        np.testing.assert_array_equal(restored.df['diff'].to_numpy(), original.df['diff'].to_numpy())
+
+    def test_rejects_stale_or_mismatched_snapshot(self):
+        self.make_streaming(500).save_snapshot(self.path)
+        with self.assertRaises(ValueError):
+            DiffCalculatorCrypto.from_snapshot(self.path)
+        other = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Daily)
+        with self.assertRaises(ValueError):
+            other.load_snapshot(self.path)
+
+        with np.load(self.path) as data:
+            arrays = {name: data[name] for name in data.files}
+        meta = json.loads(arrays['meta'].tobytes().decode('utf-8'))
+        meta['version'] = 0
+        arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+        np.savez(self.path, **arrays)
+        with self.assertRaises(ValueError):
+            DiffCalculatorSP500.from_snapshot(self.path)
+
+    def test_requires_streaming(self):
+        calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        with self.assertRaises(ValueError):
+            calculator.save_snapshot(self.path)
+
+    def test_periodic_checkpoints(self):
+        calculator = self.make_streaming(1500)
+        calculator.enable_checkpoints(self.path, every=10, on_exit=False)
+        self.feed(calculator, 1500, 1509)
+        self.assertFalse(os.path.exists(self.path))
+        self.feed(calculator, 1509, 1525)
+        meta = read_snapshot_meta(self.path)
+        self.assertEqual(meta['rows'], calculator.FixedWindowLength + 1)
+        self.assertEqual(np.datetime64(meta['last_date_time'], 'ns'), self.time_series1.date_times[1519])
+        calculator._save_checkpoint_on_exit()
+        self.assertEqual(np.datetime64(read_snapshot_meta(self.path)['last_date_time'], 'ns'),
+                         self.time_series1.date_times[1524])
+        calculator.disable_checkpoints()
+
+        calculator.enable_checkpoints(self.path, every=1, on_exit=False, history=300)
+        self.feed(calculator, 1525, 1526)
+        self.assertEqual(read_snapshot_meta(self.path)['rows'], 300)
+        calculator.disable_checkpoints()
+
+    def test_checkpoint_keeps_minimum_history(self):
+        calculator = self.make_streaming(1500)
+        calculator.enable_signal(window=40, entry=1.5, exit=0.3)
+        calculator.enable_checkpoints(self.path, every=50, on_exit=False)
+        self.feed(calculator, 1500, 1600)
+        calculator.disable_checkpoints()
+        self.assertEqual(read_snapshot_meta(self.path)['rows'], calculator.FixedWindowLength + 40 + 1)
+
+        # 恢复后可以继续处理新的bar和信号窗口内的迟到bar
+        restored = DiffCalculatorSP500.from_snapshot(self.path)
+        for target in (calculator, restored):
+            target.update_time_series_element(self.time_series1[1590], TimeSeriesElement(
+                self.time_series2[1590].date_time, self.time_series2[1590].value + 1.0))
+            self.feed(target, 1600, 1650)
+        np.testing.assert_allclose(restored.df['diff'].to_numpy(), calculator.df['diff'].to_numpy()[-len(restored.df):],
+                                   rtol=1e-9, atol=1e-8)
+        self.assertEqual(restored.signal.position, calculator.signal.position)
+
+    def test_exit_checkpoint_does_not_keep_calculator_alive(self):
+        calculator = self.make_streaming(500)
+        calculator.enable_checkpoints(self.path, every=1000)
+        reference = weakref.ref(calculator)
+        del calculator
+        gc.collect()
+        self.assertIsNone(reference())
+
+
+if __name__ == '__main__':
+    unittest.main()
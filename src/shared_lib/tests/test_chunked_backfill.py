@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.shared_lib.bll.chunked_backfill import ChunkedBackfill, backfill, iter_aligned_chunks
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500, DiffCalculatorCrypto
+from src.shared_lib.bll.regression import rolling_ols_time
+from src.shared_lib.bll.time_series_loader import NpyColumnWriter, convert_csv, load_columns, load_time_series
+from src.shared_lib.models.enums import ResolutionLevel
+
+
+class TestChunkedBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = Path(__file__).parent / "data"
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self.temp_dir.name, "output")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def batch_calculator(self):
+        calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        calculator.update_time_series(load_time_series(self.data_dir / "AAPL.csv", dropna=True),
+                                      load_time_series(self.data_dir / "ABNB.csv", dropna=True), alignment='inner')
+        calculator.update_diff_and_equation()
+        return calculator
+
+    def test_matches_batch(self):
+        calculator = self.batch_calculator()
+        result = calculator.backfill_chunked(self.data_dir / "AAPL.csv", self.data_dir / "ABNB.csv",
+                                             self.output_dir, chunksize=97)
+        self.assertTrue((pd.DatetimeIndex(result['date_time']) == calculator.df.index).all())
+        np.testing.assert_allclose(result['slope'], calculator.df['slope'], rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(result['diff'], calculator.df['diff'], rtol=1e-9, atol=1e-8, equal_nan=True)
+
+        # 结果目录可以作为 .npy 列目录再次读取
+        columns = load_columns(self.output_dir, ['diff'], date_column='date_time')
+        np.testing.assert_allclose(columns['diff'], calculator.df['diff'], rtol=1e-9, atol=1e-8, equal_nan=True)
+
+    def test_float32_storage(self):
+        calculator = self.batch_calculator()
+        result = calculator.backfill_chunked(self.data_dir / "AAPL.csv", self.data_dir / "ABNB.csv",
+                                             self.output_dir, chunksize=500, dtype=np.float32)
+        self.assertEqual(result['diff'].dtype, np.float32)
+        np.testing.assert_allclose(result['diff'], calculator.df['diff'], atol=1e-4, equal_nan=True)
+
+    def test_npy_source(self):
+        calculator = self.batch_calculator()
+        directory1 = os.path.join(self.temp_dir.name, "AAPL")
+        directory2 = os.path.join(self.temp_dir.name, "ABNB")
+        convert_csv(self.data_dir / "AAPL.csv", directory1)
+        convert_csv(self.data_dir / "ABNB.csv", directory2)
+        result = backfill(directory1, directory2, self.output_dir, window=calculator.FixedWindowLength, chunksize=300)
+        np.testing.assert_allclose(result['diff'], calculator.df['diff'], rtol=1e-9, atol=1e-8, equal_nan=True)
+
+    def test_time_window_matches_batch(self):
+        rng = np.random.default_rng(5)
+        rows = 3000
+        gaps = rng.exponential(scale=400 * 86400 / rows, size=rows).astype(np.int64)
+        date_times = np.datetime64('2023-01-01', 'ns') + np.cumsum(gaps).astype('timedelta64[s]')
+        series_b = 30.0 + np.cumsum(rng.normal(scale=0.2, size=rows))
+        series_a = 0.8 * series_b + 2.0 + rng.normal(scale=0.1, size=rows)
+        duration = DiffCalculatorCrypto("A", "B", ResolutionLevel.Tick).WindowDuration
+
+        engine = ChunkedBackfill(duration=duration)
+        chunks = [(date_times[start:start + 250], series_a[start:start + 250], series_b[start:start + 250])
+                  for start in range(0, rows, 250)]
+        result = engine.run(chunks, self.output_dir)
+        slope, intercept = rolling_ols_time(series_a, series_b, date_times, duration)
+        self.assertGreater(np.isfinite(slope).sum(), 0)
+        np.testing.assert_allclose(result['slope'], slope, rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(result['intercept'], intercept, rtol=1e-9, atol=1e-8, equal_nan=True)
+        self.assertEqual(engine.rows, rows)
+
+    def test_alignment_across_chunks(self):
+        date_times = pd.date_range('2024-01-01', periods=40, freq='h')
+        values = np.arange(40, dtype=np.float64)
+        path1 = os.path.join(self.temp_dir.name, "a.csv")
+        path2 = os.path.join(self.temp_dir.name, "b.csv")
+        pd.DataFrame({'DateTime': date_times[::2], 'Close': values[::2]}).to_csv(path1, index=False)
+        frame2 = pd.DataFrame({'DateTime': date_times[::3], 'Close': values[::3] * 10})
+        frame2.loc[2, 'Close'] = np.nan
+        frame2.to_csv(path2, index=False)
+
+        chunks = list(iter_aligned_chunks(path1, path2, chunksize=4))
+        aligned = np.concatenate([chunk[0] for chunk in chunks])
+        expected = date_times[::6].to_numpy()
+        expected = expected[expected != date_times[6].to_numpy()]
+        np.testing.assert_array_equal(aligned, expected)
+        for chunk_date_times, series_a, series_b in chunks:
+            np.testing.assert_allclose(series_b, series_a * 10)
+
+    def test_writer_appends(self):
+        with NpyColumnWriter(self.output_dir, {'x': np.float32}) as writer:
+            writer.append({'x': np.arange(3)})
+            writer.append({'x': np.arange(3, 10)})
+        np.testing.assert_array_equal(np.load(os.path.join(self.output_dir, 'x.npy')), np.arange(10, dtype=np.float32))
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            ChunkedBackfill(window=1)
+        with self.assertRaises(ValueError):
+            ChunkedBackfill(window=10, duration=np.timedelta64(1, 'D'))
+
+
+if __name__ == '__main__':
+    unittest.main()
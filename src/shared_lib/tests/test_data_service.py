@@ -1,11 +1,27 @@
+import socket
+import tempfile
 import unittest
+from pathlib import Path
+import numpy as np
 import pandas as pd
 
-from shared_lib.bll.data_source_service import get_data
+from src.shared_lib.bll.data_source_service import get_data, CsvFileDataProvider, IDataProvider, MarketDataService
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.models.enums import ResolutionLevel
+
+
+def network_available(host: str = "query1.finance.yahoo.com", port: int = 443) -> bool:
+    try:
+        socket.create_connection((host, port), timeout=3).close()
+        return True
+    except OSError:
+        return False
 
 
 class TestDataService(unittest.TestCase):
     def test_get_data_not_empty(self):
+        if not network_available():
+            self.skipTest("network access to Yahoo Finance is not available")
         # 调用 get_data 方法
         df = get_data()
         # 检查 df 不为空
@@ -13,5 +29,100 @@ class TestDataService(unittest.TestCase):
         self.assertFalse(df.empty, "返回的 DataFrame 为空")
 
 
+class CountingCsvFileDataProvider(CsvFileDataProvider):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.requests = []
+
+    def fetch(self, symbol, start, end, interval):
+        self.requests.append((symbol, start, end))
+        return super().fetch(symbol, start, end, interval)
+
+
+class FrameDataProvider(IDataProvider):
+    """
+    从内存中的 DataFrame 返回数据, 数据可以在两次请求之间改变.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.requests = []
+
+    def fetch(self, symbol, start, end, interval):
+        self.requests.append((symbol, start, end))
+        return self.df[(self.df.index >= start) & (self.df.index < end)]
+
+
+def make_frame(date_times):
+    close = 100.0 + np.arange(len(date_times), dtype=np.float64)
+    return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': close},
+                        index=pd.DatetimeIndex(date_times, name='DateTime'))
+
+
+class TestMarketDataService(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.provider = CountingCsvFileDataProvider(str(Path(__file__).parent / "data"))
+        self.service = MarketDataService(self.provider, cache_dir=self.tmp_dir.name, max_workers=4,
+                                         max_requests_per_second=100)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_history_feeds_diff_calculator(self):
+        history = self.service.get_history(["AAPL", "ABNB"], "2023-01-01", "2024-01-01", ResolutionLevel.Hourly)
+        calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        calculator.update_time_series(history["AAPL"], history["ABNB"])
+        calculator.update_diff_and_equation()
+        self.assertFalse(calculator.df['diff'].isna().all())
+
+    def test_only_missing_ranges_are_fetched(self):
+        self.service.get_frames(["AAPL", "ABNB"], "2023-03-01", "2023-06-01")
+        self.assertEqual(len(self.provider.requests), 2)
+
+        # 已缓存的范围不再请求数据源
+        frames = self.service.get_frames(["AAPL"], "2023-04-01", "2023-05-01")
+        self.assertEqual(len(self.provider.requests), 2)
+        self.assertFalse(frames["AAPL"].empty)
+
+        # 只请求缺失的尾部
+        self.service.get_frames(["AAPL"], "2023-03-01", "2023-07-01")
+        self.assertEqual(self.provider.requests[-1][1:], (pd.Timestamp("2023-06-01"), pd.Timestamp("2023-07-01")))
+
+    def test_future_end_is_not_marked_covered(self):
+        self.service.get_frames(["AAPL"], "2023-03-01", "2030-01-01", '1h')
+        last = self.service.cache.read("AAPL", '1h').index[-1]
+        self.assertEqual(self.service.cache.coverage("AAPL", '1h')[1], last + pd.Timedelta(hours=1))
+
+        # 覆盖范围之后的部分下次重新获取
+        self.service.get_frames(["AAPL"], "2023-03-01", "2030-01-01", '1h')
+        self.assertEqual(self.provider.requests[-1][1:], (last + pd.Timedelta(hours=1), pd.Timestamp("2030-01-01")))
+
+    def test_incremental_refresh_replaces_incomplete_bars(self):
+        # 第60个bar是当前小时未完成的bar
+        date_times = pd.date_range(end=pd.Timestamp.now().floor('h') + pd.Timedelta(hours=40), periods=100, freq='h')
+        provider = FrameDataProvider(make_frame(date_times[:60]))
+        provider.df.iloc[-1] = 0.0
+        service = MarketDataService(provider, cache_dir=self.tmp_dir.name)
+        service.get_frames(["X"], date_times[0], date_times[-1] + pd.Timedelta(hours=1), '1h')
+        covered_end = service.cache.coverage("X", '1h')[1]
+        self.assertLess(covered_end, date_times[59])
+
+        provider.df = make_frame(date_times)
+        frames = service.get_frames(["X"], date_times[0], date_times[-1] + pd.Timedelta(hours=1), '1h')
+        self.assertEqual(provider.requests[-1][1], covered_end)
+        np.testing.assert_array_equal(frames["X"].index.to_numpy(dtype='datetime64[ns]'),
+                                      date_times.to_numpy(dtype='datetime64[ns]'))
+        np.testing.assert_array_equal(frames["X"].to_numpy(), provider.df.to_numpy())
+
+    def test_get_data_uses_service(self):
+        date_times = pd.date_range(pd.Timestamp.now().normalize() - pd.Timedelta(days=3), periods=3 * 24, freq='h')
+        provider = FrameDataProvider(make_frame(date_times))
+        df = get_data("X", '1h', MarketDataService(provider))
+        self.assertEqual(provider.requests[0][0], "X")
+        self.assertEqual(len(df), 24)
+        self.assertTrue((df.index.normalize() == date_times[-1].normalize()).all())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500, STAGE_INGEST, STAGE_WINDOW, STAGE_OLS, \
+    STAGE_MUTATION, COUNTER_ROWS, COUNTER_REFITS
+from src.shared_lib.bll.metrics import InMemoryMetricsSink, LatencyHistogram
+from src.shared_lib.models.enums import ResolutionLevel
+from src.shared_lib.models.time_series import *
+
+
+class TestDiffCalculatorMetrics(unittest.TestCase):
+
+    def setUp(self):
+        rows = 200
+        rng = np.random.default_rng(7)
+        date_times = np.datetime64('2024-01-01', 'ns') + np.arange(rows) * np.timedelta64(1, 'D')
+        series_b = 100.0 + np.cumsum(rng.normal(size=rows))
+        series_a = 2.0 * series_b + rng.normal(size=rows)
+        self.time_series1 = TimeSeries.from_numpy(date_times, series_a)
+        self.time_series2 = TimeSeries.from_numpy(date_times, series_b)
+        self.window = DiffCalculatorSP500("A", "B", ResolutionLevel.Daily).FixedWindowLength
+
+    def test_disabled_by_default(self):
+        calculator = DiffCalculatorSP500("A", "B", ResolutionLevel.Daily)
+        self.assertIsNone(calculator.metrics)
+        calculator.update_time_series(self.time_series1, self.time_series2)
+        calculator.update_diff_and_equation()
+
+    def test_batch_stages_and_counters(self):
+        calculator = DiffCalculatorSP500("A", "B", ResolutionLevel.Daily)
+        sink = calculator.enable_metrics()
+        calculator.update_time_series(self.time_series1, self.time_series2)
+        calculator.update_diff_and_equation()
+
+        snapshot = sink.snapshot()
+        self.assertEqual(snapshot['counters'][COUNTER_ROWS], 200)
+        self.assertEqual(snapshot['counters'][COUNTER_REFITS], 200 - self.window)
+        for stage in (STAGE_INGEST, STAGE_WINDOW, STAGE_OLS, STAGE_MUTATION):
+            self.assertEqual(snapshot['timings'][stage]['count'], 1)
+            self.assertGreater(snapshot['timings'][stage]['total'], 0.0)
+
+    def test_element_updates(self):
+        seed = 150
+        for streaming in (False, True):
+            calculator = DiffCalculatorSP500("A", "B", ResolutionLevel.Daily)
+            calculator.update_time_series(self.time_series1[:seed], self.time_series2[:seed])
+            if streaming:
+                calculator.enable_streaming()
+            sink = InMemoryMetricsSink()
+            self.assertIs(calculator.enable_metrics(sink), sink)
+            for elm1, elm2 in zip(self.time_series1[seed:], self.time_series2[seed:]):
+                calculator.update_time_series_element(elm1, elm2)
+
+            snapshot = sink.snapshot()
+            self.assertEqual(snapshot['counters'][COUNTER_ROWS], 50)
+            self.assertEqual(snapshot['counters'][COUNTER_REFITS], 50)
+            self.assertEqual(snapshot['timings'][STAGE_OLS]['count'], 50)
+            self.assertNotIn(STAGE_INGEST, snapshot['timings'])
+
+            calculator.disable_metrics()
+            calculator.update_time_series_element(TimeSeriesElement(np.datetime64('2030-01-01'), 1.0),
+                                                  TimeSeriesElement(np.datetime64('2030-01-01'), 1.0))
+            self.assertEqual(sink.snapshot()['counters'][COUNTER_ROWS], 50)
+
+    def test_histogram_quantiles(self):
+        histogram = LatencyHistogram()
+        for seconds in [1e-5] * 99 + [1e-2]:
+            histogram.record(seconds)
+        self.assertEqual(histogram.count, 100)
+        self.assertLess(histogram.quantile(0.5), 2e-5)
+        self.assertGreaterEqual(histogram.quantile(0.5), 1e-5)
+        self.assertEqual(histogram.quantile(1.0), 1e-2)
+        self.assertAlmostEqual(histogram.mean, (99 * 1e-5 + 1e-2) / 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
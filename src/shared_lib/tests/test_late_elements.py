@@ -0,0 +1,157 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500, DiffCalculatorCrypto, COUNTER_REFITS, \
+    COUNTER_SIGNAL_REPLAYS
+from src.shared_lib.models.enums import ResolutionLevel, SignalType
+from src.shared_lib.models.time_series import *
+
+
+class TestLateElements(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(23)
+        rows = 800
+        self.date_times = np.datetime64('2024-01-02T09:30', 'ns') + np.arange(rows) * np.timedelta64(1, 'h')
+        self.series_b = 50.0 + np.cumsum(rng.normal(scale=0.3, size=rows))
+        self.series_a = 1.3 * self.series_b + 4.0 + rng.normal(scale=0.2, size=rows)
+        self.late = [120, 400, 401, 790]
+        self.early = np.setdiff1d(np.arange(rows), self.late)
+
+    def make_calculator(self, rows, calculator_class=DiffCalculatorSP500, resolution=ResolutionLevel.Hourly):
+        calculator = calculator_class("A", "B", resolution)
+        if calculator.WindowDuration is None:
+            calculator.FixedWindowLength = 50
+        calculator.update_time_series((self.date_times[rows], self.series_a[rows]),
+                                      (self.date_times[rows], self.series_b[rows]))
+        calculator.update_diff_and_equation()
+        return calculator
+
+    def element(self, i, value_a=None, value_b=None):
+        date_time = pd.Timestamp(self.date_times[i]).to_pydatetime()
+        return (TimeSeriesElement(date_time, self.series_a[i] if value_a is None else value_a),
+                TimeSeriesElement(date_time, self.series_b[i] if value_b is None else value_b))
+
+    def assert_matches_batch(self, calculator, rows=None):
+        expected = self.make_calculator(np.arange(len(self.date_times)) if rows is None else rows,
+                                        type(calculator), calculator.resolution)
+        actual = calculator.df
+        self.assertTrue(actual.index.equals(expected.df.index))
+        for name in ('slope', 'intercept', 'diff'):
+            np.testing.assert_allclose(actual[name].to_numpy(dtype=np.float64), expected.df[name].to_numpy(),
+                                       rtol=1e-9, atol=1e-8, equal_nan=True)
+
+    def test_dataframe_late_insert(self):
+        calculator = self.make_calculator(self.early)
+        calculator.enable_metrics()
+        for i in self.late:
+            calculator.update_time_series_element(*self.element(i))
+        self.assert_matches_batch(calculator)
+        # 只重新计算窗口覆盖迟到bar的行
+        self.assertLessEqual(calculator.metrics.counters[COUNTER_REFITS], len(self.late) * 51)
+
+    def test_dataframe_correction_and_delete(self):
+        calculator = self.make_calculator(np.arange(len(self.date_times)))
+        self.series_a[300] += 5.0
+        calculator.update_time_series_element(*self.element(300))
+        self.assert_matches_batch(calculator)
+
+        calculator.update_time_series_element(*self.element(500, value_a=np.nan))
+        self.assert_matches_batch(calculator, np.setdiff1d(np.arange(len(self.date_times)), [500]))
+
+    def test_streaming_late_insert(self):
+        calculator = self.make_calculator(self.early)
+        calculator.enable_streaming()
+        for i in self.late:
+            calculator.update_time_series_element(*self.element(i))
+        self.assert_matches_batch(calculator)
+
+        # 窗口状态已经重建, 之后的bar与批量计算一致
+        rows = len(self.date_times)
+        self.date_times = np.append(self.date_times, self.date_times[-1] + np.timedelta64(1, 'h'))
+        self.series_a = np.append(self.series_a, self.series_a[-1] + 0.5)
+        self.series_b = np.append(self.series_b, self.series_b[-1])
+        calculator.update_time_series_element(*self.element(rows))
+        self.assert_matches_batch(calculator)
+
+    @staticmethod
+    def event_keys(events):
+        return [(pd.Timestamp(event.date_time), event.signal_type) for event in events]
+
+    def test_signal_after_late_insert(self):
+        calculator = self.make_calculator(self.early)
+        calculator.enable_streaming()
+        calculator.enable_metrics()
+        signal = calculator.enable_signal(window=30, entry=1.5, exit=0.3)
+        for i in self.late:
+            calculator.update_time_series_element(*self.element(i))
+        expected = self.make_calculator(np.arange(len(self.date_times)))
+        expected_signal = expected.enable_signal(window=30, entry=1.5, exit=0.3)
+        self.assertEqual(self.event_keys(signal.events), self.event_keys(expected_signal.events))
+        np.testing.assert_array_equal(signal.row_states, expected_signal.row_states)
+        # 只重放 diff 和 z-score 受影响的行, 而不是整个历史
+        self.assertLessEqual(calculator.metrics.counters[COUNTER_SIGNAL_REPLAYS],
+                             len(self.late) * (calculator.FixedWindowLength + 1 + 4 * signal.window))
+
+    def test_signal_event_from_late_bar(self):
+        rows = np.setdiff1d(np.arange(len(self.date_times)), [500])
+        self.series_a[500] += 20.0
+        for streaming in (False, True):
+            calculator = self.make_calculator(rows)
+            if streaming:
+                calculator.enable_streaming()
+            received = []
+            signal = calculator.enable_signal(window=30, entry=1.5, exit=0.3, on_event=received.append)
+            calculator.update_time_series_element(*self.element(500))
+
+            date_time = pd.Timestamp(self.date_times[500])
+            self.assertIn((date_time, SignalType.EnterShort), self.event_keys(received))
+            self.assertTrue(all(pd.Timestamp(event.date_time) >= date_time for event in received))
+            expected = self.make_calculator(np.arange(len(self.date_times))).enable_signal(window=30, entry=1.5,
+                                                                                           exit=0.3)
+            self.assertEqual(self.event_keys(signal.events), self.event_keys(expected.events))
+            self.assertEqual(signal.position, expected.position)
+
+
+class TestLateTickElements(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(29)
+        rows = 2000
+        gaps = rng.exponential(scale=400 * 86400 / rows, size=rows).astype(np.int64)
+        self.date_times = np.datetime64('2023-01-01', 'ns') + np.cumsum(gaps).astype('timedelta64[s]')
+        self.series_b = 30.0 + np.cumsum(rng.normal(scale=0.2, size=rows))
+        self.series_a = 0.8 * self.series_b + 2.0 + rng.normal(scale=0.1, size=rows)
+
+    def make_calculator(self, rows):
+        calculator = DiffCalculatorCrypto("A", "B", ResolutionLevel.Tick)
+        calculator.update_time_series((self.date_times[rows], self.series_a[rows]),
+                                      (self.date_times[rows], self.series_b[rows]))
+        calculator.update_diff_and_equation()
+        return calculator
+
+    def element(self, i):
+        return (TimeSeriesElement(self.date_times[i], self.series_a[i]),
+                TimeSeriesElement(self.date_times[i], self.series_b[i]))
+
+    def check(self, streaming: bool):
+        late = [0, 700, 1500, 1998]
+        calculator = self.make_calculator(np.setdiff1d(np.arange(len(self.date_times)), late))
+        if streaming:
+            calculator.enable_streaming()
+        for i in late:
+            calculator.update_time_series_element(*self.element(i))
+        expected = self.make_calculator(np.arange(len(self.date_times)))
+        self.assertGreater(expected.df['diff'].notna().sum(), 0)
+        np.testing.assert_allclose(calculator.df['diff'].to_numpy(dtype=np.float64), expected.df['diff'].to_numpy(),
+                                   rtol=1e-9, atol=1e-8, equal_nan=True)
+
+    def test_dataframe_late_insert(self):
+        self.check(streaming=False)
+
+    def test_streaming_late_insert(self):
+        self.check(streaming=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from src.shared_lib.benchmarks.bench_import_time import HEAVY_MODULES
+
+REPO_ROOT = Path(__file__).resolve().parents[3]
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def loaded_heavy_modules(self, *modules):
+        """
+        在新进程中导入 modules, 返回其中被加载的 HEAVY_MODULES.
+        """
+        script = (f"import sys\nimport {', '.join(modules)}\n"
+                  f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+        completed = subprocess.run([sys.executable, '-c', script], cwd=REPO_ROOT, capture_output=True, text=True,
+                                   check=True)
+        return [name for name in completed.stdout.strip().split(',') if name]
+
+    def test_core_modules_do_not_import_heavy_dependencies(self):
+        self.assertEqual(self.loaded_heavy_modules('src.shared_lib.bll.diff_calculator',
+                                                   'src.shared_lib.models.time_series',
+                                                   'src.shared_lib.bll.log_service',
+                                                   'src.shared_lib.bll.data_source_service',
+                                                   'src.shared_lib.bll.parallel_pair_scanner'), [])
+
+    def test_diagnostics_still_available(self):
+        from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+        calculator = DiffCalculatorSP500("A", "B")
+        result = calculator.ols_regression([1.0, 2.1, 2.9, 4.2], [1.0, 2.0, 3.0, 4.0], diagnostics=True)
+        self.assertIn('rsquared', result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import logging
+import os
+import queue
+import tempfile
+import unittest
+from unittest import mock
+from src.shared_lib.bll.log_service import CustomHandler, BatchingQueueListener, ThreadQueueHandler, log_metrics
+from src.shared_lib.bll.metrics import InMemoryMetricsSink
+
+
+class TestLogService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_filename = os.path.join(self.tmp_dir.name, 'test.log')
+        self.logger = logging.getLogger(f"test_log_service.{self.id()}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+        self.tmp_dir.cleanup()
+
+    def read_all_lines(self):
+        lines = []
+        for file_name in os.listdir(self.tmp_dir.name):
+            with open(os.path.join(self.tmp_dir.name, file_name), encoding='utf-8') as f:
+                lines.extend(f.read().splitlines())
+        return lines
+
+    def test_size_rollover_keeps_every_record(self):
+        handler = CustomHandler(self.log_filename, maxBytes=500, backupCount=100, when='midnight', encoding='utf-8')
+        self.logger.addHandler(handler)
+        with mock.patch('os.path.getsize', side_effect=AssertionError("stat per record")):
+            for i in range(200):
+                self.logger.info(f"message {i:04d}")
+        handler.close()
+
+        # 同一天内多次按大小滚动, 备份文件不互相覆盖
+        file_names = os.listdir(self.tmp_dir.name)
+        self.assertGreater(len(file_names), 5)
+        for file_name in file_names:
+            self.assertLessEqual(os.path.getsize(os.path.join(self.tmp_dir.name, file_name)), 500)
+        self.assertEqual(sorted(self.read_all_lines()), [f"message {i:04d}" for i in range(200)])
+
+    def test_backup_count(self):
+        handler = CustomHandler(self.log_filename, maxBytes=100, backupCount=3, when='midnight', encoding='utf-8')
+        self.logger.addHandler(handler)
+        for i in range(100):
+            self.logger.info(f"message {i:04d}")
+        handler.close()
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 4)
+        # 保留的是最新的记录
+        self.assertIn("message 0099", self.read_all_lines())
+
+    def test_time_rollover(self):
+        handler = CustomHandler(self.log_filename, maxBytes=10 ** 6, backupCount=3, when='midnight', encoding='utf-8')
+        self.logger.addHandler(handler)
+        self.logger.info("before midnight")
+        handler.rolloverAt = 0
+        self.logger.info("after midnight")
+        handler.close()
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 2)
+        with open(self.log_filename, encoding='utf-8') as f:
+            self.assertEqual(f.read().splitlines(), ["after midnight"])
+
+    def test_asynchronous_batching(self):
+        handler = CustomHandler(self.log_filename, maxBytes=10 ** 6, backupCount=3, when='midnight',
+                                encoding='utf-8', flush_on_emit=False)
+        log_queue = queue.SimpleQueue()
+        self.logger.addHandler(ThreadQueueHandler(log_queue))
+        listener = BatchingQueueListener(log_queue, handler, batch_size=64)
+        with mock.patch.object(handler, 'flush', wraps=handler.flush) as flush:
+            listener.start()
+            for i in range(1000):
+                self.logger.info("message %d", i)
+            listener.stop()
+            self.assertLess(flush.call_count, 1000)
+        handler.close()
+        self.assertEqual(self.read_all_lines(), [f"message {i}" for i in range(1000)])
+
+    def test_log_metrics(self):
+        sink = InMemoryMetricsSink()
+        sink.increment("rows", 3)
+        sink.record_timing("stage", 2e-3)
+        with self.assertLogs(self.logger, level='INFO') as logs:
+            log_metrics(sink, self.logger)
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn("rows count=3", logs.output[0])
+        self.assertIn("stage count=1", logs.output[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
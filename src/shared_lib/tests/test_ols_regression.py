@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorCrypto
+from src.shared_lib.models.enums import ResolutionLevel
+
+
+class TestOLSRegression(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.series_b = 30.0 + np.cumsum(rng.normal(size=200))
+        self.series_a = 0.5 * self.series_b + 2.0 + rng.normal(scale=0.1, size=200)
+        self.calculator = DiffCalculatorCrypto("ALGOUSDT", "DASHUSDT", resolution=ResolutionLevel.Daily)
+
+    def test_fast_path_matches_statsmodels(self):
+        fast = self.calculator.ols_regression(self.series_a, self.series_b)
+        full = self.calculator.ols_regression(self.series_a, self.series_b, diagnostics=True)
+        self.assertEqual(set(fast), {"slope", "intercept"})
+        np.testing.assert_allclose(fast["slope"], full["slope"], rtol=1e-10)
+        np.testing.assert_allclose(fast["intercept"], full["intercept"], rtol=1e-10)
+        self.assertGreater(full["rsquared"], 0.9)
+        self.assertEqual(full["nobs"], 200)
+
+    def test_batch(self):
+        windows_a = np.lib.stride_tricks.sliding_window_view(self.series_a, 50)
+        windows_b = np.lib.stride_tricks.sliding_window_view(self.series_b, 50)
+        result = self.calculator.ols_regression_batch(windows_a, windows_b)
+        self.assertEqual(result["slope"].shape, (len(windows_a),))
+        for i in (0, 75, len(windows_a) - 1):
+            single = self.calculator.ols_regression(windows_a[i], windows_b[i])
+            np.testing.assert_allclose(result["slope"][i], single["slope"], rtol=1e-12)
+            np.testing.assert_allclose(result["intercept"][i], single["intercept"], rtol=1e-12)
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            self.calculator.ols_regression([], [])
+        with self.assertRaises(ValueError):
+            self.calculator.ols_regression([1.0, 2.0], [1.0])
+        with self.assertRaises(ValueError):
+            self.calculator.ols_regression([1.0], [1.0])
+        with self.assertRaises(ValueError):
+            self.calculator.ols_regression(np.array([1.0, "a"], dtype=object), [1.0, 2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from pathlib import Path
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.bll.pair_backtester import PairBacktester, positions, simulate
+from src.shared_lib.bll.spread_signal import SpreadSignal, rolling_zscore
+from src.shared_lib.bll.time_series_loader import load_time_series
+from src.shared_lib.models.enums import ResolutionLevel
+
+
+class TestPairBacktester(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        data_dir = Path(__file__).parent / "data"
+        cls.calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        cls.calculator.update_time_series(load_time_series(data_dir / "AAPL.csv", dropna=True),
+                                          load_time_series(data_dir / "ABNB.csv", dropna=True))
+        cls.calculator.update_diff_and_equation()
+
+    def reference(self, backtester, entry, exit, stop, cost):
+        """
+        逐行的参考实现: 持仓来自 SpreadSignal, 对冲比例取开仓时的 slope.
+        """
+        signal = SpreadSignal(backtester.window, entry, exit, stop)
+        quantity_a = quantity_b = 0.0
+        equity = 0.0
+        curve = []
+        for i, diff in enumerate(backtester.diff):
+            if i > 0:
+                equity += (quantity_a * (backtester.value_a[i] - backtester.value_a[i - 1])
+                           + quantity_b * (backtester.value_b[i] - backtester.value_b[i - 1]))
+            previous = signal.position
+            signal.update(i, diff)
+            new_a, new_b = quantity_a, quantity_b
+            if signal.position != previous:
+                new_a = float(signal.position)
+                new_b = -signal.position * backtester.slope[i] if signal.position else 0.0
+            equity -= cost * (abs(new_a - quantity_a) * backtester.value_a[i]
+                              + abs(new_b - quantity_b) * backtester.value_b[i])
+            quantity_a, quantity_b = new_a, new_b
+            curve.append(equity)
+        return np.array(curve)
+
+    def test_matches_reference(self):
+        backtester = PairBacktester(self.calculator, window=60)
+        for entry, exit, stop in [(2.0, 0.5, None), (1.5, 0.0, 3.0), (1.0, 0.25, 2.0)]:
+            result = backtester.run(entry, exit, stop, cost=0.0005)
+            np.testing.assert_allclose(result.equity, self.reference(backtester, entry, exit, stop, 0.0005),
+                                       rtol=1e-9, atol=1e-9)
+        self.assertGreater(result.stats()['trades'], 0)
+
+    def test_positions_batch_matches_single(self):
+        rng = np.random.default_rng(11)
+        _, _, zscore = rolling_zscore(np.cumsum(rng.normal(size=5000)), 40)
+        entries = np.array([[2.0], [1.5], [1.0]])
+        exits = np.array([[0.5], [0.0], [0.2]])
+        stops = np.array([[np.nan], [2.5], [3.0]])
+        batch, _ = positions(zscore, entries, exits, stops)
+        for k in range(3):
+            single, _ = positions(zscore, entries[k, 0], exits[k, 0], None if k == 0 else stops[k, 0])
+            np.testing.assert_array_equal(batch[k], single)
+
+    def test_grid_matches_run(self):
+        backtester = PairBacktester(self.calculator, window=60)
+        grid = backtester.grid([1.0, 1.5, 2.0], [0.0, 0.5, 1.5], [None, 3.0], cost=0.001, block_size=4)
+        # exit >= entry 的组合被跳过
+        self.assertEqual(len(grid), 14)
+        for row in grid.itertuples():
+            stats = backtester.run(row.entry, row.exit, None if np.isnan(row.stop) else row.stop, cost=0.001).stats()
+            self.assertAlmostEqual(row.total_pnl, stats['total_pnl'], places=9)
+            self.assertEqual(row.trades, stats['trades'])
+
+    def test_rebalance_and_frame(self):
+        backtester = PairBacktester(self.calculator, window=60)
+        frame = backtester.run_frame(1.5, 0.25, rebalance=True)
+        holding = frame['position'] != 0
+        np.testing.assert_allclose(frame['hedge'][holding], backtester.slope[holding.to_numpy()])
+        self.assertTrue(frame.index.equals(self.calculator.df.index))
+
+    def test_invalid_thresholds(self):
+        with self.assertRaises(ValueError):
+            positions(np.zeros(10), 1.0, 1.0)
+        with self.assertRaises(ValueError):
+            positions(np.zeros(10), 2.0, 0.5, 1.5)
+        with self.assertRaises(ValueError):
+            simulate(np.zeros(3), np.zeros(3), np.zeros(3), *positions(np.zeros(3), 1.0, 2.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
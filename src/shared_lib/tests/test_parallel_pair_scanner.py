@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+from src.shared_lib.bll import parallel_pair_scanner
+from src.shared_lib.bll.parallel_pair_scanner import ParallelPairScanner, last_values
+
+
+class TestParallelPairScanner(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.prices = 100.0 + np.cumsum(rng.normal(size=(300, 6)), axis=0)
+        self.symbols = [f"S{i}" for i in range(6)]
+
+    def test_scan_matches_engine(self):
+        scanner = ParallelPairScanner(self.prices, 30, symbols=self.symbols, max_workers=2)
+        expected = scanner.engine.compute()
+        pairs = scanner.engine.all_pairs()
+
+        results = {}
+        for chunk, result in scanner.scan(chunk_size=4):
+            for i, pair in enumerate(chunk):
+                results[pair] = result[:, i]
+
+        self.assertEqual(scanner.stats.pairs, len(pairs))
+        for i, pair in enumerate(pairs):
+            np.testing.assert_array_equal(results[pair], expected[:, i])
+
+    def test_scan_with_reducer(self):
+        scanner = ParallelPairScanner(self.prices, 30, symbols=self.symbols, max_workers=2)
+        for chunk, result in scanner.scan(pairs=[("S0", "S1"), ("S2", "S3")], reducer=last_values):
+            self.assertEqual(result.shape, (3, len(chunk)))
+
+    def test_worker_closes_shared_memory(self):
+        scanner = ParallelPairScanner(self.prices, 30, symbols=self.symbols, max_workers=1)
+        shm, layout = scanner._publish()
+        try:
+            parallel_pair_scanner._init_worker(shm.name, layout, scanner.engine.window, scanner.engine.symbols)
+            worker_shm = parallel_pair_scanner._worker_shm
+            parallel_pair_scanner._scan_chunk([("S0", "S1")], np.float64, last_values)
+            parallel_pair_scanner._close_worker()
+            self.assertIsNone(parallel_pair_scanner._worker_shm)
+            self.assertIsNone(worker_shm.buf)
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.shared_lib.bll.resampler import resample, MultiResolutionCache, SessionCalendar, SP500_CALENDAR, \
+    CRYPTO_CALENDAR
+from src.shared_lib.models.enums import ResolutionLevel
+from src.shared_lib.models.time_series import TimeSeries
+
+PANDAS_RULES = {
+    ResolutionLevel.Hourly: 'h',
+    ResolutionLevel.Daily: 'D',
+    ResolutionLevel.Weekly: 'W-MON',
+    ResolutionLevel.Monthly: 'MS',
+}
+
+
+class TestResampler(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        # 约70天的分钟数据, 随机缺失部分bar
+        date_times = np.arange('2024-01-29T00:00', '2024-04-08T00:00', dtype='datetime64[m]').astype('datetime64[ns]')
+        keep = rng.random(len(date_times)) > 0.1
+        self.date_times = date_times[keep]
+        self.values = 100.0 + np.cumsum(rng.normal(size=len(self.date_times)))
+        self.time_series = TimeSeries.from_numpy(self.date_times, self.values)
+        self.series = pd.Series(self.values, index=pd.DatetimeIndex(self.date_times))
+
+    def test_crypto_matches_pandas(self):
+        for resolution, rule in PANDAS_RULES.items():
+            for how in ('last', 'max', 'mean', 'count'):
+                # W-MON 在 pandas 中以周一为区间结束, 这里以周一为区间开始, 因此用 closed/label='left'
+                expected = self.series.resample(rule, closed='left', label='left').agg(how).dropna()
+                expected = expected[expected != 0] if how == 'count' else expected
+                result = resample(self.time_series, resolution, CRYPTO_CALENDAR, how)
+                np.testing.assert_array_equal(result.date_times, expected.index.to_numpy())
+                np.testing.assert_allclose(result.values, expected.to_numpy(dtype=np.float64), rtol=1e-12)
+
+    def test_sp500_session(self):
+        hourly = resample(self.time_series, ResolutionLevel.Hourly, SP500_CALENDAR)
+        times = pd.DatetimeIndex(hourly.date_times)
+        self.assertTrue((times.dayofweek < 5).all())
+        # 每个交易日的小时bar为 09:30, 10:30, ..., 15:30
+        self.assertEqual(sorted(set(times.strftime('%H:%M'))), [f"{hour:02d}:30" for hour in range(9, 16)])
+
+        daily = resample(self.time_series, ResolutionLevel.Daily, SP500_CALENDAR)
+        in_session = self.series.between_time('09:30', '15:59')
+        in_session = in_session[in_session.index.dayofweek < 5]
+        expected = in_session.groupby(in_session.index.normalize()).last()
+        np.testing.assert_array_equal(daily.values, expected.to_numpy())
+
+        calendar = SessionCalendar('09:30', '16:00', holidays=['2024-02-19'])
+        daily = resample(self.time_series, ResolutionLevel.Daily, calendar)
+        self.assertNotIn(np.datetime64('2024-02-19', 'ns'), daily.date_times)
+        self.assertEqual(len(daily), len(expected) - 1)
+
+    def test_incremental_matches_full(self):
+        for calendar in (CRYPTO_CALENDAR, SP500_CALENDAR):
+            for how in ('last', 'first', 'min', 'sum', 'mean'):
+                cache = MultiResolutionCache(calendar, how=how)
+                # 不规则的分批, 区间会跨越多次更新
+                bounds = [0, 7, 500, 501, 20000, 55555, len(self.time_series)]
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    cache.update(self.time_series[start:end])
+                for resolution in cache.resolutions:
+                    expected = resample(self.time_series, resolution, calendar, how)
+                    result = cache.get(resolution)
+                    np.testing.assert_array_equal(result.date_times, expected.date_times)
+                    np.testing.assert_allclose(result.values, expected.values, rtol=1e-9)
+                    self.assertEqual(len(cache.get(resolution, include_partial=False)), len(expected) - 1)
+
+    def test_out_of_order(self):
+        cache = MultiResolutionCache(CRYPTO_CALENDAR, resolutions=[ResolutionLevel.Minute, ResolutionLevel.Daily])
+        cache.update(self.time_series[:100])
+        cache.append_value(self.date_times[100], 1.0)
+        self.assertEqual(cache.last_date_time, self.date_times[100])
+        with self.assertRaises(ValueError):
+            cache.update(self.time_series[50:60])
+        with self.assertRaises(ValueError):
+            cache.get(ResolutionLevel.Hourly)
+        with self.assertRaises(ValueError):
+            MultiResolutionCache(CRYPTO_CALENDAR, resolutions=[ResolutionLevel.Tick])
+
+
+if __name__ == '__main__':
+    unittest.main()
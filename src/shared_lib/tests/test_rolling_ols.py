@@ -0,0 +1,63 @@
+import unittest
+from pathlib import Path
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.bll.time_series_loader import read_csv
+from src.shared_lib.bll.regression import rolling_ols, batch_ols_fit, RELATIVE_TOLERANCE, ABSOLUTE_TOLERANCE
+from src.shared_lib.models.enums import ResolutionLevel
+
+
+class TestRollingOLS(unittest.TestCase):
+
+    def load_close(self, symbol):
+        return read_csv(Path(__file__).parent / f"data/{symbol}.csv", ['Close'])['Close']
+
+    def test_matches_statsmodels(self):
+        series_a = self.load_close("AAPL")
+        series_b = self.load_close("ABNB")
+        valid = np.isfinite(series_a) & np.isfinite(series_b)
+        series_a, series_b = series_a[valid], series_b[valid]
+        calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        window = calculator.FixedWindowLength
+
+        slope, intercept = rolling_ols(series_a, series_b, window)
+
+        # 前window行没有足够的数据
+        self.assertTrue(np.isnan(slope[:window]).all())
+        self.assertFalse(np.isnan(slope[window:]).any())
+
+        # 抽样与statsmodels的结果比较
+        for i in range(window, len(series_a), 97):
+            expected = calculator.ols_regression(series_a[i - window:i], series_b[i - window:i], diagnostics=True)
+            np.testing.assert_allclose(slope[i], expected["slope"], rtol=RELATIVE_TOLERANCE)
+            np.testing.assert_allclose(intercept[i], expected["intercept"], rtol=0, atol=ABSOLUTE_TOLERANCE)
+
+    def test_long_history_precision(self):
+        # 数百万行的序列: 误差不应随序列长度增长
+        rows = 3_000_000
+        rng = np.random.default_rng(3)
+        series_b = 100.0 + np.cumsum(rng.normal(scale=0.1, size=rows))
+        series_a = 1.5 * series_b + 3.0 + np.cumsum(rng.normal(scale=0.05, size=rows))
+        for window in (126, 49140):
+            slope, intercept = rolling_ols(series_a, series_b, window)
+            checked = np.r_[np.linspace(window, rows - 1, 40).astype(int), rows - 1]
+            expected_slope, expected_intercept = batch_ols_fit(
+                np.stack([series_a[i - window:i] for i in checked]), np.stack([series_b[i - window:i] for i in checked]))
+            np.testing.assert_allclose(slope[checked], expected_slope, rtol=RELATIVE_TOLERANCE)
+            np.testing.assert_allclose(intercept[checked], expected_intercept, rtol=0, atol=ABSOLUTE_TOLERANCE)
+
+    def test_degenerate_window(self):
+        series_b = np.array([1.0, 1.0, 1.0, 2.0, 3.0])
+        series_a = 2.0 * series_b + 1.0
+        slope, intercept = rolling_ols(series_a, series_b, 3)
+        self.assertTrue(np.isnan(slope[3]))
+        np.testing.assert_allclose(slope[4], 2.0)
+        np.testing.assert_allclose(intercept[4], 1.0)
+
+    def test_window_too_small(self):
+        with self.assertRaises(ValueError):
+            rolling_ols(np.arange(5.0), np.arange(5.0), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
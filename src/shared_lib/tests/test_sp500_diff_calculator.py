@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from pathlib import Path
 import pandas as pd
@@ -5,6 +7,7 @@ import matplotlib.pyplot as plt
 from matplotlib.dates import DateFormatter
 from matplotlib.ticker import MaxNLocator
 from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.bll.time_series_loader import load_time_series
 from src.shared_lib.models.enums import ResolutionLevel
 from src.shared_lib.models.time_series import *
 
@@ -14,21 +17,12 @@ class TestSP500DiffCalculator(unittest.TestCase):
 
     def load_time_series(self, full_path_filename):
         """
-        Load time series data from CSV using pandas.
+        Load the Close column of a CSV file as a columnar TimeSeries.
         The CSV file should have the format: DateTime,Open,High,Low,Close,Volume.
         :param full_path_filename: Path to the CSV file.
-        :return: List of TimeSeriesElement instances.
+        :return: TimeSeries
         """
-        # Read the CSV file
-        df = pd.read_csv(full_path_filename, parse_dates=['DateTime'])
-
-        # Convert the DataFrame to a list of TimeSeriesElement instances
-        time_series = [
-            TimeSeriesElement(row['DateTime'], row['Close'])
-            for _, row in df.iterrows()
-        ]
-
-        return time_series
+        return load_time_series(full_path_filename, 'Close')
 
     def test_calculate_diff(self):
         symbol1 = "AAPL"
@@ -50,11 +44,18 @@ class TestSP500DiffCalculator(unittest.TestCase):
         # Assert that 'diff' column is not empty
         self.assertFalse(calculator.df['diff'].isna().all(), "The 'diff' column should not be all NaN")
 
-        # Assert that 'equation' column is not empty
-        self.assertFalse(calculator.df['equation'].isna().all(), "The 'equation' column should not be all NaN")
+        # Assert that 'slope' and 'intercept' columns are float64 and not empty
+        self.assertEqual(calculator.df['slope'].dtype, 'float64')
+        self.assertFalse(calculator.df['slope'].isna().all(), "The 'slope' column should not be all NaN")
+        self.assertFalse(calculator.df['intercept'].isna().all(), "The 'intercept' column should not be all NaN")
+
+        # equation is rendered on request only
+        self.assertNotIn('equation', calculator.df.columns)
+        self.assertEqual(len(calculator.equations()), calculator.df['slope'].notna().sum())
+        self.assertTrue(calculator.equation().startswith(f"diff = {symbol1} - ("))
 
         # Optionally, print some values for debugging
-        print(calculator.df[['diff', 'equation']].tail())
+        print(calculator.to_frame(with_equation=True)[['diff', 'equation']].tail())
 
     def test_draw_diff_chart(self):
         symbol1 = "AAPL"
@@ -94,8 +95,11 @@ class TestSP500DiffCalculator(unittest.TestCase):
         plt.xticks(rotation=45)  # Rotate x-axis labels for better readability
         plt.tight_layout()
 
-        # Save or show the plot
-        plt.savefig(f"diff_chart_{symbol1}_{symbol2}.png")  # Save the chart as a PNG file
+        # Save or show the plot; the chart goes to a temporary directory, not the working directory
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, f"diff_chart_{symbol1}_{symbol2}.png")
+            plt.savefig(path)  # Save the chart as a PNG file
+            self.assertGreater(os.path.getsize(path), 0)
         plt.show()  # Display the chart
 
 
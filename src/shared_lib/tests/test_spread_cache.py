@@ -0,0 +1,98 @@
+import tempfile
+import unittest
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.bll.spread_cache import SpreadCache
+from src.shared_lib.models.enums import ResolutionLevel
+
+
+class TestSpreadCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(5)
+        self.date_times = np.arange('2023-01-01', '2024-03-01', dtype='datetime64[D]').astype('datetime64[ns]')
+        self.series_b = 50.0 + np.cumsum(rng.normal(size=len(self.date_times)))
+        self.series_a = 1.5 * self.series_b + rng.normal(size=len(self.date_times))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_calculator(self, rows):
+        calculator = DiffCalculatorSP500("AAA", "BBB", resolution=ResolutionLevel.Daily)
+        calculator.update_time_series((self.date_times[:rows], self.series_a[:rows]),
+                                      (self.date_times[:rows], self.series_b[:rows]))
+        return calculator
+
+    def test_incremental_refresh_matches_full_computation(self):
+        cache = SpreadCache(self.tmp_dir.name)
+        cache.refresh(self.make_calculator(300))
+
+        calculator = self.make_calculator(len(self.date_times))
+        cache.refresh(calculator)
+        key = SpreadCache.key_for(calculator)
+        self.assertEqual(cache.rows(key), len(self.date_times))
+
+        expected = self.make_calculator(len(self.date_times))
+        expected.update_diff_and_equation()
+        np.testing.assert_allclose(calculator.df['diff'], expected.df['diff'], rtol=1e-9, atol=1e-8)
+
+        # 按时间范围读取
+        part = cache.read(key, '2023-06-01', '2023-06-30')
+        self.assertEqual(len(part), 30)
+        np.testing.assert_allclose(part['diff'], expected.df.loc['2023-06-01':'2023-06-30', 'diff'],
+                                   rtol=1e-9, atol=1e-8)
+
+    def test_corrected_history_recomputes_entry(self):
+        cache = SpreadCache(self.tmp_dir.name)
+        cache.refresh(self.make_calculator(300))
+        self.series_a[250] += 10.0
+        calculator = self.make_calculator(320)
+        cache.refresh(calculator)
+        expected = self.make_calculator(320)
+        expected.update_diff_and_equation()
+        np.testing.assert_allclose(calculator.df['diff'], expected.df['diff'], rtol=1e-9, atol=1e-8)
+
+    def test_early_correction_recomputes_from_changed_row(self):
+        cache = SpreadCache(self.tmp_dir.name)
+        cache.refresh(self.make_calculator(300))
+        # 修正发生在窗口预热范围之前
+        self.series_a[20] += 10.0
+        calculator = self.make_calculator(320)
+        cache.refresh(calculator)
+        self.assertEqual(cache.rows(SpreadCache.key_for(calculator)), 320)
+        expected = self.make_calculator(320)
+        expected.update_diff_and_equation()
+        np.testing.assert_allclose(calculator.df['diff'], expected.df['diff'], rtol=1e-9, atol=1e-8)
+
+    def test_late_row_before_last_cached_timestamp(self):
+        cache = SpreadCache(self.tmp_dir.name)
+        missing = np.arange(300) != 150
+        first = DiffCalculatorSP500("AAA", "BBB", resolution=ResolutionLevel.Daily)
+        first.update_time_series((self.date_times[:300][missing], self.series_a[:300][missing]),
+                                 (self.date_times[:300][missing], self.series_b[:300][missing]))
+        cache.refresh(first)
+
+        calculator = self.make_calculator(320)
+        cache.refresh(calculator)
+        self.assertEqual(cache.rows(SpreadCache.key_for(calculator)), 320)
+        self.assertFalse(calculator.df['diff'].iloc[150:].isna().any())
+        expected = self.make_calculator(320)
+        expected.update_diff_and_equation()
+        np.testing.assert_allclose(calculator.df['diff'], expected.df['diff'], rtol=1e-9, atol=1e-8)
+
+    def test_eviction_by_size(self):
+        cache = SpreadCache(self.tmp_dir.name, max_bytes=1, max_age=timedelta(days=1))
+        first = self.make_calculator(200)
+        cache.refresh(first)
+        second = DiffCalculatorSP500("BBB", "AAA", resolution=ResolutionLevel.Daily)
+        second.update_time_series((self.date_times, self.series_b), (self.date_times, self.series_a))
+        cache.refresh(second)
+        self.assertEqual(cache.rows(SpreadCache.key_for(first)), 0)
+        self.assertEqual(cache.rows(SpreadCache.key_for(second)), len(self.date_times))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import asyncio
+import unittest
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.bll.spread_pipeline import Bar, SpreadPipeline, simulated_feed
+from src.shared_lib.models.enums import ResolutionLevel
+from src.shared_lib.models.time_series import TimeSeries
+
+
+class TestSpreadPipeline(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        date_times = np.arange('2024-01-01', '2024-12-01', dtype='datetime64[D]').astype('datetime64[ns]')
+        self.series = {symbol: TimeSeries.from_numpy(date_times, 50.0 + np.cumsum(rng.normal(size=len(date_times))))
+                       for symbol in ('AAA', 'BBB', 'CCC')}
+
+    def make_calculators(self):
+        calculators = []
+        for symbol1, symbol2 in (('AAA', 'BBB'), ('AAA', 'CCC'), ('CCC', 'BBB')):
+            calculator = DiffCalculatorSP500(symbol1, symbol2, resolution=ResolutionLevel.Daily)
+            calculator.enable_streaming()
+            calculators.append(calculator)
+        return calculators
+
+    async def collect(self, pipeline, delay=0.0, feed=None):
+        updates = []
+        task = asyncio.create_task(pipeline.run(simulated_feed(self.series, delay) if feed is None else feed))
+        while True:
+            update = await pipeline.output_queue.get()
+            if update is None:
+                break
+            updates.append(update)
+        await task
+        return updates
+
+    def test_fan_out_matches_batch(self):
+        calculators = self.make_calculators()
+        pipeline = SpreadPipeline(calculators, coalesce=False)
+        updates = asyncio.run(self.collect(pipeline))
+        self.assertEqual(len(updates), 3 * len(self.series['AAA']))
+
+        for calculator in calculators:
+            expected = DiffCalculatorSP500(calculator.symbol1, calculator.symbol2, resolution=ResolutionLevel.Daily)
+            expected.update_time_series(self.series[calculator.symbol1], self.series[calculator.symbol2])
+            expected.update_diff_and_equation()
+            np.testing.assert_allclose(calculator.df['diff'], expected.df['diff'], rtol=1e-9, atol=1e-8)
+
+    def test_coalescing_with_backpressure(self):
+        pipeline = SpreadPipeline(self.make_calculators(), max_pending=8, coalesce=True)
+        updates = asyncio.run(self.collect(pipeline, delay=None))
+        # 每个配对的最后一个更新一定会输出, 被合并的更新数之和等于总配对数
+        self.assertEqual(sum(update.coalesced + 1 for update in updates), 3 * len(self.series['AAA']))
+        self.assertLess(len(updates), 3 * len(self.series['AAA']))
+
+    def test_calculator_error_fails_the_pipeline(self):
+        calculators = self.make_calculators()
+
+        def fail(time_series_elm1, time_series_elm2):
+            raise RuntimeError("calculator failed")
+
+        calculators[1].update_time_series_element = fail
+        for delay in (None, 0.0):
+            with self.subTest(delay=delay):
+                pipeline = SpreadPipeline(calculators, max_pending=4)
+
+                async def run():
+                    await asyncio.wait_for(pipeline.run(simulated_feed(self.series, delay)), timeout=10)
+
+                with self.assertRaisesRegex(RuntimeError, "calculator failed"):
+                    asyncio.run(run())
+
+    def skewed_feed(self, lag: int):
+        """
+        AAA 领先 BBB lag 个bar到达.
+        """
+        date_times = self.series['AAA'].date_times.astype('datetime64[us]').tolist()
+        leader, follower = self.series['AAA'].values.tolist(), self.series['BBB'].values.tolist()
+
+        async def feed():
+            for i in range(len(date_times) + lag):
+                if i < len(date_times):
+                    yield Bar('AAA', date_times[i], leader[i])
+                if i >= lag:
+                    yield Bar('BBB', date_times[i - lag], follower[i - lag])
+        return feed()
+
+    def test_skewed_arrival(self):
+        calculator = DiffCalculatorSP500('AAA', 'BBB', resolution=ResolutionLevel.Daily)
+        calculator.enable_streaming()
+        pipeline = SpreadPipeline([calculator], coalesce=False, max_lag=10)
+        updates = asyncio.run(self.collect(pipeline, feed=self.skewed_feed(5)))
+        self.assertEqual(len(updates), len(self.series['AAA']))
+        self.assertEqual(pipeline.stale_bars, 0)
+        expected = DiffCalculatorSP500('AAA', 'BBB', resolution=ResolutionLevel.Daily)
+        expected.update_time_series(self.series['AAA'], self.series['BBB'])
+        expected.update_diff_and_equation()
+        np.testing.assert_allclose(calculator.df['diff'], expected.df['diff'], rtol=1e-9, atol=1e-8)
+
+    def test_lag_limit_evicts_stale_bars(self):
+        calculator = DiffCalculatorSP500('AAA', 'BBB', resolution=ResolutionLevel.Daily)
+        calculator.enable_streaming()
+        pipeline = SpreadPipeline([calculator], coalesce=False, max_lag=3)
+        updates = asyncio.run(self.collect(pipeline, feed=self.skewed_feed(5)))
+        # 领先超过 max_lag 的 bar 在另一条腿到达之前被淘汰, 只有 AAA 结束后缓存中的最后3个能配对
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(pipeline.stale_bars, 2 * len(self.series['AAA']) - 2 * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
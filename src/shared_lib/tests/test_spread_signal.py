@@ -0,0 +1,216 @@
+import unittest
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.bll.spread_signal import rolling_zscore, RollingZScore, SpreadSignal
+from src.shared_lib.bll.time_series_loader import load_time_series
+from src.shared_lib.models.enums import ResolutionLevel, SignalType
+
+
+class TestRollingZScore(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.diff = 100.0 + np.cumsum(rng.normal(size=2000))
+        self.diff[[50, 51, 700]] = np.nan
+
+    def test_matches_pandas(self):
+        mean, std, zscore = rolling_zscore(self.diff, 30)
+        series = pd.Series(self.diff)
+        expected_mean = series.rolling(30).mean().to_numpy()
+        expected_std = series.rolling(30).std().to_numpy()
+        np.testing.assert_allclose(mean, expected_mean, rtol=1e-10, equal_nan=True)
+        np.testing.assert_allclose(std, expected_std, rtol=1e-8, equal_nan=True)
+        np.testing.assert_allclose(zscore, (self.diff - expected_mean) / expected_std, rtol=1e-7, atol=1e-9,
+                                   equal_nan=True)
+
+    def test_incremental_matches_batch(self):
+        _, _, expected = rolling_zscore(self.diff, 30)
+        stats = RollingZScore(30)
+        actual = []
+        for value in self.diff:
+            stats.push(value)
+            actual.append(stats.zscore(value))
+        np.testing.assert_allclose(actual, expected, rtol=1e-7, atol=1e-9, equal_nan=True)
+
+    def test_seed_and_replace_last(self):
+        stats = RollingZScore(30)
+        stats.seed(self.diff[:1000])
+        np.testing.assert_allclose(stats.values(), self.diff[970:1000])
+        stats.replace_last(1.5)
+        self.assertAlmostEqual(stats.mean, np.mean(np.append(self.diff[970:999], 1.5)))
+
+    def test_long_spread_with_flat_segments(self):
+        rows, window = 3_000_000, 40
+        rng = np.random.default_rng(17)
+        diff = 200.0 + np.cumsum(rng.normal(scale=0.1, size=rows))
+        diff[rows - 300:rows - 150] = diff[rows - 300]
+        diff[rows - 100:] = 0.1
+        mean, std, zscore = rolling_zscore(diff, window)
+
+        checked = np.arange(rows - 400, rows)
+        windows = np.stack([diff[i - window + 1:i + 1] for i in checked])
+        np.testing.assert_allclose(mean[checked], windows.mean(axis=1), rtol=1e-12)
+        np.testing.assert_allclose(std[checked], windows.std(axis=1, ddof=1), rtol=1e-7, atol=1e-12)
+        self.assertTrue((std[rows - 300 + window - 1:rows - 150] == 0.0).all())
+        self.assertTrue((std[rows - 100 + window - 1:] == 0.0).all())
+
+        # 与增量计算的 z-score 逐行一致, 平坦段都为 NaN
+        stats = RollingZScore(window)
+        stats.seed(diff[:rows - 400])
+        actual = []
+        for value in diff[rows - 400:]:
+            stats.push(value)
+            actual.append(stats.zscore(value))
+        np.testing.assert_allclose(actual, zscore[checked], rtol=1e-6, atol=1e-9, equal_nan=True)
+        np.testing.assert_array_equal(np.isnan(actual), np.isnan(zscore[checked]))
+
+    def test_invalid_window(self):
+        with self.assertRaises(ValueError):
+            RollingZScore(1)
+
+
+class TestSpreadSignal(unittest.TestCase):
+
+    def test_threshold_events(self):
+        signal = SpreadSignal(5, entry=1.5, exit=0.2)
+        diffs = [0.0, 1.0, 0.0, 1.0, 0.0, 1.0, 0.0, 5.0, 2.0, 1.5, 0.8]
+        events = [signal.update(i, diff) for i, diff in enumerate(diffs)]
+        self.assertEqual(events[7].signal_type, SignalType.EnterShort)
+        self.assertEqual(signal.position, 0)
+        self.assertEqual([event.signal_type for event in signal.events], [SignalType.EnterShort, SignalType.Exit])
+
+    def test_run_matches_update(self):
+        rng = np.random.default_rng(3)
+        diffs = np.cumsum(rng.normal(size=3000))
+        received = []
+        batch = SpreadSignal(40, entry=2.0, exit=0.5, stop=3.5, on_event=received.append)
+        batch.run(range(len(diffs)), diffs)
+        # 批量处理的历史事件不触发回调
+        self.assertEqual(received, [])
+
+        incremental = SpreadSignal(40, entry=2.0, exit=0.5, stop=3.5)
+        for i, diff in enumerate(diffs):
+            incremental.update(i, diff)
+        self.assertGreater(len(batch.events), 0)
+        self.assertEqual([(e.date_time, e.signal_type) for e in batch.events],
+                         [(e.date_time, e.signal_type) for e in incremental.events])
+        self.assertEqual(batch.position, incremental.position)
+
+    def test_replace_last_reverts_event(self):
+        signal = SpreadSignal(5, entry=1.5, exit=0.2)
+        for i, diff in enumerate([0.0, 1.0, 0.0, 1.0, 0.0, 1.0, 0.0]):
+            signal.update(i, diff)
+        self.assertIsNotNone(signal.update(7, 5.0))
+        self.assertEqual(signal.position, -1)
+        self.assertIsNone(signal.replace_last(7, 0.5))
+        self.assertEqual(signal.position, 0)
+        self.assertEqual(len(signal.events), 0)
+
+    def test_revise_matches_run(self):
+        rng = np.random.default_rng(11)
+        diffs = np.cumsum(rng.normal(size=1500))
+        date_times = np.datetime64('2024-01-01', 'ns') + np.arange(1500) * np.timedelta64(2, 'm')
+        late_time = date_times[700] - np.timedelta64(1, 'm')
+        cases = {
+            'correct': (date_times, np.where(np.arange(1500) == 700, diffs + 8.0, diffs), 700, 701, 0),
+            'insert': (np.insert(date_times, 700, late_time), np.insert(diffs, 700, diffs[699] - 8.0), 700, 741, 1),
+            'delete': (np.delete(date_times, 700), np.delete(diffs, 700), 700, 740, -1),
+        }
+        for name, (new_times, new_diffs, start, end, shift) in cases.items():
+            with self.subTest(name):
+                received = []
+                signal = SpreadSignal(40, entry=1.5, exit=0.3, stop=3.0, on_event=received.append)
+                for date_time, diff in zip(date_times, diffs):
+                    signal.update(date_time, diff)
+                before = {(event.date_time, event.signal_type) for event in signal.events}
+                received.clear()
+                replayed = signal.revise(new_times, new_diffs, start, end, shift)
+
+                expected = SpreadSignal(40, entry=1.5, exit=0.3, stop=3.0)
+                expected.run(new_times, new_diffs)
+                self.assertLess(replayed, 1000)
+                self.assertEqual([(e.date_time, e.signal_type) for e in signal.events],
+                                 [(e.date_time, e.signal_type) for e in expected.events])
+                np.testing.assert_array_equal(signal.row_states, expected.row_states)
+                self.assertEqual((signal.position, signal.stopped), (expected.position, expected.stopped))
+                self.assertEqual([(e.date_time, e.signal_type) for e in received],
+                                 [(e.date_time, e.signal_type) for e in expected.events
+                                  if (e.date_time, e.signal_type) not in before])
+
+    def test_no_reentry_after_stop(self):
+        signal = SpreadSignal(5, entry=1.0, exit=0.2, stop=1.5)
+        signal.position = -1
+        self.assertEqual(signal._transition(1.6), SignalType.Stop)
+        # 止损之后 |z| 回到 exit 以内之前不再开仓
+        self.assertIsNone(signal._transition(1.2))
+        self.assertIsNone(signal._transition(0.1))
+        self.assertEqual(signal._transition(1.2), SignalType.EnterShort)
+
+    def test_invalid_thresholds(self):
+        with self.assertRaises(ValueError):
+            SpreadSignal(10, entry=1.0, exit=1.0)
+        with self.assertRaises(ValueError):
+            SpreadSignal(10, entry=2.0, exit=0.5, stop=1.5)
+
+
+class TestDiffCalculatorSignal(unittest.TestCase):
+
+    def setUp(self):
+        self.time_series1 = load_time_series(Path(__file__).parent / "data/AAPL.csv", 'Close', dropna=True)
+        self.time_series2 = load_time_series(Path(__file__).parent / "data/ABNB.csv", 'Close', dropna=True)
+
+    @staticmethod
+    def event_keys(signal):
+        return [(pd.Timestamp(event.date_time), event.signal_type) for event in signal.events]
+
+    def test_batch_signal(self):
+        calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        signal = calculator.enable_signal(window=50)
+        calculator.update_time_series(self.time_series1, self.time_series2)
+        calculator.update_diff_and_equation()
+        self.assertGreater(len(signal.events), 0)
+        _, _, zscore = rolling_zscore(calculator.df['diff'].to_numpy(), 50)
+        np.testing.assert_allclose(signal.last_zscore, zscore[-1], rtol=1e-9)
+
+    def test_streaming_signal_matches_batch(self):
+        batch = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        batch.update_time_series(self.time_series1, self.time_series2)
+        batch.update_diff_and_equation()
+        batch_signal = batch.enable_signal(window=50)
+
+        seed = 1000
+        streaming = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        streaming.update_time_series(self.time_series1[:seed], self.time_series2[:seed])
+        streaming.update_diff_and_equation()
+        received = []
+        streaming_signal = streaming.enable_signal(window=50, on_event=received.append)
+        streaming.enable_streaming()
+        for elm1, elm2 in zip(self.time_series1[seed:], self.time_series2[seed:]):
+            streaming.update_time_series_element(elm1, elm2)
+
+        self.assertEqual(self.event_keys(streaming_signal), self.event_keys(batch_signal))
+        self.assertEqual(len(received), sum(pd.Timestamp(event.date_time) >= batch.df.index[seed]
+                                            for event in batch_signal.events))
+        self.assertAlmostEqual(streaming_signal.last_zscore, batch_signal.last_zscore, places=6)
+
+    def test_dataframe_element_signal(self):
+        seed = 1000
+        batch = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        batch.update_time_series(self.time_series1[:seed + 200], self.time_series2[:seed + 200])
+        batch.update_diff_and_equation()
+        batch_signal = batch.enable_signal(window=50)
+
+        calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        calculator.update_time_series(self.time_series1[:seed], self.time_series2[:seed])
+        calculator.update_diff_and_equation()
+        signal = calculator.enable_signal(window=50)
+        for elm1, elm2 in zip(self.time_series1[seed:seed + 200], self.time_series2[seed:seed + 200]):
+            calculator.update_time_series_element(elm1, elm2)
+        self.assertEqual(self.event_keys(signal), self.event_keys(batch_signal))
+        self.assertAlmostEqual(signal.last_zscore, batch_signal.last_zscore, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
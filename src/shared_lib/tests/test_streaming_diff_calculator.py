@@ -0,0 +1,50 @@
+import unittest
+from pathlib import Path
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.bll.time_series_loader import load_time_series
+from src.shared_lib.models.enums import ResolutionLevel
+from src.shared_lib.models.time_series import *
+
+
+class TestStreamingDiffCalculator(unittest.TestCase):
+
+    def load_time_series(self, full_path_filename):
+        return load_time_series(full_path_filename, 'Close', dropna=True)
+
+    def setUp(self):
+        self.time_series1 = self.load_time_series(Path(__file__).parent / "data/AAPL.csv")
+        self.time_series2 = self.load_time_series(Path(__file__).parent / "data/ABNB.csv")
+
+    def test_streaming_matches_batch(self):
+        batch = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        batch.update_time_series(self.time_series1, self.time_series2)
+        batch.update_diff_and_equation()
+
+        # 用前1000个bar初始化, 剩余的bar逐个流式更新
+        seed = 1000
+        streaming = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        streaming.update_time_series(self.time_series1[:seed], self.time_series2[:seed])
+        streaming.enable_streaming()
+        for elm1, elm2 in zip(self.time_series1[seed:], self.time_series2[seed:]):
+            streaming.update_time_series_element(elm1, elm2)
+
+        self.assertEqual(len(streaming.df), len(batch.df))
+        self.assertTrue((streaming.df.index == batch.df.index).all())
+        np.testing.assert_allclose(streaming.df['diff'].iloc[seed:], batch.df['diff'].iloc[seed:], rtol=1e-9, atol=1e-8)
+        np.testing.assert_allclose(streaming.df['slope'].iloc[seed:], batch.df['slope'].iloc[seed:], rtol=1e-9)
+
+        streaming.disable_streaming()
+        self.assertFalse(streaming.streaming)
+        self.assertEqual(len(streaming.df), len(batch.df))
+
+    def test_streaming_rejects_late_element_outside_history(self):
+        calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+        calculator.update_time_series(self.time_series1, self.time_series2)
+        calculator.enable_streaming(max_history=500)
+        with self.assertRaises(ValueError):
+            calculator.update_time_series_element(self.time_series1[0], self.time_series2[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500, DiffCalculatorCrypto
+from src.shared_lib.bll.regression import TimeWindow
+from src.shared_lib.models.enums import ResolutionLevel
+from src.shared_lib.models.time_series import *
+
+
+class TestTickDiffCalculator(unittest.TestCase):
+
+    def setUp(self):
+        # 约400天的不规则 tick, 间隔服从指数分布
+        rng = np.random.default_rng(17)
+        rows = 3000
+        gaps = rng.exponential(scale=400 * 86400 / rows, size=rows).astype(np.int64)
+        self.date_times = np.datetime64('2023-01-01', 'ns') + np.cumsum(gaps).astype('timedelta64[s]')
+        self.series_b = 30.0 + np.cumsum(rng.normal(scale=0.2, size=rows))
+        self.series_a = 0.8 * self.series_b + 2.0 + rng.normal(scale=0.1, size=rows)
+
+    def expected(self, duration):
+        """
+        逐行暴力计算: 对每个 tick 用 [t - duration, t) 内位于它之前的 tick 做回归.
+        """
+        slope = np.full(len(self.date_times), np.nan)
+        intercept = np.full(len(self.date_times), np.nan)
+        for i, date_time in enumerate(self.date_times):
+            start = date_time - duration
+            if self.date_times[0] > start:
+                continue
+            in_window = (self.date_times[:i] >= start)
+            x, y = self.series_b[:i][in_window], self.series_a[:i][in_window]
+            if len(x) >= 2:
+                slope[i], intercept[i] = np.polyfit(x, y, 1)
+        return slope, intercept
+
+    def make_calculator(self, rows=None, calculator_class=DiffCalculatorCrypto):
+        calculator = calculator_class("A", "B", ResolutionLevel.Tick)
+        rows = len(self.date_times) if rows is None else rows
+        calculator.update_time_series((self.date_times[:rows], self.series_a[:rows]),
+                                      (self.date_times[:rows], self.series_b[:rows]))
+        return calculator
+
+    def test_window_duration(self):
+        self.assertEqual(DiffCalculatorSP500("A", "B", ResolutionLevel.Tick).WindowDuration, np.timedelta64(182, 'D'))
+        calculator = DiffCalculatorCrypto("A", "B", ResolutionLevel.Tick)
+        self.assertEqual(calculator.WindowDuration, np.timedelta64(183, 'D'))
+        self.assertEqual(calculator.FixedWindowLength, 0)
+        with self.assertRaises(ValueError):
+            calculator.calculate_window_length(ResolutionLevel.Tick)
+        with self.assertRaises(ValueError):
+            calculator.calculate_window_duration(ResolutionLevel.Daily)
+
+    def test_batch_matches_brute_force(self):
+        calculator = self.make_calculator()
+        calculator.update_diff_and_equation()
+        slope, intercept = self.expected(calculator.WindowDuration)
+        self.assertTrue(np.isfinite(slope).sum() > 1000)
+        np.testing.assert_allclose(calculator.df['slope'].to_numpy(), slope, rtol=1e-8)
+        np.testing.assert_allclose(calculator.df['intercept'].to_numpy(), intercept, rtol=1e-8, atol=1e-8)
+
+    def test_element_updates_match_batch(self):
+        batch = self.make_calculator()
+        batch.update_diff_and_equation()
+
+        seed = 2000
+        for streaming in (False, True):
+            calculator = self.make_calculator(seed)
+            calculator.update_diff_and_equation()
+            if streaming:
+                calculator.enable_streaming()
+            rows = len(self.date_times) if streaming else seed + 30
+            for i in range(seed, rows):
+                calculator.update_time_series_element(TimeSeriesElement(self.date_times[i], self.series_a[i]),
+                                                      TimeSeriesElement(self.date_times[i], self.series_b[i]))
+            np.testing.assert_allclose(calculator.df['diff'].to_numpy(), batch.df['diff'].to_numpy()[:rows],
+                                       rtol=1e-9, atol=1e-8)
+
+    def test_streaming_memory_is_bounded(self):
+        calculator = self.make_calculator(1000)
+        calculator.enable_streaming(max_history=200)
+        self.assertEqual(len(calculator.df), 200)
+        for i in range(1000, len(self.date_times)):
+            calculator.update_time_series_element(TimeSeriesElement(self.date_times[i], self.series_a[i]),
+                                                  TimeSeriesElement(self.date_times[i], self.series_b[i]))
+        self.assertLessEqual(len(calculator.df), 400)
+        self.assertEqual(calculator.df.index[-1], self.date_times[-1])
+
+        batch = self.make_calculator()
+        batch.update_diff_and_equation()
+        tail = len(calculator.df)
+        np.testing.assert_allclose(calculator.df['diff'].to_numpy(), batch.df['diff'].to_numpy()[-tail:],
+                                   rtol=1e-9, atol=1e-8)
+
+    def test_streaming_history_is_bounded_by_default(self):
+        calculator = self.make_calculator(500)
+        calculator.enable_streaming()
+        self.assertIsNotNone(calculator.max_history)
+        self.assertEqual(calculator.max_history, calculator.default_tick_history())
+
+        # 窗口很短时, 流式处理超过 max_history 个 tick 后保留的行数不再增长
+        calculator = self.make_calculator(500)
+        calculator.WindowDuration = np.timedelta64(2, 'D')
+        calculator.enable_streaming()
+        max_history = calculator.max_history
+        self.assertLess(max_history, len(self.date_times) - 500)
+        for i in range(500, len(self.date_times)):
+            calculator.update_time_series_element(TimeSeriesElement(self.date_times[i], self.series_a[i]),
+                                                  TimeSeriesElement(self.date_times[i], self.series_b[i]))
+        self.assertLessEqual(len(calculator.df), 2 * max_history)
+        self.assertTrue(calculator._stream.truncated)
+        self.assertLessEqual(len(calculator._stream.date_time), max(16, 2 * max_history))
+        self.assertEqual(calculator.df.index[-1], self.date_times[-1])
+
+    def test_time_window_capacity(self):
+        # 窗口内最多约 duration / 间隔 个数据点, 缓冲区不会随历史长度增长
+        window = TimeWindow(np.timedelta64(100, 's'), capacity=16)
+        for second in range(100000):
+            window.evict(second * 10 ** 9)
+            window.push(second * 10 ** 9, float(second % 7), float(second % 5))
+        self.assertEqual(len(window), 101)
+        self.assertEqual(window.capacity, 128)
+        _, series_a, series_b = window.values()
+        slope, intercept = window.fit()
+        expected_slope, expected_intercept = np.polyfit(series_b, series_a, 1)
+        self.assertAlmostEqual(slope, expected_slope, places=9)
+        self.assertAlmostEqual(intercept, expected_intercept, places=9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.shared_lib.models.time_series import *
+
+
+class TestTimeSeries(unittest.TestCase):
+
+    def setUp(self):
+        self.date_times = np.arange('2024-01-01T00', '2024-01-01T10', dtype='datetime64[h]').astype('datetime64[ns]')
+        self.values = np.arange(10, dtype=np.float64)
+
+    def test_from_numpy_is_zero_copy(self):
+        time_series = TimeSeries.from_numpy(self.date_times, self.values)
+        date_times, values = time_series.to_numpy()
+        self.assertTrue(np.shares_memory(values, self.values))
+        self.assertTrue(np.shares_memory(date_times, self.date_times))
+
+    def test_slice_returns_view(self):
+        time_series = TimeSeries.from_numpy(self.date_times, self.values)
+        view = time_series[2:5]
+        self.assertIsInstance(view, TimeSeries)
+        self.assertEqual(len(view), 3)
+        self.assertTrue(np.shares_memory(view.values, self.values))
+
+    def test_element_api(self):
+        time_series = TimeSeries()
+        time_series.append(TimeSeriesElement(datetime(2024, 1, 1, 9, 30), 1.5))
+        time_series.append(TimeSeriesElement(datetime(2024, 1, 1, 10, 30), 2.5))
+        self.assertEqual(len(time_series), 2)
+        self.assertEqual(time_series[1], TimeSeriesElement(datetime(2024, 1, 1, 10, 30), 2.5))
+        self.assertEqual([elm.value for elm in time_series.series], [1.5, 2.5])
+        with self.assertRaises(AttributeError):
+            time_series[0].extra = 1
+
+    def test_series_writes_through(self):
+        time_series = TimeSeries()
+        time_series.series.append(TimeSeriesElement(datetime(2024, 1, 1, 9, 30), 1.5))
+        time_series.series.append(TimeSeriesElement(datetime(2024, 1, 1, 11, 30), 3.5))
+        time_series.series.insert(1, TimeSeriesElement(datetime(2024, 1, 1, 10, 30), 2.5))
+        self.assertEqual(time_series.values.tolist(), [1.5, 2.5, 3.5])
+        time_series.series[0] = TimeSeriesElement(datetime(2024, 1, 1, 9, 30), 0.5)
+        del time_series.series[2]
+        self.assertEqual(time_series.series, [TimeSeriesElement(datetime(2024, 1, 1, 9, 30), 0.5),
+                                              TimeSeriesElement(datetime(2024, 1, 1, 10, 30), 2.5)])
+        time_series.series = [TimeSeriesElement(datetime(2024, 1, 2), 7.0)]
+        self.assertEqual(len(time_series), 1)
+
+    def test_date_times_are_nanoseconds(self):
+        days = np.arange('2024-01-01', '2024-01-04', dtype='datetime64[D]')
+        time_series = TimeSeries.from_numpy(days, np.arange(3, dtype=np.float64))
+        self.assertEqual(time_series.date_times.dtype, np.dtype('datetime64[ns]'))
+        time_series.append_value(np.datetime64('2024-01-04T09:30:00.000000001'), 3.0)
+        self.assertEqual(time_series.date_times[-1], np.datetime64('2024-01-04T09:30:00.000000001', 'ns'))
+
+    def test_elements_keep_nanoseconds(self):
+        date_times = np.datetime64('2024-01-01T09:30', 'ns') + np.array([0, 1, 1500], dtype='timedelta64[ns]')
+        time_series = TimeSeries.from_numpy(date_times, np.arange(3, dtype=np.float64))
+        self.assertEqual(pd.Timestamp(time_series[1].date_time).value, pd.Timestamp(date_times[1]).value)
+        self.assertEqual([pd.Timestamp(elm.date_time) for elm in time_series], list(pd.DatetimeIndex(date_times)))
+        # 逐元素重建后不丢失纳秒
+        self.assertEqual(TimeSeries.from_elements(time_series), time_series)
+        # 精确到微秒的时间仍然返回 datetime
+        self.assertEqual(type(TimeSeries.from_numpy(self.date_times, self.values)[0].date_time), datetime)
+
+    def test_from_dataframe_round_trip(self):
+        df = pd.DataFrame({'DateTime': self.date_times, 'Close': self.values})
+        time_series = TimeSeries.from_dataframe(df, date_column='DateTime')
+        self.assertEqual(time_series, TimeSeries.from_dataframe(time_series.to_frame('Close')))
+
+
+if __name__ == '__main__':
+    unittest.main()
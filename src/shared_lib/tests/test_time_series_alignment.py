@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.models.enums import ResolutionLevel, AlignmentMode
+from src.shared_lib.models.time_series import *
+
+
+class TestTimeSeriesAlignment(unittest.TestCase):
+
+    def setUp(self):
+        self.date_times = np.arange('2024-01-02T09', '2024-01-02T15', dtype='datetime64[h]').astype('datetime64[ns]')
+        self.values = np.arange(len(self.date_times), dtype=np.float64) + 100.0
+        self.calculator = DiffCalculatorSP500("AAPL", "ABNB", resolution=ResolutionLevel.Hourly)
+
+    def test_strict_rejects_different_lengths(self):
+        with self.assertRaises(ValueError):
+            self.calculator.update_time_series((self.date_times, self.values),
+                                               (self.date_times[1:], self.values[1:]))
+
+    def test_strict_accepts_arrays_and_dataframes(self):
+        df = pd.DataFrame({'DateTime': self.date_times, 'Close': self.values * 2})
+        self.calculator.update_time_series((self.date_times, self.values), df)
+        self.assertEqual(len(self.calculator.df), len(self.date_times))
+        np.testing.assert_allclose(self.calculator.df['ABNB'], self.values * 2)
+        # 导入后的数据不与输入共享内存
+        self.assertFalse(np.shares_memory(self.calculator.df['AAPL'].to_numpy(), self.values))
+
+    def test_inner_join(self):
+        missing = np.delete(np.arange(len(self.date_times)), [1, 3])
+        self.calculator.update_time_series((self.date_times, self.values),
+                                           (self.date_times[missing], self.values[missing]),
+                                           alignment=AlignmentMode.Inner)
+        self.assertEqual(list(self.calculator.df.index), list(pd.DatetimeIndex(self.date_times[missing])))
+
+    def test_asof_with_tolerance(self):
+        shifted = self.date_times[::2] - np.timedelta64(10, 'm')
+        self.calculator.update_time_series((self.date_times, self.values),
+                                           (shifted, self.values[::2]),
+                                           alignment='asof', tolerance='15min')
+        # 只有与第二个序列相差10分钟的时间戳被保留
+        self.assertEqual(len(self.calculator.df), len(shifted))
+        np.testing.assert_allclose(self.calculator.df['ABNB'], self.values[::2])
+
+
+if __name__ == '__main__':
+    unittest.main()
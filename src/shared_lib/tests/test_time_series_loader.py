@@ -0,0 +1,120 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+import numpy as np
+import pandas as pd
+from src.shared_lib.bll import time_series_loader
+from src.shared_lib.bll.time_series_loader import read_csv, iter_csv, save_npy, load_npy, save_parquet, \
+    load_parquet, load_columns, load_time_series, load_frame, convert_csv
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+class TestTimeSeriesLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.expected = pd.read_csv(DATA_DIR / "ABNB.csv", parse_dates=['DateTime'])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_read_csv_projection(self):
+        arrays = read_csv(DATA_DIR / "ABNB.csv", ['Close', 'Volume'])
+        self.assertEqual(list(arrays), ['DateTime', 'Close', 'Volume'])
+        self.assertEqual(arrays['DateTime'].dtype, np.dtype('datetime64[ns]'))
+        np.testing.assert_array_equal(arrays['DateTime'], self.expected['DateTime'].to_numpy())
+        np.testing.assert_array_equal(arrays['Close'], self.expected['Close'].to_numpy())
+
+    def test_chunked_read_matches_full_read(self):
+        full = read_csv(DATA_DIR / "AAPL.csv", ['Close'])
+        chunks = list(iter_csv(DATA_DIR / "AAPL.csv", ['Close'], chunksize=500))
+        self.assertEqual(len(chunks), 6)
+        np.testing.assert_array_equal(np.concatenate([chunk['Close'] for chunk in chunks]), full['Close'])
+        np.testing.assert_array_equal(np.concatenate([chunk['DateTime'] for chunk in chunks]), full['DateTime'])
+
+    def test_binary_round_trips(self):
+        arrays = read_csv(DATA_DIR / "NRG.csv", ['Open', 'Close'])
+        directory = os.path.join(self.tmp_dir.name, "NRG")
+        save_npy(directory, arrays)
+        loaded = load_npy(directory)
+        self.assertIsInstance(loaded['Close'], np.memmap)
+        for name in arrays:
+            np.testing.assert_array_equal(loaded[name], arrays[name])
+
+        time_series = load_time_series(directory)
+        # 不复制内存映射的数据
+        self.assertFalse(time_series.values.flags.owndata)
+        np.testing.assert_array_equal(time_series.values, arrays['Close'])
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), "pyarrow is not installed")
+    def test_parquet_round_trip(self):
+        arrays = read_csv(DATA_DIR / "VST.csv", ['Open', 'Close'])
+        path = os.path.join(self.tmp_dir.name, "VST.parquet")
+        save_parquet(path, arrays)
+        loaded = load_parquet(path, ['DateTime', 'Close'])
+        np.testing.assert_array_equal(loaded['DateTime'], arrays['DateTime'])
+        np.testing.assert_array_equal(loaded['Close'], arrays['Close'])
+        self.assertEqual(list(load_frame(path).columns), ['Open', 'Close'])
+
+    def test_csv_cache(self):
+        source = os.path.join(self.tmp_dir.name, "ABNB.csv")
+        shutil.copy(DATA_DIR / "ABNB.csv", source)
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+
+        first = load_columns(source, ['Close'], cache_dir=cache_dir)
+        with mock.patch.object(time_series_loader, 'iter_csv', side_effect=AssertionError("re-parsed")):
+            cached = load_columns(source, ['Close', 'Volume'], cache_dir=cache_dir)
+        np.testing.assert_array_equal(cached['Close'], first['Close'])
+        np.testing.assert_array_equal(cached['Volume'], self.expected['Volume'].to_numpy())
+
+        # 源文件变化后重新转换
+        with open(source, 'a', encoding='utf-8') as f:
+            f.write("2024/8/1 9:30,1,1,1,1,1,1\n")
+        updated = load_columns(source, ['Close'], cache_dir=cache_dir)
+        self.assertEqual(len(updated['Close']), len(first['Close']) + 1)
+
+    def test_chunked_conversion(self):
+        directory = os.path.join(self.tmp_dir.name, "AAPL")
+        full = read_csv(DATA_DIR / "AAPL.csv", ['Open', 'Close'])
+        # 每块直接追加写入, 不在内存中拼接整个文件
+        append = time_series_loader.NpyColumnWriter.append
+        with mock.patch.object(time_series_loader.NpyColumnWriter, 'append', autospec=True,
+                               side_effect=append) as spy:
+            converted = convert_csv(DATA_DIR / "AAPL.csv", directory, ['Open', 'Close'], chunksize=500)
+        self.assertEqual(spy.call_count, 6)
+        for name in full:
+            np.testing.assert_array_equal(converted[name], full[name])
+
+    def test_csv_cache_is_keyed_by_path(self):
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        sources = []
+        for folder, close in (("a", 1.5), ("b", 2.5)):
+            os.makedirs(os.path.join(self.tmp_dir.name, folder))
+            sources.append(os.path.join(self.tmp_dir.name, folder, "AAPL.csv"))
+            with open(sources[-1], 'w', encoding='utf-8') as f:
+                f.write(f"DateTime,Close\n2024-01-02 09:30,{close}\n")
+        # 同名文件的大小和修改时间相同时也不能共用缓存
+        stat = os.stat(sources[0])
+        os.utime(sources[1], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        self.assertEqual(load_columns(sources[0], ['Close'], cache_dir=cache_dir)['Close'][0], 1.5)
+        self.assertEqual(load_columns(sources[1], ['Close'], cache_dir=cache_dir)['Close'][0], 2.5)
+        self.assertEqual(load_columns(sources[0], ['Close'], cache_dir=cache_dir)['Close'][0], 1.5)
+
+    def test_frame_and_time_series(self):
+        df = load_frame(DATA_DIR / "ALGOUSDT.csv")
+        self.assertEqual(list(df.columns), ['Open', 'High', 'Low', 'Close', 'Volume'])
+        self.assertEqual(df.index.name, 'DateTime')
+
+        time_series = load_time_series(DATA_DIR / "ABNB.csv", dropna=True)
+        self.assertEqual(len(time_series), self.expected['Close'].notna().sum())
+        self.assertTrue(np.isfinite(time_series.values).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500
+from src.shared_lib.bll.regression import batch_ols_fit, RELATIVE_TOLERANCE, ABSOLUTE_TOLERANCE
+from src.shared_lib.bll.universe_spread_engine import UniverseSpreadEngine
+from src.shared_lib.models.enums import ResolutionLevel
+
+
+class TestUniverseSpreadEngine(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        date_times = np.arange('2024-01-01', '2024-11-01', dtype='datetime64[D]').astype('datetime64[ns]')
+        prices = 100.0 + np.cumsum(rng.normal(size=(len(date_times), 4)), axis=0)
+        self.prices = pd.DataFrame(prices, index=date_times, columns=['AAA', 'BBB', 'CCC', 'DDD'])
+
+    def test_matches_diff_calculator(self):
+        calculator = DiffCalculatorSP500('CCC', 'AAA', resolution=ResolutionLevel.Daily)
+        calculator.update_time_series(self.prices['CCC'], self.prices['AAA'])
+        calculator.update_diff_and_equation()
+
+        engine = UniverseSpreadEngine(self.prices, calculator.FixedWindowLength)
+        result = engine.compute([('AAA', 'BBB'), ('CCC', 'AAA')])
+        self.assertEqual(result.shape, (3, 2, len(self.prices)))
+        for i, field in enumerate(UniverseSpreadEngine.FIELDS):
+            np.testing.assert_allclose(result[i, 1], calculator.df[field].to_numpy(), rtol=1e-9, atol=1e-8)
+
+    def test_all_pairs_and_long_frame(self):
+        window = 20
+        engine = UniverseSpreadEngine(self.prices, window)
+        pairs = engine.all_pairs()
+        self.assertEqual(len(pairs), 6)
+        result = engine.compute(chunk_size=4, dtype=np.float32)
+        self.assertEqual(result.dtype, np.float32)
+        df = engine.to_long_frame(pairs, result)
+        self.assertEqual(len(df), len(pairs) * (len(self.prices) - window))
+
+    def test_window_with_missing_value_is_nan(self):
+        prices = self.prices.copy()
+        prices.iloc[50, 1] = np.nan
+        engine = UniverseSpreadEngine(prices, 20)
+        slope = engine.compute([('AAA', 'BBB'), ('AAA', 'CCC')])[0]
+        self.assertTrue(np.isnan(slope[0, 51:71]).all())
+        self.assertFalse(np.isnan(slope[0, 71:]).any())
+        self.assertFalse(np.isnan(slope[1, 20:]).any())
+
+    def test_long_history_precision(self):
+        rows, window = 2_000_000, 126
+        rng = np.random.default_rng(9)
+        series_b = 100.0 + np.cumsum(rng.normal(scale=0.1, size=rows))
+        series_a = 1.5 * series_b + 3.0 + np.cumsum(rng.normal(scale=0.05, size=rows))
+        engine = UniverseSpreadEngine(np.column_stack([series_a, series_b]), window, symbols=['A', 'B'])
+        result = engine.compute([('A', 'B')])
+        checked = np.r_[np.linspace(window, rows - 1, 40).astype(int), rows - 1]
+        slope, intercept = batch_ols_fit(np.stack([series_a[i - window:i] for i in checked]),
+                                         np.stack([series_b[i - window:i] for i in checked]))
+        np.testing.assert_allclose(result[0, 0, checked], slope, rtol=RELATIVE_TOLERANCE)
+        np.testing.assert_allclose(result[1, 0, checked], intercept, rtol=0, atol=ABSOLUTE_TOLERANCE)
+
+
+if __name__ == '__main__':
+    unittest.main()
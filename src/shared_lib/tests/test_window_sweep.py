@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+from src.shared_lib.bll.diff_calculator import DiffCalculatorSP500, DiffCalculatorCrypto
+from src.shared_lib.bll.regression import rolling_ols_sweep, batch_ols_fit, RELATIVE_TOLERANCE, ABSOLUTE_TOLERANCE
+from src.shared_lib.models.enums import ResolutionLevel
+
+
+class TestWindowSweep(unittest.TestCase):
+
+    def setUp(self):
+        rows = 600
+        rng = np.random.default_rng(11)
+        self.date_times = np.datetime64('2022-01-01', 'ns') + np.arange(rows) * np.timedelta64(1, 'D')
+        self.series_b = 80.0 + np.cumsum(rng.normal(size=rows))
+        self.series_a = 1.7 * self.series_b + 3.0 + np.cumsum(rng.normal(scale=0.2, size=rows))
+        self.windows = [20, 63, 126, 183, 252]
+
+    def make_calculator(self, calculator_class=DiffCalculatorSP500):
+        calculator = calculator_class("A", "B", ResolutionLevel.Daily)
+        calculator.update_time_series((self.date_times, self.series_a), (self.date_times, self.series_b))
+        return calculator
+
+    def test_matches_single_window_runs(self):
+        calculator = self.make_calculator()
+        result = calculator.sweep_windows(self.windows)
+        self.assertEqual(result.shape, (3, len(self.windows), len(self.date_times)))
+        self.assertNotIn('diff', calculator.df.columns)
+
+        for k, window in enumerate(self.windows):
+            single = self.make_calculator()
+            single.FixedWindowLength = window
+            single.update_diff_and_equation()
+            for f, field in enumerate(DiffCalculatorSP500.FIELDS):
+                np.testing.assert_allclose(result[f, k], single.df[field].to_numpy(), rtol=1e-9, atol=1e-8)
+
+    def test_frame_and_parallel(self):
+        calculator = self.make_calculator(DiffCalculatorCrypto)
+        frame = calculator.sweep_windows(self.windows, as_frame=True)
+        self.assertEqual(frame.columns.names, ['window', 'field'])
+        self.assertEqual(frame.shape, (len(self.date_times), 3 * len(self.windows)))
+        self.assertTrue((frame.index == calculator.df.index).all())
+
+        parallel = calculator.sweep_windows(self.windows, n_jobs=-1)
+        for k, window in enumerate(self.windows):
+            np.testing.assert_array_equal(frame[(window, 'diff')].to_numpy(), parallel[2, k])
+            self.assertTrue(np.isnan(parallel[0, k, :window]).all())
+
+    def test_long_series_precision(self):
+        rows = 2_000_000
+        rng = np.random.default_rng(13)
+        series_b = 100.0 + np.cumsum(rng.normal(scale=0.1, size=rows))
+        series_a = 1.5 * series_b + 3.0 + np.cumsum(rng.normal(scale=0.05, size=rows))
+        windows = [20, 126, 4000, 49140]
+        slope, intercept = rolling_ols_sweep(series_a, series_b, windows)
+        for k, window in enumerate(windows):
+            checked = np.r_[np.linspace(window, rows - 1, 20).astype(int), rows - 1]
+            expected_slope, expected_intercept = batch_ols_fit(
+                np.stack([series_a[i - window:i] for i in checked]), np.stack([series_b[i - window:i] for i in checked]))
+            np.testing.assert_allclose(slope[k, checked], expected_slope, rtol=RELATIVE_TOLERANCE)
+            np.testing.assert_allclose(intercept[k, checked], expected_intercept, rtol=0, atol=ABSOLUTE_TOLERANCE)
+
+    def test_invalid_windows(self):
+        with self.assertRaises(ValueError):
+            rolling_ols_sweep(self.series_a, self.series_b, [])
+        with self.assertRaises(ValueError):
+            rolling_ols_sweep(self.series_a, self.series_b, [10, 1])
+        slope, _ = rolling_ols_sweep(self.series_a, self.series_b, [1000])
+        self.assertTrue(np.isnan(slope).all())
+
+
+if __name__ == '__main__':
+    unittest.main()